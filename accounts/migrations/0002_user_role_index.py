@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='role',
+            field=models.CharField(choices=[('PATIENT', 'Patient'), ('TECHNICIAN', 'Technician'), ('NEUROLOGIST', 'Neurologist')], db_index=True, default='PATIENT', max_length=20),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.10 on 2026-10-18 19:42
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_unread_counts(apps, schema_editor):
+    """Seed each user's counter from their existing unread notifications"""
+    User = apps.get_model('accounts', 'User')
+
+    users = User.objects.annotate(
+        unread=Count('notifications', filter=Q(notifications__is_read=False))
+    ).filter(unread__gt=0).only('id')
+    for user in users.iterator():
+        User.objects.filter(pk=user.pk).update(unread_notification_count=user.unread)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_role_index'),
+        ('consultations', '0003_list_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='unread_notification_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_unread_counts, migrations.RunPython.noop),
+    ]
@@ -12,9 +12,12 @@ class User(AbstractUser):
     role = models.CharField(
         max_length=20,
         choices=Role.choices,
-        default=Role.PATIENT
+        default=Role.PATIENT,
+        db_index=True
     )
     phone_number = models.CharField(max_length=15, blank=True)
+    # Maintained incrementally by consultations.utils as notifications are created and read
+    unread_notification_count = models.PositiveIntegerField(default=0, editable=False)
     
     # Add related_name to avoid clash with auth.User model
     groups = models.ManyToManyField(
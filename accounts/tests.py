@@ -1,3 +1,12 @@
 from django.test import TestCase
 
-# Create your tests here.
+from stroke_unit.testing import QueryBudgetMixin
+
+
+class AccountsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    urlconf = 'accounts.urls'
+    budgets = {
+        'register': 2,
+        'profile': 3,
+        'login': 2,
+    }
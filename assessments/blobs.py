@@ -0,0 +1,168 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+
+from stroke_unit.storage import BLOB_PREFIX, media_storage
+
+
+# model label: file fields kept in the content-addressed media store
+TRACKED_FILES = {
+    'assessments.ImagingStudy': ['image_file', 'preview', 'thumbnail'],
+    'assessments.LabResult': ['document'],
+}
+
+# Unreferenced blobs are kept this long, so an upload whose row is not
+# saved yet is never collected from under it
+COLLECT_GRACE = timedelta(hours=1)
+
+
+def _is_blob(name):
+    return bool(name) and name.startswith(f'{BLOB_PREFIX}/')
+
+
+def _blob_names(instance, fields):
+    # Read straight from __dict__ so deferred fields are never loaded here
+    values = instance.__dict__
+    if any(field not in values for field in fields):
+        return None
+    names = Counter()
+    for field in fields:
+        # A FieldFile once accessed, the stored string straight from the database
+        name = getattr(values[field], 'name', values[field])
+        if _is_blob(name):
+            names[name] += 1
+    return names
+
+
+def adjust_references(deltas):
+    """
+    Apply {blob name: delta} changes to reference counts
+
+    Blobs referenced for the first time get a row. Blobs sharing a delta are
+    updated together, so a save costs at most a couple of queries.
+    """
+    from .models import MediaBlob
+
+    new = [name for name, delta in deltas.items() if delta > 0]
+    if new:
+        MediaBlob.objects.bulk_create(
+            [MediaBlob(name=name, size=_size(name)) for name in new], ignore_conflicts=True,
+        )
+
+    by_delta = defaultdict(list)
+    for name, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(name)
+    now = timezone.now()
+    for delta, names in by_delta.items():
+        MediaBlob.objects.filter(name__in=names).update(references=F('references') + delta, updated_at=now)
+
+
+def _size(name):
+    try:
+        return media_storage.size(name)
+    except OSError:
+        return 0
+
+
+def record_saved(sender, instance, created, **kwargs):
+    after = _blob_names(instance, TRACKED_FILES[sender._meta.label])
+    if after is None:
+        # Saved with a file field deferred; --recount picks up any change
+        return
+    before = Counter() if created else getattr(instance, '_blob_snapshot', None)
+    if before is not None and before != after:
+        deltas = Counter(after)
+        deltas.subtract(before)
+        adjust_references(deltas)
+    instance._blob_snapshot = after
+
+
+def record_deleted(sender, instance, **kwargs):
+    names = _blob_names(instance, TRACKED_FILES[sender._meta.label]) or getattr(instance, '_blob_snapshot', None)
+    if names:
+        adjust_references({name: -count for name, count in names.items()})
+
+
+def remember_loaded_blobs(sender, instance, **kwargs):
+    instance._blob_snapshot = _blob_names(instance, TRACKED_FILES[sender._meta.label])
+
+
+def connect_blob_references():
+    for label in TRACKED_FILES:
+        uid = f'media_blobs_{label}'
+        post_init.connect(remember_loaded_blobs, sender=label, dispatch_uid=f'{uid}_init')
+        post_save.connect(record_saved, sender=label, dispatch_uid=f'{uid}_save')
+        post_delete.connect(record_deleted, sender=label, dispatch_uid=f'{uid}_delete')
+
+
+def _referencing_queries():
+    from django.apps import apps
+
+    for label, fields in TRACKED_FILES.items():
+        model = apps.get_model(label)
+        for field in fields:
+            yield model, field
+
+
+def recount_references():
+    """Rebuild every blob's reference count from the tables and the files on disk; returns the counts"""
+    from .models import MediaBlob
+
+    counts = Counter()
+    for model, field in _referencing_queries():
+        rows = (
+            model.objects.filter(**{f'{field}__startswith': f'{BLOB_PREFIX}/'})
+            .order_by().values_list(field).annotate(n=Count('pk'))
+        )
+        counts.update(dict(rows))
+
+    # Blobs stored by uploads whose rows were never saved
+    on_disk = set()
+    if media_storage.exists(BLOB_PREFIX):
+        for outer in media_storage.listdir(BLOB_PREFIX)[0]:
+            if outer == 'tmp':
+                continue
+            for inner in media_storage.listdir(f'{BLOB_PREFIX}/{outer}')[0]:
+                directory = f'{BLOB_PREFIX}/{outer}/{inner}'
+                on_disk.update(f'{directory}/{name}' for name in media_storage.listdir(directory)[1])
+
+    known = set(MediaBlob.objects.values_list('name', flat=True))
+    MediaBlob.objects.bulk_create(
+        [MediaBlob(name=name, size=_size(name)) for name in (on_disk | set(counts)) - known],
+        ignore_conflicts=True,
+    )
+    for blob in MediaBlob.objects.only('id', 'name', 'references'):
+        if blob.references != counts[blob.name]:
+            MediaBlob.objects.filter(pk=blob.pk).update(references=counts[blob.name], updated_at=timezone.now())
+    return counts
+
+
+def collect_unreferenced_blobs(grace=COLLECT_GRACE, dry_run=False):
+    """
+    Delete blobs no row has referenced for ``grace``
+
+    Each candidate is checked against the tables before its file is removed,
+    so a count that drifted can only keep a blob too long, never lose one.
+    Returns the (name, size) pairs deleted, or that would be with dry_run.
+    """
+    from .models import MediaBlob
+
+    candidates = dict(
+        MediaBlob.objects.filter(references__lte=0, updated_at__lt=timezone.now() - grace)
+        .values_list('name', 'size')
+    )
+    for model, field in _referencing_queries():
+        if not candidates:
+            break
+        for name in model.objects.filter(**{f'{field}__in': list(candidates)}).values_list(field, flat=True):
+            candidates.pop(name, None)
+
+    if not dry_run:
+        for name in candidates:
+            media_storage.delete(name)
+        MediaBlob.objects.filter(name__in=list(candidates)).delete()
+    return sorted(candidates.items())
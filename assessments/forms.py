@@ -11,6 +11,21 @@ class VitalSignsForm(forms.ModelForm):
             'oxygen_saturation', 'blood_glucose'
         ]
 
+class VitalSignsReadingForm(VitalSignsForm):
+    """One monitor reading from a bulk ingestion batch"""
+    patient_id = forms.IntegerField(min_value=1)
+    recorded_at = forms.DateTimeField(required=False)
+
+    def clean_recorded_at(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        recorded_at = self.cleaned_data.get('recorded_at')
+        # Allow for small clock drift between monitors and the server
+        if recorded_at and recorded_at > timezone.now() + timedelta(minutes=5):
+            raise forms.ValidationError("Reading time is in the future.")
+        return recorded_at
+
 class NIHSSAssessmentForm(forms.ModelForm):
     class Meta:
         model = NIHSSAssessment
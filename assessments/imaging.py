@@ -0,0 +1,111 @@
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+
+from consultations.jobs import enqueue, task
+
+from .models import ImagingStudy
+
+
+logger = logging.getLogger(__name__)
+
+# Longest edge of each derivative, in pixels
+PREVIEW_SIZE = (1024, 1024)
+THUMBNAIL_SIZE = (256, 256)
+JPEG_QUALITY = 80
+
+
+def record_imaging_upload(patient, study_type, upload, performed_by, findings=''):
+    """
+    Create an ImagingStudy for an uploaded scan and queue its derivatives
+
+    The upload is hashed and written to the media store in chunks (see
+    stroke_unit.storage), so a scan is never held in memory whole. The
+    preview and thumbnail are made by a background job once the transaction
+    commits, unless the same file was uploaded and processed before.
+    """
+    study = ImagingStudy(
+        patient=patient,
+        study_type=study_type,
+        performed_by=performed_by,
+        findings=findings,
+        derivatives_status=ImagingStudy.DERIVATIVES_PENDING,
+    )
+    study.image_file.save(os.path.basename(upload.name), upload, save=False)
+
+    # The media store keeps one copy of identical files, so a re-uploaded
+    # scan can take the derivatives already made for it
+    done = ImagingStudy.objects.filter(
+        image_file=study.image_file.name, derivatives_status=ImagingStudy.DERIVATIVES_READY
+    ).values('preview', 'thumbnail').first()
+    if done:
+        study.preview, study.thumbnail = done['preview'], done['thumbnail']
+        study.derivatives_status = ImagingStudy.DERIVATIVES_READY
+    study.save()
+    if not done:
+        schedule_derivatives(study.pk)
+    return study
+
+
+def schedule_derivatives(study_id):
+    """Queue a study's preview and thumbnail, to be made once the current transaction commits"""
+    enqueue(make_derivatives, key=f'imaging-derivatives:{study_id}', study_id=study_id)
+
+
+@task(queue='imaging')
+def make_derivatives(study_id):
+    """
+    Render a study's preview and thumbnail from its original and mark it READY
+
+    Originals Pillow cannot read (e.g. DICOM) are kept as they are and the
+    study is marked FAILED, so the chart falls back to the plain link.
+    """
+    from PIL import Image
+
+    from patients.chart import invalidate_chart
+
+    study = ImagingStudy.objects.filter(pk=study_id).only(
+        'id', 'patient_id', 'image_file', 'image_url', 'preview', 'thumbnail'
+    ).first()
+    if study is None or not study.image_file:
+        return
+
+    try:
+        with study.image_file.open('rb') as original:
+            image = Image.open(original)
+            # Lets JPEG decode at a reduced scale instead of full resolution
+            image.draft('RGB', PREVIEW_SIZE)
+            image = _displayable(image)
+            image.thumbnail(PREVIEW_SIZE)
+            preview = _jpeg(image)
+            image.thumbnail(THUMBNAIL_SIZE)
+            thumbnail = _jpeg(image)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning("Imaging study %s: original is not a readable image", study_id, exc_info=True)
+        ImagingStudy.objects.filter(pk=study_id).update(derivatives_status=ImagingStudy.DERIVATIVES_FAILED)
+        invalidate_chart(study.patient_id)
+        return
+
+    name = os.path.splitext(os.path.basename(study.image_file.name))[0] + '.jpg'
+    study.preview.save(name, ContentFile(preview), save=False)
+    study.thumbnail.save(name, ContentFile(thumbnail), save=False)
+    study.derivatives_status = ImagingStudy.DERIVATIVES_READY
+    # A save, not an update(), so blob references and the chart cache follow
+    study.save(update_fields=['preview', 'thumbnail', 'derivatives_status'])
+
+
+def _displayable(image):
+    """An 8-bit RGB or greyscale copy; 16-bit scanner output is scaled down"""
+    if image.mode in ('I;16', 'I;16B', 'I;16L', 'I'):
+        image = image.convert('I').point(lambda value: value / 256).convert('L')
+    elif image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    return image
+
+
+def _jpeg(image):
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
@@ -0,0 +1,118 @@
+import json
+
+from django.db import transaction
+
+from patients.models import Patient
+from .forms import VitalSignsReadingForm
+from .models import VitalSigns
+
+
+# Largest batch accepted in one request; monitors post every few seconds,
+# so anything bigger is a misconfigured feed rather than a backlog
+MAX_BATCH_LINES = 5000
+
+# Readings handed to each background check job
+CHECK_BATCH = 500
+
+
+class BatchTooLarge(Exception):
+    pass
+
+
+def parse_readings(lines):
+    """
+    Validate NDJSON vitals readings
+
+    Parameters:
+    lines: Iterable of bytes or str, one JSON object per line; blank lines are skipped
+
+    Returns (readings, errors): readings is a list of (line_number, cleaned_data)
+    and errors a list of {'line': n, 'errors': {...}} for rejected lines.
+    Patient ids are only checked for type here; ingest_vitals() resolves
+    them for the whole batch at once.
+    """
+    readings, errors = [], []
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8')
+            except UnicodeDecodeError:
+                errors.append({'line': line_number, 'errors': {'__all__': ["Line is not valid UTF-8."]}})
+                continue
+        if not line.strip():
+            continue
+        if len(readings) + len(errors) >= MAX_BATCH_LINES:
+            raise BatchTooLarge(f"Batches are limited to {MAX_BATCH_LINES} readings.")
+
+        try:
+            data = json.loads(line)
+        except ValueError:
+            errors.append({'line': line_number, 'errors': {'__all__': ["Line is not valid JSON."]}})
+            continue
+        if not isinstance(data, dict):
+            errors.append({'line': line_number, 'errors': {'__all__': ["Line must be a JSON object."]}})
+            continue
+
+        form = VitalSignsReadingForm(data)
+        if form.is_valid():
+            readings.append((line_number, form.cleaned_data))
+        else:
+            errors.append({'line': line_number, 'errors': form.errors.get_json_data(escape_html=True)})
+    return readings, errors
+
+
+def ingest_vitals(lines, recorded_by):
+    """
+    Validate and store a batch of monitor readings
+
+    Patients are looked up in one query and valid readings are written with
+    a single bulk insert, so the cost of a batch does not grow with per-row
+    queries. Threshold breaches are counted for the response; the alerts,
+    trend updates and notifications are left to check_vital_signs jobs,
+    queued behind any readings saved before this batch.
+
+    Returns a dict with the number of readings created, the number breaching
+    a threshold and per-line errors. Raises BatchTooLarge past MAX_BATCH_LINES.
+    """
+    from consultations.jobs import enqueue
+    from consultations.tasks import check_vital_signs
+    from consultations.thresholds import evaluate_vital_signs
+    from patients.chart import invalidate_chart
+
+    readings, errors = parse_readings(lines)
+
+    patient_ids = {data['patient_id'] for _, data in readings}
+    patients = Patient.objects.in_bulk(patient_ids) if patient_ids else {}
+
+    records = []
+    for line_number, data in readings:
+        patient = patients.get(data['patient_id'])
+        if patient is None:
+            errors.append({'line': line_number, 'errors': {'patient_id': [
+                {'message': "Unknown patient.", 'code': 'invalid_choice'}
+            ]}})
+            continue
+        fields = {name: data[name] for name in VitalSignsReadingForm._meta.fields}
+        if data['recorded_at']:
+            fields['recorded_at'] = data['recorded_at']
+        records.append(VitalSigns(patient=patient, recorded_by=recorded_by, **fields))
+    errors.sort(key=lambda error: error['line'])
+
+    breaches = set()
+    if records:
+        with transaction.atomic():
+            # bulk_create skips VitalSigns.save() and its signals, so the
+            # check job and chart invalidation it would do happen here
+            VitalSigns.objects.bulk_create(records)
+            for start in range(0, len(records), CHECK_BATCH):
+                ids = [record.pk for record in records[start:start + CHECK_BATCH]]
+                enqueue(check_vital_signs, key=f'vital-signs-batch:{ids[0]}', vital_signs_ids=ids)
+            for patient_id in {record.patient_id for record in records}:
+                invalidate_chart(patient_id)
+        breaches = {breach.row for breach in evaluate_vital_signs(records)}
+
+    return {
+        'created': len(records),
+        'breaches': len(breaches),
+        'errors': errors,
+    }
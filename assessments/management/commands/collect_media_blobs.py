@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from assessments.blobs import COLLECT_GRACE, collect_unreferenced_blobs, recount_references
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete media-store blobs no imaging study or lab result references. "
+        "Run with --recount after restoring files or tables to rebuild reference counts first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true', help="Rebuild reference counts from the tables first")
+        parser.add_argument(
+            '--grace-minutes', type=int, default=int(COLLECT_GRACE.total_seconds() // 60),
+            help="Keep blobs unreferenced for less than this (default %(default)s)",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="List what would be deleted")
+
+    def handle(self, *args, **options):
+        if options['grace_minutes'] < 0:
+            raise CommandError("--grace-minutes cannot be negative")
+
+        if options['recount']:
+            with transaction.atomic():
+                counts = recount_references()
+            self.stdout.write(f"Recounted references to {len(counts)} blobs")
+
+        collected = collect_unreferenced_blobs(
+            grace=timedelta(minutes=options['grace_minutes']), dry_run=options['dry_run'],
+        )
+        for name, size in collected:
+            self.stdout.write(f"{name} ({size} bytes)")
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {len(collected)} blobs, {sum(size for _, size in collected)} bytes"
+        ))
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.10 on 2026-10-18 19:36
+
+from django.db import migrations, models
+
+
+SCORE_FIELDS = [
+    'loc', 'loc_questions', 'loc_commands',
+    'gaze', 'visual_fields', 'facial_palsy',
+    'motor_arm_left', 'motor_arm_right',
+    'motor_leg_left', 'motor_leg_right',
+    'ataxia', 'sensory', 'language',
+    'dysarthria', 'extinction',
+]
+
+
+def backfill_scores(apps, schema_editor):
+    """Store total score and severity band for existing assessments"""
+    NIHSSAssessment = apps.get_model('assessments', 'NIHSSAssessment')
+
+    batch = []
+    for assessment in NIHSSAssessment.objects.only('id', *SCORE_FIELDS).iterator(chunk_size=1000):
+        score = sum(getattr(assessment, field) for field in SCORE_FIELDS)
+        assessment.total_score = score
+        if score <= 4:
+            assessment.severity = 'MINOR'
+        elif score <= 15:
+            assessment.severity = 'MODERATE'
+        else:
+            assessment.severity = 'SEVERE'
+        batch.append(assessment)
+
+        if len(batch) >= 1000:
+            NIHSSAssessment.objects.bulk_update(batch, ['total_score', 'severity'])
+            batch = []
+
+    if batch:
+        NIHSSAssessment.objects.bulk_update(batch, ['total_score', 'severity'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assessments', '0002_imagingstudy_image_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nihssassessment',
+            name='severity',
+            field=models.CharField(choices=[('MINOR', 'Minor Stroke'), ('MODERATE', 'Moderate Stroke'), ('SEVERE', 'Severe Stroke')], db_index=True, default='MINOR', editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='nihssassessment',
+            name='total_score',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+    ]
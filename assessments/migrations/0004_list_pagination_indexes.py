@@ -0,0 +1,21 @@
+# Generated by Django 4.2.10 on 2026-10-18 19:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assessments', '0003_nihss_total_score_severity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='nihssassessment',
+            index=models.Index(fields=['-assessed_at', '-id'], name='nihss_assessed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nihssassessment',
+            index=models.Index(fields=['-total_score', '-assessed_at', '-id'], name='nihss_score_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assessments', '0005_vitals_recorded_at_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vitalsigns',
+            index=models.Index(fields=['patient', '-recorded_at'], name='vitals_patient_recorded_idx'),
+        ),
+    ]
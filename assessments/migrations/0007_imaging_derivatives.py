@@ -0,0 +1,28 @@
+# Generated by Django 4.2.10 on 2026-10-18 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assessments', '0006_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagingstudy',
+            name='derivatives_status',
+            field=models.CharField(blank=True, choices=[('PENDING', 'Pending'), ('READY', 'Ready'), ('FAILED', 'Failed')], max_length=10),
+        ),
+        migrations.AddField(
+            model_name='imagingstudy',
+            name='preview',
+            field=models.FileField(blank=True, upload_to='imaging_studies/previews/'),
+        ),
+        migrations.AddField(
+            model_name='imagingstudy',
+            name='thumbnail',
+            field=models.FileField(blank=True, upload_to='imaging_studies/thumbnails/'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.10 on 2026-10-18 20:24
+
+from django.db import migrations, models
+import stroke_unit.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assessments', '0007_imaging_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('references', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='labresult',
+            name='document',
+            field=models.FileField(blank=True, storage=stroke_unit.storage.get_media_storage, upload_to='lab_results/'),
+        ),
+        migrations.AlterField(
+            model_name='imagingstudy',
+            name='image_file',
+            field=models.FileField(blank=True, null=True, storage=stroke_unit.storage.get_media_storage, upload_to='imaging_studies/'),
+        ),
+        migrations.AlterField(
+            model_name='imagingstudy',
+            name='preview',
+            field=models.FileField(blank=True, storage=stroke_unit.storage.get_media_storage, upload_to='imaging_studies/previews/'),
+        ),
+        migrations.AlterField(
+            model_name='imagingstudy',
+            name='thumbnail',
+            field=models.FileField(blank=True, storage=stroke_unit.storage.get_media_storage, upload_to='imaging_studies/thumbnails/'),
+        ),
+        migrations.AddIndex(
+            model_name='imagingstudy',
+            index=models.Index(fields=['image_file'], name='imaging_file_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediablob',
+            index=models.Index(condition=models.Q(('references__lte', 0)), fields=['updated_at'], name='blob_unreferenced_idx'),
+        ),
+    ]
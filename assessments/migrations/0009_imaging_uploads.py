@@ -0,0 +1,34 @@
+# Generated by Django 4.2.10 on 2026-10-18 20:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('patients', '0006_access_code_sequence'),
+        ('assessments', '0008_media_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImagingUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('study_type', models.CharField(choices=[('CT', 'CT Scan'), ('CTA', 'CT Angiography'), ('MRI', 'MRI'), ('MRA', 'MR Angiography')], max_length=3)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('chunk_size', models.IntegerField()),
+                ('findings', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='imaging_uploads', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='imaging_uploads', to='patients.patient')),
+                ('study', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload', to='assessments.imagingstudy')),
+            ],
+        ),
+    ]
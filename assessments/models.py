@@ -1,11 +1,16 @@
+import uuid
+
 from django.db import models
+from django.utils import timezone
 from patients.models import Patient
 from accounts.models import User
+from stroke_unit.storage import get_media_storage
 
 class VitalSigns(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='vital_signs')
     recorded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
-    recorded_at = models.DateTimeField(auto_now_add=True)
+    # Defaults to now; monitor feeds supply the time the reading was taken
+    recorded_at = models.DateTimeField(default=timezone.now, editable=False)
     
     blood_pressure_systolic = models.PositiveIntegerField()
     blood_pressure_diastolic = models.PositiveIntegerField()
@@ -19,11 +24,12 @@ class VitalSigns(models.Model):
         is_new = self.pk is None
         super().save(*args, **kwargs)
         
-        # Only check thresholds if this is a new vital signs record
+        # Only check thresholds if this is a new vital signs record; a
+        # background job does so once the reading has committed
         if is_new:
-            # Import from consultations
-            from consultations.utils import check_vital_signs_thresholds
-            check_vital_signs_thresholds(self, self.patient)
+            from consultations.jobs import enqueue
+            from consultations.tasks import check_vital_signs
+            enqueue(check_vital_signs, key=f'vital-signs:{self.pk}', vital_signs_ids=[self.pk])
     
     def __str__(self):
         return f"Vitals for {self.patient} on {self.recorded_at.strftime('%Y-%m-%d %H:%M')}"
@@ -33,6 +39,10 @@ class VitalSigns(models.Model):
     
     class Meta:
         ordering = ['-recorded_at']
+        indexes = [
+            # A patient's readings, newest first (chart, dashboards, trends)
+            models.Index(fields=['patient', '-recorded_at'], name='vitals_patient_recorded_idx'),
+        ]
 
 class NIHSSAssessment(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='nihss_assessments')
@@ -73,6 +83,32 @@ class NIHSSAssessment(models.Model):
     # Notes and total score
     notes = models.TextField(blank=True)
     
+    # Stored score and severity band, kept up to date in save()
+    SEVERITY_CHOICES = [
+        ('MINOR', 'Minor Stroke'),
+        ('MODERATE', 'Moderate Stroke'),
+        ('SEVERE', 'Severe Stroke'),
+    ]
+    total_score = models.PositiveSmallIntegerField(default=0, editable=False, db_index=True)
+    severity = models.CharField(max_length=10, choices=SEVERITY_CHOICES, default='MINOR', editable=False, db_index=True)
+    
+    @staticmethod
+    def severity_for_score(score):
+        """Map an NIHSS total score to its severity band"""
+        if score <= 4:
+            return 'MINOR'
+        elif score <= 15:
+            return 'MODERATE'
+        return 'SEVERE'
+    
+    def save(self, *args, **kwargs):
+        self.total_score = self.get_total_score()
+        self.severity = self.severity_for_score(self.total_score)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'total_score', 'severity'}
+        super().save(*args, **kwargs)
+    
     def get_total_score(self):
         return sum([
             self.loc, self.loc_questions, self.loc_commands,
@@ -84,10 +120,15 @@ class NIHSSAssessment(models.Model):
         ])
     
     def __str__(self):
-        return f"NIHSS for {self.patient} - Score: {self.get_total_score()}"
+        return f"NIHSS for {self.patient} - Score: {self.total_score}"
     
     class Meta:
         ordering = ['-assessed_at']
+        indexes = [
+            # Keyset pagination of the NIHSS list, newest or highest score first
+            models.Index(fields=['-assessed_at', '-id'], name='nihss_assessed_idx'),
+            models.Index(fields=['-total_score', '-assessed_at', '-id'], name='nihss_score_idx'),
+        ]
 
 class ImagingStudy(models.Model):
     STUDY_TYPES = [
@@ -110,10 +151,26 @@ class ImagingStudy(models.Model):
     class Meta:
         ordering = ['-performed_at']
         verbose_name_plural = "Imaging Studies"
+        indexes = [
+            # Studies sharing a stored file (see assessments.imaging)
+            models.Index(fields=['image_file'], name='imaging_file_idx'),
+        ]
 
     # Existing fields...
-    image_file = models.FileField(upload_to='imaging_studies/', blank=True, null=True)
+    image_file = models.FileField(upload_to='imaging_studies/', storage=get_media_storage, blank=True, null=True)
     # image_url field still exists for external URLs
+
+    DERIVATIVES_PENDING, DERIVATIVES_READY, DERIVATIVES_FAILED = 'PENDING', 'READY', 'FAILED'
+    DERIVATIVE_STATUSES = [
+        (DERIVATIVES_PENDING, 'Pending'),
+        (DERIVATIVES_READY, 'Ready'),
+        (DERIVATIVES_FAILED, 'Failed'),
+    ]
+
+    # Downsized JPEG copies of image_file, made in the background (see assessments.imaging)
+    preview = models.FileField(upload_to='imaging_studies/previews/', storage=get_media_storage, blank=True)
+    thumbnail = models.FileField(upload_to='imaging_studies/thumbnails/', storage=get_media_storage, blank=True)
+    derivatives_status = models.CharField(max_length=10, choices=DERIVATIVE_STATUSES, blank=True)
     
     def save(self, *args, **kwargs):
         # If image_file is provided but image_url isn't, set the URL from the file
@@ -129,9 +186,62 @@ class LabResult(models.Model):
     is_abnormal = models.BooleanField(default=False)
     recorded_at = models.DateTimeField(auto_now_add=True)
     recorded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    # Scanned or exported report, e.g. a lab PDF
+    document = models.FileField(upload_to='lab_results/', storage=get_media_storage, blank=True)
     
     def __str__(self):
         return f"{self.test_name} for {self.patient}"
     
     class Meta:
-        ordering = ['-recorded_at']
\ No newline at end of file
+        ordering = ['-recorded_at']
+
+class MediaBlob(models.Model):
+    """
+    A file in the content-addressed media store (see stroke_unit.storage)
+
+    ``references`` counts the ImagingStudy and LabResult files pointing at
+    the blob. It is kept by save/delete hooks (see assessments.blobs) and
+    recounted with ``manage.py collect_media_blobs --recount``.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    references = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.references} references)"
+
+    class Meta:
+        indexes = [
+            # Unreferenced blobs, oldest first, for collection
+            models.Index(fields=['updated_at'], condition=models.Q(references__lte=0), name='blob_unreferenced_idx'),
+        ]
+
+class ImagingUpload(models.Model):
+    """
+    A resumable imaging upload (see assessments.uploads)
+
+    Chunks are written to local disk under RESUMABLE_UPLOAD_ROOT until the
+    upload is finalized into ``study``. Each chunk received pushes
+    ``expires_at`` back; expired uploads and their data are discarded.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='imaging_uploads')
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='imaging_uploads')
+    study_type = models.CharField(max_length=3, choices=ImagingStudy.STUDY_TYPES)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    chunk_size = models.IntegerField()
+    findings = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    study = models.OneToOneField(
+        ImagingStudy, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload'
+    )
+
+    def __str__(self):
+        return f"Upload of {self.filename} for {self.patient}"
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.size // self.chunk_size))
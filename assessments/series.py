@@ -0,0 +1,56 @@
+from decimal import Decimal
+
+from stroke_unit.timeseries import lttb
+
+from .models import VitalSigns
+
+
+# Vitals charted per patient, in display order
+SERIES_FIELDS = [
+    'blood_pressure_systolic',
+    'blood_pressure_diastolic',
+    'heart_rate',
+    'respiratory_rate',
+    'temperature',
+    'oxygen_saturation',
+    'blood_glucose',
+]
+
+DEFAULT_POINTS = 300
+MAX_POINTS = 2000
+
+
+def vitals_series(patient_id, start, end, points=DEFAULT_POINTS, fields=None):
+    """
+    A patient's vitals between ``start`` and ``end`` as downsampled parallel arrays
+
+    Parameters:
+    patient_id: Patient whose readings to chart
+    start, end: Aware datetimes bounding the window (inclusive)
+    points: Most points returned per vital; each vital is reduced separately
+            with LTTB, which keeps peaks and troughs
+    fields: Subset of SERIES_FIELDS (all by default)
+
+    Returns {'readings': <rows in the window>, 'series': {field: {'t': [...],
+    'v': [...]}}} where 't' holds Unix timestamps in seconds. Readings with
+    no value for a field (e.g. no glucose) are left out of that field only.
+    """
+    fields = fields or SERIES_FIELDS
+    rows = list(
+        VitalSigns.objects.filter(patient_id=patient_id, recorded_at__gte=start, recorded_at__lte=end)
+        .order_by('recorded_at').values_list('recorded_at', *fields)
+    )
+    times = [int(row[0].timestamp()) for row in rows]
+
+    series = {}
+    for column, field in enumerate(fields, start=1):
+        values = [
+            (time, float(row[column]) if isinstance(row[column], Decimal) else row[column])
+            for time, row in zip(times, rows) if row[column] is not None
+        ]
+        sampled = lttb(values, points)
+        series[field] = {
+            't': [time for time, _ in sampled],
+            'v': [value for _, value in sampled],
+        }
+    return {'readings': len(rows), 'series': series}
@@ -1,3 +1,616 @@
+import base64
+import hashlib
+import json
+import os
+import random
+import tempfile
+from datetime import date, datetime, timedelta
+from io import BytesIO
+from pathlib import Path
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from accounts.models import User
+from consultations.jobs import run_pending_jobs
+from consultations.models import Job, Notification, VitalTrendState
+from consultations.thresholds import load_threshold_table
+from consultations.trends import PatientTrends
+from patients.models import Patient
+from stroke_unit.storage import media_storage
+from stroke_unit.timeseries import lttb, time_series
+from stroke_unit.testing import QueryBudgetMixin, QueryPlanMixin
+from .blobs import collect_unreferenced_blobs, recount_references
+from .models import ImagingStudy, ImagingUpload, LabResult, MediaBlob, NIHSSAssessment, VitalSigns
+from .uploads import MIN_CHUNK_SIZE, expire_uploads, upload_directory
+
+
+NIHSS_ITEMS = [
+    'loc', 'loc_questions', 'loc_commands', 'gaze', 'visual_fields',
+    'facial_palsy', 'motor_arm_left', 'motor_arm_right', 'motor_leg_left',
+    'motor_leg_right', 'ataxia', 'sensory', 'language', 'dysarthria', 'extinction',
+]
+
+
+def make_assessment(patient, **scores):
+    items = {item: 0 for item in NIHSS_ITEMS}
+    items.update(scores)
+    return NIHSSAssessment.objects.create(patient=patient, **items)
+
+
+class NIHSSStoredScoreTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(
+            first_name='Test', last_name='Patient',
+            date_of_birth=date(1950, 1, 1), gender='M'
+        )
+
+    def test_score_and_severity_stored_on_save(self):
+        assessment = make_assessment(self.patient, loc=3, motor_arm_left=4, motor_leg_left=4, language=3, gaze=2)
+        assessment.refresh_from_db()
+        self.assertEqual(assessment.total_score, 16)
+        self.assertEqual(assessment.severity, 'SEVERE')
+
+        assessment.gaze = 0
+        assessment.save(update_fields=['gaze'])
+        assessment.refresh_from_db()
+        self.assertEqual(assessment.total_score, 14)
+        self.assertEqual(assessment.severity, 'MODERATE')
+
+    def test_severity_bands(self):
+        self.assertEqual(NIHSSAssessment.severity_for_score(4), 'MINOR')
+        self.assertEqual(NIHSSAssessment.severity_for_score(5), 'MODERATE')
+        self.assertEqual(NIHSSAssessment.severity_for_score(15), 'MODERATE')
+        self.assertEqual(NIHSSAssessment.severity_for_score(16), 'SEVERE')
+
+
+class TimeSeriesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(
+            first_name='Test', last_name='Patient',
+            date_of_birth=date(1950, 1, 1), gender='M'
+        )
+
+    def test_daily_counts_are_zero_filled(self):
+        now = timezone.now()
+        for days_ago in (0, 0, 3):
+            assessment = make_assessment(self.patient, loc=days_ago)
+            NIHSSAssessment.objects.filter(pk=assessment.pk).update(assessed_at=now - timedelta(days=days_ago))
+
+        with self.assertNumQueries(1):
+            series = time_series(NIHSSAssessment, timezone.localdate() - timedelta(days=89))
+
+        self.assertEqual(len(series), 90)
+        self.assertEqual(series[-1]['value'], 2)
+        self.assertEqual(series[-4]['value'], 1)
+        self.assertEqual(sum(point['value'] for point in series), 3)
+
+    def test_daily_average(self):
+        make_assessment(self.patient, loc=2)
+        make_assessment(self.patient, loc=3, gaze=1)
+
+        series = time_series(
+            NIHSSAssessment, timezone.localdate(),
+            aggregate='avg', value_field='total_score'
+        )
+        self.assertEqual(len(series), 1)
+        self.assertEqual(series[0]['value'], 3)
+
+    def test_lttb_keeps_endpoints_and_peaks(self):
+        points = [(x, 100) for x in range(1000)]
+        points[437] = (437, 180)
+        points[800] = (800, 40)
+
+        sampled = lttb(points, 50)
+        self.assertEqual(len(sampled), 50)
+        self.assertEqual((sampled[0], sampled[-1]), (points[0], points[-1]))
+        self.assertIn((437, 180), sampled)
+        self.assertIn((800, 40), sampled)
+        self.assertEqual(sampled, sorted(sampled))
+        self.assertEqual(lttb(points[:10], 50), points[:10])
+
+
+class VitalsSeriesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.technician = User.objects.create_user('tech', password='pw', role=User.Role.TECHNICIAN)
+        cls.patient = Patient.objects.create(first_name='Long', last_name='Stay', date_of_birth=date(1950, 1, 1), gender='F')
+        cls.now = timezone.now().replace(microsecond=0)
+        # Three days of readings every five minutes, one heart rate spike, glucose hourly
+        readings = []
+        for i in range(72 * 12):
+            readings.append(VitalSigns(
+                patient=cls.patient, recorded_at=cls.now - timedelta(minutes=5 * i),
+                blood_pressure_systolic=130 + i % 7, blood_pressure_diastolic=80, heart_rate=160 if i == 300 else 75,
+                respiratory_rate=16, temperature=37.0, oxygen_saturation=97,
+                blood_glucose=110 if i % 12 == 0 else None,
+            ))
+        VitalSigns.objects.bulk_create(readings)
+
+    def setUp(self):
+        self.client.force_login(self.technician)
+
+    def get(self, **params):
+        return self.client.get(reverse('assessments:vitals_series', args=[self.patient.id]), params)
+
+    def test_stay_is_downsampled_to_the_point_budget(self):
+        response = self.get(hours=72, points=150, end=self.now.isoformat())
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+
+        self.assertEqual(body['readings'], 72 * 12)
+        heart_rate = body['series']['heart_rate']
+        self.assertEqual(len(heart_rate['t']), 150)
+        self.assertEqual(len(heart_rate['t']), len(heart_rate['v']))
+        self.assertIn(160, heart_rate['v'])
+        self.assertEqual(heart_rate['t'][-1], int(self.now.timestamp()))
+        self.assertEqual(heart_rate['t'], sorted(heart_rate['t']))
+        self.assertEqual(len(body['series']['blood_glucose']['t']), 72)
+        self.assertEqual(body['series']['temperature']['v'][0], 37.0)
+        # About 2 KB per vital, against some 100 KB for every reading in the window
+        self.assertLess(len(response.content), 15 * 1024)
+
+    def test_time_window_and_fields(self):
+        body = self.get(hours=1, end=self.now.isoformat(), fields='heart_rate,oxygen_saturation').json()
+        self.assertEqual(body['readings'], 13)
+        self.assertEqual(set(body['series']), {'heart_rate', 'oxygen_saturation'})
+        self.assertEqual(len(body['series']['heart_rate']['t']), 13)
+
+    def test_bad_parameters_and_access(self):
+        self.assertEqual(self.get(fields='heart_rate,shoe_size').status_code, 400)
+        self.assertEqual(self.get(points='many').status_code, 400)
+        self.assertEqual(self.get(end='yesterday').status_code, 400)
+        self.assertEqual(self.client.get(reverse('assessments:vitals_series', args=[999])).status_code, 404)
+
+        self.client.force_login(User.objects.create_user('family', password='pw', role=User.Role.PATIENT))
+        self.assertEqual(self.get().status_code, 403)
+
+
+class VitalsIngestionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.technician = User.objects.create_user('monitor', password='pw', role=User.Role.TECHNICIAN)
+        cls.patients = [
+            Patient.objects.create(first_name=f'Bed{i}', last_name='Patient', date_of_birth=date(1950, 1, 1), gender='F')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        load_threshold_table()
+
+    def reading(self, patient, **fields):
+        values = {
+            'patient_id': patient.id, 'blood_pressure_systolic': 120, 'blood_pressure_diastolic': 80,
+            'heart_rate': 72, 'respiratory_rate': 16, 'temperature': '36.8', 'oxygen_saturation': 98,
+        }
+        values.update(fields)
+        return json.dumps(values)
+
+    def post(self, lines, username='monitor', password='pw'):
+        credentials = base64.b64encode(f'{username}:{password}'.encode()).decode()
+        return self.client.post(
+            reverse('assessments:ingest_vitals'), '\n'.join(lines) + '\n',
+            content_type='application/x-ndjson', HTTP_AUTHORIZATION=f'Basic {credentials}'
+        )
+
+    def test_batch_is_stored_with_one_insert_and_checked_in_the_background(self):
+        taken = datetime(2024, 3, 1, 8, 30, tzinfo=timezone.utc)
+        lines = [self.reading(p, recorded_at=taken.isoformat()) for p in self.patients]
+        lines.append(self.reading(self.patients[0], blood_pressure_systolic=200))
+
+        # User, patients, savepoint, bulk insert, the check job, release
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(6):
+            response = self.post(lines)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'created': 4, 'breaches': 1, 'errors': []})
+        self.assertEqual(VitalSigns.objects.filter(recorded_at=taken).count(), 3)
+        self.assertEqual(VitalSigns.objects.filter(recorded_by=self.technician).count(), 4)
+        self.assertFalse(Notification.objects.exists())
+
+        job = Job.objects.get()
+        self.assertEqual((job.queue, len(job.kwargs['vital_signs_ids'])), ('vitals', 4))
+        with self.captureOnCommitCallbacks(execute=True):
+            run_pending_jobs()
+        self.assertEqual(Notification.objects.filter(user=self.technician).count(), 1)
+
+    def test_readings_reach_the_trend_windows_in_queue_order(self):
+        patient = self.patients[0]
+        first = VitalSigns.objects.create(
+            patient=patient, blood_pressure_systolic=120, blood_pressure_diastolic=80, heart_rate=72,
+            respiratory_rate=16, temperature='36.8', oxygen_saturation=98,
+        )
+        self.post([self.reading(patient, recorded_at=(first.recorded_at + timedelta(minutes=1)).isoformat())])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(run_pending_jobs(), 2)
+        trends = PatientTrends.from_json(VitalTrendState.objects.get(patient=patient).state)
+        self.assertTrue(trends.windows)
+        self.assertEqual({window.count for window in trends.windows.values()}, {2})
+
+    def test_invalid_lines_are_reported_and_valid_ones_kept(self):
+        lines = [
+            self.reading(self.patients[0]),
+            'not json',
+            self.reading(self.patients[1], heart_rate='fast'),
+            '',
+            self.reading(self.patients[2], patient_id=999999),
+        ]
+        response = self.post(lines)
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['created'], 1)
+        self.assertEqual([error['line'] for error in body['errors']], [2, 3, 5])
+        self.assertIn('heart_rate', body['errors'][1]['errors'])
+        self.assertIn('patient_id', body['errors'][2]['errors'])
+
+    def test_authentication_is_required(self):
+        self.assertEqual(self.post([self.reading(self.patients[0])], password='wrong').status_code, 401)
+
+        User.objects.create_user('family', password='pw', role=User.Role.PATIENT)
+        self.assertEqual(self.post([self.reading(self.patients[0])], username='family').status_code, 403)
+        self.assertFalse(VitalSigns.objects.exists())
+
+
+class ImagingPipelineTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.technician = User.objects.create_user('imaging', password='pw', role=User.Role.TECHNICIAN)
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = self.settings(MEDIA_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client.force_login(self.technician)
+
+    def register(self, first_name='Scan', **files):
+        data = {'first_name': first_name, 'last_name': 'Patient', 'date_of_birth': '1950-01-01', 'gender': 'M'}
+        data.update(files)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('patients:register_patient'), data)
+            run_pending_jobs()
+        self.assertEqual(response.status_code, 302)
+        return Patient.objects.get(first_name=first_name)
+
+    def png(self, size=(2400, 1800)):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'gray').save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def test_uploaded_scan_is_attached_with_preview_and_thumbnail(self):
+        patient = self.register(ct_scan=SimpleUploadedFile('head_ct.png', self.png(), 'image/png'))
+
+        study = patient.imaging_studies.get()
+        self.assertEqual((study.study_type, study.derivatives_status), ('CT', 'READY'))
+        with study.image_file.open('rb') as original:
+            self.assertEqual(Image.open(original).size, (2400, 1800))
+        with study.preview.open('rb') as preview:
+            self.assertEqual(Image.open(preview).size, (1024, 768))
+        with study.thumbnail.open('rb') as thumbnail:
+            self.assertEqual(Image.open(thumbnail).size, (256, 192))
+
+        response = self.client.get(reverse('patients:detail', args=[patient.id]))
+        self.assertContains(response, study.thumbnail.url)
+
+    def test_failed_attach_is_logged_and_reported(self):
+        scan = SimpleUploadedFile('head_ct.png', self.png(), 'image/png')
+        with patch('assessments.imaging.record_imaging_upload', side_effect=OSError("No space left on device")), \
+                self.assertLogs('patients.views', 'ERROR'):
+            response = self.client.post(reverse('patients:register_patient'), {
+                'first_name': 'Full', 'last_name': 'Disk', 'date_of_birth': '1950-01-01', 'gender': 'M',
+                'ct_scan': scan,
+            }, follow=True)
+
+        self.assertContains(response, "CT scan could not be attached")
+        self.assertFalse(ImagingStudy.objects.exists())
+        self.assertTrue(Patient.objects.filter(first_name='Full').exists())
+
+    def test_unreadable_original_is_kept_without_derivatives(self):
+        with self.assertLogs('assessments.imaging', 'WARNING'):
+            patient = self.register(mri_scan=SimpleUploadedFile('brain.dcm', b'\0' * 128 + b'DICM', 'application/dicom'))
+
+        study = patient.imaging_studies.get()
+        self.assertEqual((study.study_type, study.derivatives_status), ('MRI', 'FAILED'))
+        self.assertTrue(study.image_file.storage.exists(study.image_file.name))
+        self.assertFalse(study.thumbnail)
+
+    def test_identical_uploads_are_stored_once_and_reuse_derivatives(self):
+        scan = self.png()
+        first = self.register('First', ct_scan=SimpleUploadedFile('ct.png', scan, 'image/png')).imaging_studies.get()
+        with patch('assessments.imaging.schedule_derivatives') as schedule_derivatives:
+            second = self.register(
+                'Second', ct_scan=SimpleUploadedFile('retry.PNG', scan, 'image/png'),
+                lab_results=SimpleUploadedFile('labs.pdf', b'%PDF-1.4 panel', 'application/pdf'),
+            ).imaging_studies.get()
+        schedule_derivatives.assert_not_called()
+
+        self.assertEqual(second.image_file.name, first.image_file.name)
+        self.assertEqual(
+            (second.preview.name, second.thumbnail.name, second.derivatives_status),
+            (first.preview.name, first.thumbnail.name, 'READY'),
+        )
+        self.assertEqual(hashlib.sha256(scan).hexdigest(), Path(first.image_file.name).stem)
+        self.assertEqual(
+            dict(MediaBlob.objects.values_list('name', 'references')),
+            {first.image_file.name: 2, first.preview.name: 2, first.thumbnail.name: 2,
+             LabResult.objects.get().document.name: 1},
+        )
+
+    def test_unreferenced_blobs_are_collected(self):
+        kept = self.register('Kept', ct_scan=SimpleUploadedFile('ct.png', self.png(), 'image/png')).imaging_studies.get()
+        patient = self.register('Gone', lab_results=SimpleUploadedFile('labs.pdf', b'%PDF-1.4 panel', 'application/pdf'))
+        document = patient.lab_results.get().document.name
+
+        patient.delete()
+        self.assertEqual(MediaBlob.objects.get(name=document).references, 0)
+        self.assertEqual(collect_unreferenced_blobs(), [], "Within the grace period")
+
+        # A drifted count must not lose a blob that is still referenced
+        MediaBlob.objects.filter(name=kept.image_file.name).update(references=0)
+        collected = collect_unreferenced_blobs(grace=timedelta(0))
+
+        self.assertEqual([name for name, _ in collected], [document])
+        self.assertFalse(kept.image_file.storage.exists(document))
+        self.assertTrue(kept.image_file.storage.exists(kept.image_file.name))
+        self.assertEqual(recount_references()[kept.image_file.name], 1)
+        self.assertEqual(MediaBlob.objects.get(name=kept.image_file.name).references, 1)
+
+
+class ResumableUploadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.technician = User.objects.create_user('tablet', password='pw', role=User.Role.TECHNICIAN)
+        cls.patient = Patient.objects.create(first_name='Mobile', last_name='Patient', date_of_birth=date(1950, 1, 1), gender='F')
+        # Noise compresses badly, so the PNG spans several chunks
+        buffer = BytesIO()
+        Image.frombytes('L', (600, 600), random.Random(3).randbytes(600 * 600)).save(buffer, 'PNG')
+        cls.scan = buffer.getvalue()
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        overrides = self.settings(
+            MEDIA_ROOT=os.path.join(root.name, 'media'),
+            RESUMABLE_UPLOAD_ROOT=os.path.join(root.name, 'uploads'),
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client.force_login(self.technician)
+
+    def start(self, **fields):
+        data = {
+            'patient_id': self.patient.id, 'study_type': 'CT', 'filename': 'head_ct.png',
+            'size': len(self.scan), 'chunk_size': MIN_CHUNK_SIZE,
+        }
+        data.update(fields)
+        return self.client.post(reverse('assessments:imaging_upload_create'), data, content_type='application/json')
+
+    def put(self, url, index, body=None, **headers):
+        if body is None:
+            body = self.scan[index * MIN_CHUNK_SIZE:(index + 1) * MIN_CHUNK_SIZE]
+        return self.client.put(f'{url}chunks/{index}/', body, content_type='application/octet-stream', headers=headers)
+
+    def test_interrupted_upload_resumes_and_finalizes_into_a_study(self):
+        response = self.start()
+        self.assertEqual(response.status_code, 201)
+        url = response['Location']
+        chunks = response.json()['chunks']
+        self.assertEqual(chunks, -(-len(self.scan) // MIN_CHUNK_SIZE))
+        self.assertGreater(chunks, 3)
+
+        # The link drops after chunk 0 and partway through chunk 2
+        self.assertEqual(self.put(url, 0).status_code, 200)
+        self.assertEqual(self.put(url, 2, self.scan[2 * MIN_CHUNK_SIZE:2 * MIN_CHUNK_SIZE + 100]).status_code, 400)
+        self.assertEqual(self.client.post(f'{url}finalize/').status_code, 409)
+
+        status = self.client.get(url)
+        self.assertEqual(status['Upload-Offset'], str(MIN_CHUNK_SIZE))
+        self.assertEqual(status.json()['missing'], list(range(1, chunks)))
+
+        for index in status.json()['missing'][::-1]:
+            chunk = self.scan[index * MIN_CHUNK_SIZE:(index + 1) * MIN_CHUNK_SIZE]
+            response = self.put(url, index, X_CHUNK_SHA256=hashlib.sha256(chunk).hexdigest())
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Upload-Offset'], str(len(self.scan)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'{url}finalize/')
+            run_pending_jobs()
+        self.assertEqual(response.status_code, 201)
+        study = ImagingStudy.objects.get(pk=response.json()['study_id'])
+        self.assertEqual((study.patient, study.study_type, study.derivatives_status), (self.patient, 'CT', 'READY'))
+        with study.image_file.open('rb') as f:
+            self.assertEqual(f.read(), self.scan)
+        self.assertFalse(os.listdir(settings.RESUMABLE_UPLOAD_ROOT), "Local chunks are dropped")
+
+        # A retried finalize returns the same study
+        self.assertEqual(self.client.post(f'{url}finalize/').json()['study_id'], study.id)
+        self.assertEqual(ImagingStudy.objects.count(), 1)
+
+    def test_chunk_and_finalize_query_budgets(self):
+        url = self.start()['Location']
+        for index in range(-(-len(self.scan) // MIN_CHUNK_SIZE)):
+            # Session, user, upload, and pushing back its expiry
+            with self.assertNumQueries(4):
+                self.assertEqual(self.put(url, index).status_code, 200)
+
+        # Session, user and upload, then savepoint, the upload re-read under
+        # lock, the study's old files, the study, its blob row and reference
+        # count, the derivatives job, the upload's link to the study, release
+        with self.assertNumQueries(12):
+            self.assertEqual(self.client.post(f'{url}finalize/').status_code, 201)
+
+    def test_corrupt_chunk_is_rejected(self):
+        url = self.start()['Location']
+        response = self.put(url, 0, X_CHUNK_SHA256='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(url).json()['missing'][0], 0)
+
+    def test_uploads_are_private_and_expire(self):
+        url = self.start()['Location']
+        upload = ImagingUpload.objects.get()
+        self.assertEqual(self.start(size=0).status_code, 400)
+        self.assertEqual(self.start(study_type='PET').status_code, 400)
+
+        self.client.force_login(User.objects.create_user('other', password='pw', role=User.Role.TECHNICIAN))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        ImagingUpload.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(expire_uploads(), 1)
+        self.assertFalse(ImagingUpload.objects.exists())
+        self.assertFalse(os.path.exists(upload_directory(upload)))
+
+
+class MediaServingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.neurologist = User.objects.create_user('viewer', password='pw', role=User.Role.NEUROLOGIST)
+        cls.content = bytes(range(256)) * 400
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = self.settings(MEDIA_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.name = media_storage.save('series.dcm', ContentFile(self.content))
+        self.url = media_storage.url(self.name)
+        self.client.force_login(self.neurologist)
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_whole_file_with_validators(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(self.content).hexdigest()}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response, body = self.get(If_None_Match=response['ETag'])
+        self.assertEqual((response.status_code, body), (304, b''))
+
+    def test_byte_ranges(self):
+        response, body = self.get(Range='bytes=1000-1999')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 1000-1999/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '1000')
+        self.assertEqual(body, self.content[1000:2000])
+
+        response, body = self.get(Range='bytes=-10')
+        self.assertEqual(body, self.content[-10:])
+
+        response, body = self.get(Range=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+        # A range of an older version is answered with the whole current file
+        response, body = self.get(Range='bytes=0-9', If_Range='"stale"')
+        self.assertEqual((response.status_code, len(body)), (200, len(self.content)))
+
+    def test_compressed_upload_is_sent_as_stored(self):
+        name = media_storage.save('brain.nii.gz', ContentFile(self.content))
+        response = self.client.get(media_storage.url(name), headers={'Range': 'bytes=0-9'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), self.content[:10])
+
+    def test_offload_to_front_end_server(self):
+        with self.settings(MEDIA_OFFLOAD='x-accel-redirect'):
+            response, body = self.get(Range='bytes=0-9')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.name}')
+        self.assertEqual(body, b'')
+
+        with self.settings(MEDIA_OFFLOAD='x-sendfile'):
+            response, body = self.get()
+        self.assertEqual(response['X-Sendfile'], media_storage.path(self.name))
+
+    def test_only_clinical_staff_and_only_media(self):
+        self.assertEqual(self.get()[0].status_code, 200)
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/blobs/missing.png').status_code, 404)
+
+        self.client.force_login(User.objects.create_user('relative', password='pw', role=User.Role.PATIENT))
+        self.assertEqual(self.get()[0].status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.get()[0].status_code, 302)
+
+
+class VitalsIndexPlanTests(QueryPlanMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(first_name='A', last_name='B', date_of_birth=date(1950, 1, 1), gender='F')
+        for minutes in range(3):
+            VitalSigns.objects.create(
+                patient=cls.patient, recorded_at=timezone.now() - timedelta(minutes=minutes),
+                blood_pressure_systolic=120, blood_pressure_diastolic=80, heart_rate=72,
+                respiratory_rate=16, temperature=37.0, oxygen_saturation=98,
+            )
+
+    def test_patient_readings_newest_first(self):
+        # As the patient chart and dashboards read them
+        readings = VitalSigns.objects.filter(patient=self.patient).select_related('recorded_by')
+        self.assertUsesIndexes(readings.order_by('-recorded_at'))
+        self.assertUsesIndexes(readings.order_by('-recorded_at')[:1])
+
+
+class AssessmentsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    urlconf = 'assessments.urls'
+    roles = {'nihss_list': 'NEUROLOGIST', 'doctor_dashboard': 'NEUROLOGIST'}
+    budgets = {
+        'perform_nihss': 3,
+        'nihss_details': 5,
+        'nihss_detail': 5,
+        'nihss_list': 3,
+        'doctor_dashboard': 6,
+        'ingest_vitals': ('POST', lambda kwargs: json.dumps({
+            'patient_id': kwargs['patient_id'], 'blood_pressure_systolic': 120, 'blood_pressure_diastolic': 80,
+            'heart_rate': 72, 'respiratory_rate': 16, 'temperature': '36.8', 'oxygen_saturation': 98,
+        }), 8),
+        'vitals_series': 4,
+        'imaging_upload_create': ('POST', lambda kwargs: {
+            'patient_id': kwargs['patient_id'], 'study_type': 'CT', 'filename': 'ct.png', 'size': 1024,
+        }, 5),
+        'imaging_upload': 3,
+    }
+    # Need the chunks of an upload on disk; budgeted in ResumableUploadTests
+    skip = {'imaging_upload_chunk', 'imaging_upload_finalize'}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        upload = ImagingUpload.objects.create(
+            patient_id=cls.url_kwargs['patient_id'], created_by=cls.users['TECHNICIAN'], study_type='CT',
+            filename='ct.png', size=1024, chunk_size=1024, expires_at=timezone.now() + timedelta(days=1),
+        )
+        cls.url_kwargs = {**cls.url_kwargs, 'upload_id': upload.id, 'index': 0}
 
-# Create your tests here.
+    def setUp(self):
+        super().setUp()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        overrides = self.settings(RESUMABLE_UPLOAD_ROOT=root.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
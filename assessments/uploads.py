@@ -0,0 +1,214 @@
+import hashlib
+import os
+import shutil
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ImagingStudy, ImagingUpload
+
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 32 * 1024 * 1024
+MAX_UPLOAD_SIZE = 4 * 1024 * 1024 * 1024
+
+# How long an upload is kept after its last chunk
+UPLOAD_EXPIRY = timedelta(hours=24)
+
+# Request bodies are copied to disk in pieces this size
+COPY_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """A request the upload cannot accept; ``status`` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class _AssembledFile(File):
+    # Lets the media store move the finished file into place instead of copying it
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def upload_directory(upload):
+    return os.path.join(settings.RESUMABLE_UPLOAD_ROOT, str(upload.id))
+
+
+def _data_path(upload):
+    return os.path.join(upload_directory(upload), 'data')
+
+
+def _marker_path(upload, index):
+    return os.path.join(upload_directory(upload), 'received', str(index))
+
+
+def create_upload(patient, user, study_type, filename, size, chunk_size=None, findings=''):
+    """
+    Start a resumable upload of ``size`` bytes
+
+    The data file is created at its full (sparse) size, so chunks can be
+    written at their offsets in any order and by parallel requests.
+    Raises UploadError for sizes out of range or an unknown study type.
+    """
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    if study_type not in dict(ImagingStudy.STUDY_TYPES):
+        raise UploadError(f"Unknown study type '{study_type}'.")
+    if not 0 < size <= MAX_UPLOAD_SIZE:
+        raise UploadError(f"size must be between 1 and {MAX_UPLOAD_SIZE} bytes.")
+    if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise UploadError(f"chunk_size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE} bytes.")
+
+    expire_uploads()
+    upload = ImagingUpload.objects.create(
+        patient=patient,
+        created_by=user,
+        study_type=study_type,
+        filename=os.path.basename(filename)[:255] or 'upload',
+        size=size,
+        chunk_size=chunk_size,
+        findings=findings,
+        expires_at=timezone.now() + UPLOAD_EXPIRY,
+    )
+    os.makedirs(os.path.dirname(_marker_path(upload, 0)))
+    with open(_data_path(upload), 'wb') as f:
+        f.truncate(size)
+    return upload
+
+
+def chunk_length(upload, index):
+    """Bytes chunk ``index`` must hold; the last chunk takes the remainder"""
+    if not 0 <= index < upload.chunk_count:
+        raise UploadError(f"Chunk {index} is out of range; this upload has {upload.chunk_count} chunks.", status=404)
+    return min(upload.chunk_size, upload.size - index * upload.chunk_size)
+
+
+def write_chunk(upload, index, stream, length, sha256=None):
+    """
+    Store chunk ``index`` read from ``stream`` (e.g. the request)
+
+    The body is copied in pieces straight to its offset in the data file.
+    The chunk only counts as received once all ``length`` bytes are in and,
+    when given, their SHA-256 matches; resending a chunk overwrites it.
+    """
+    expected = chunk_length(upload, index)
+    if upload.study_id is not None:
+        raise UploadError("This upload is already finalized.", status=409)
+    if length != expected:
+        raise UploadError(f"Chunk {index} must be {expected} bytes, got {length}.")
+
+    digest = hashlib.sha256()
+    offset = index * upload.chunk_size
+    written = 0
+    os.makedirs(os.path.dirname(_marker_path(upload, index)), exist_ok=True)
+    try:
+        os.remove(_marker_path(upload, index))
+    except FileNotFoundError:
+        pass
+    fd = os.open(_data_path(upload), os.O_WRONLY)
+    try:
+        while written < expected:
+            piece = stream.read(min(COPY_SIZE, expected - written))
+            if not piece:
+                break
+            os.pwrite(fd, piece, offset + written)
+            digest.update(piece)
+            written += len(piece)
+    finally:
+        os.close(fd)
+
+    if written != expected:
+        raise UploadError(f"Chunk {index} ended after {written} of {expected} bytes.")
+    if sha256 and digest.hexdigest() != sha256.lower():
+        raise UploadError(f"Chunk {index} does not match its SHA-256; resend it.")
+
+    open(_marker_path(upload, index), 'wb').close()
+    ImagingUpload.objects.filter(pk=upload.pk).update(expires_at=timezone.now() + UPLOAD_EXPIRY)
+
+
+def received_chunks(upload):
+    """Sorted indexes of the chunks stored so far"""
+    try:
+        names = os.listdir(os.path.dirname(_marker_path(upload, 0)))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name) for name in names if name.isdigit())
+
+
+def upload_status(upload):
+    """
+    Progress of an upload, as returned to clients
+
+    ``offset`` is how many bytes from the start are in; a client that
+    uploads in order resumes from there. ``missing`` lists every chunk
+    still to send.
+    """
+    if upload.study_id is not None:
+        received = list(range(upload.chunk_count))
+    else:
+        received = received_chunks(upload)
+    have = set(received)
+    contiguous = 0
+    while contiguous in have:
+        contiguous += 1
+    return {
+        'id': str(upload.id),
+        'patient_id': upload.patient_id,
+        'study_type': upload.study_type,
+        'filename': upload.filename,
+        'size': upload.size,
+        'chunk_size': upload.chunk_size,
+        'chunks': upload.chunk_count,
+        'offset': min(contiguous * upload.chunk_size, upload.size),
+        'missing': [index for index in range(upload.chunk_count) if index not in have],
+        'expires_at': upload.expires_at.isoformat(),
+        'study_id': upload.study_id,
+    }
+
+
+def finalize_upload(upload):
+    """
+    Turn a complete upload into an ImagingStudy and drop its local data
+
+    The assembled file goes to the media store and the derivative pipeline
+    like any other scan (see assessments.imaging). Finalizing again returns
+    the same study, so a client whose response was lost can simply retry.
+    """
+    from .imaging import record_imaging_upload
+
+    with transaction.atomic():
+        upload = ImagingUpload.objects.select_for_update().select_related('patient', 'created_by').get(pk=upload.pk)
+        if upload.study_id is not None:
+            return upload.study
+
+        missing = upload.chunk_count - len(received_chunks(upload))
+        if missing:
+            raise UploadError(f"{missing} chunks have not been received yet.", status=409)
+
+        with open(_data_path(upload), 'rb') as f:
+            study = record_imaging_upload(
+                upload.patient, upload.study_type, _AssembledFile(f, name=upload.filename),
+                upload.created_by, findings=upload.findings,
+            )
+        upload.study = study
+        upload.save(update_fields=['study'])
+
+    directory = upload_directory(upload)
+    transaction.on_commit(lambda: shutil.rmtree(directory, ignore_errors=True))
+    return study
+
+
+def expire_uploads(now=None):
+    """Delete uploads past their expiry, with any data still on disk; returns how many"""
+    now = now or timezone.now()
+    expired = list(ImagingUpload.objects.filter(expires_at__lt=now).only('id'))
+    for upload in expired:
+        shutil.rmtree(upload_directory(upload), ignore_errors=True)
+    ImagingUpload.objects.filter(pk__in=[upload.pk for upload in expired]).delete()
+    return len(expired)
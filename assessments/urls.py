@@ -10,6 +10,12 @@ urlpatterns = [
     path('nihss/detail/<int:assessment_id>/', views.view_nihss_details, name='nihss_detail'),
     path('nihss/list/', views.nihss_list, name='nihss_list'),
     path('doctor/dashboard/', views.doctor_dashboard, name='doctor_dashboard'),
+    path('vitals/ingest/', views.ingest_vitals, name='ingest_vitals'),
+    path('vitals/series/<int:patient_id>/', views.vitals_series, name='vitals_series'),
+    path('imaging/uploads/', views.create_imaging_upload, name='imaging_upload_create'),
+    path('imaging/uploads/<uuid:upload_id>/', views.imaging_upload, name='imaging_upload'),
+    path('imaging/uploads/<uuid:upload_id>/chunks/<int:index>/', views.imaging_upload_chunk, name='imaging_upload_chunk'),
+    path('imaging/uploads/<uuid:upload_id>/finalize/', views.finalize_imaging_upload, name='imaging_upload_finalize'),
     
 ]
 
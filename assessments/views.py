@@ -1,9 +1,20 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods, require_POST
 from patients.models import Patient
 from .models import NIHSSAssessment
 from .forms import NIHSSAssessmentForm
+from stroke_unit.pagination import paginate_by_cursor
+
+
+# Bootstrap contextual class for each stored severity band
+SEVERITY_CLASSES = {
+    'MINOR': 'success',
+    'MODERATE': 'warning',
+    'SEVERE': 'danger',
+}
 
 
 @login_required
@@ -34,8 +45,8 @@ def perform_nihss(request, patient_id):
             assessment.assessed_by = request.user
             assessment.save()
             
-            # Calculate total score for the message
-            total_score = assessment.get_total_score()
+            # Total score is stored on save
+            total_score = assessment.total_score
             
             messages.success(request, f"NIHSS assessment completed. Total score: {total_score}")
             return redirect('patients:detail', patient_id=patient_id)
@@ -72,18 +83,11 @@ def view_nihss_details(request, assessment_id):
         messages.error(request, "You don't have permission to view this assessment.")
         return redirect('home')
     
-    total_score = assessment.get_total_score()
+    total_score = assessment.total_score
     
-    # Determine stroke severity based on NIHSS score
-    if total_score <= 4:
-        severity = "Minor Stroke"
-        severity_class = "success"
-    elif total_score <= 15:
-        severity = "Moderate Stroke"
-        severity_class = "warning"
-    else:
-        severity = "Severe Stroke"
-        severity_class = "danger"
+    # Stroke severity is stored alongside the score
+    severity = assessment.get_severity_display()
+    severity_class = SEVERITY_CLASSES[assessment.severity]
     
     return render(request, 'assessments/nihss_details.html', {
         'assessment': assessment,
@@ -110,11 +114,29 @@ def nihss_list(request):
         messages.error(request, "Only neurologists can access the NIHSS assessment list.")
         return redirect('home')
     
-    # Get all assessments
-    assessments = NIHSSAssessment.objects.all().order_by('-assessed_at')
+    # Get all assessments, optionally filtered by the stored severity band or score
+    assessments = NIHSSAssessment.objects.select_related('patient', 'assessed_by')
+    
+    severity_filter = request.GET.get('severity', '')
+    if severity_filter in SEVERITY_CLASSES:
+        assessments = assessments.filter(severity=severity_filter)
+    
+    min_score = request.GET.get('min_score', '')
+    if min_score.isdigit():
+        assessments = assessments.filter(total_score__gte=int(min_score))
+    
+    # Newest first, or highest score first, one page at a time
+    sort = request.GET.get('sort', '')
+    if sort == 'score':
+        assessments = paginate_by_cursor(request, assessments, ['total_score', 'assessed_at'], per_page=50)
+    else:
+        assessments = paginate_by_cursor(request, assessments, ['assessed_at'], per_page=50)
     
     return render(request, 'assessments/nihss_list.html', {
-        'assessments': assessments
+        'assessments': assessments,
+        'severity_filter': severity_filter,
+        'min_score': min_score,
+        'sort': sort,
     })
 
 
@@ -134,52 +156,43 @@ def doctor_dashboard(request):
         messages.error(request, "Only neurologists can access the doctor dashboard.")
         return redirect('home')
     
-    from django.db.models import Count, Avg
     from django.utils import timezone
     from datetime import timedelta
-    from patients.models import Patient
+    from consultations.stats import get_unit_statistics
+    from stroke_unit.timeseries import time_series
     from .models import NIHSSAssessment
     
-    # Get statistics
-    total_assessments = NIHSSAssessment.objects.count()
+    # Unit-wide totals come from the incrementally maintained statistics row
+    stats = get_unit_statistics()
+    total_assessments = stats.total_assessments
+    assessments_today = stats.assessments_today
+    severity_counts = {
+        'minor': stats.nihss_minor,
+        'moderate': stats.nihss_moderate,
+        'severe': stats.nihss_severe,
+    }
     
     # Assessments by the current doctor
     doctor_assessments = NIHSSAssessment.objects.filter(assessed_by=request.user).count()
     
-    # Get assessments today
-    today = timezone.now().date()
-    assessments_today = NIHSSAssessment.objects.filter(assessed_at__date=today).count()
-    
-    # Get NIHSS severity distribution
-    severity_counts = {
-        'minor': 0,
-        'moderate': 0,
-        'severe': 0
-    }
-    
-    for assessment in NIHSSAssessment.objects.all():
-        score = assessment.get_total_score()
-        if score <= 4:
-            severity_counts['minor'] += 1
-        elif score <= 15:
-            severity_counts['moderate'] += 1
-        else:
-            severity_counts['severe'] += 1
+    today = timezone.localdate()
     
     # Recent assessments
-    recent_assessments = NIHSSAssessment.objects.all().order_by('-assessed_at')[:10]
+    recent_assessments = NIHSSAssessment.objects.select_related(
+        'patient', 'assessed_by'
+    ).order_by('-assessed_at')[:10]
     
-    # NIHSS assessments by day (last 7 days)
-    seven_days_ago = today - timedelta(days=7)
-    daily_assessments = []
+    # NIHSS assessments by day (last 7 days by default, up to 90) in one grouped query
+    try:
+        chart_days = min(max(int(request.GET.get('days', 7)), 1), 90)
+    except ValueError:
+        chart_days = 7
     
-    for i in range(7):
-        day = seven_days_ago + timedelta(days=i+1)
-        count = NIHSSAssessment.objects.filter(assessed_at__date=day).count()
-        daily_assessments.append({
-            'day': day.strftime('%a'),
-            'count': count
-        })
+    day_format = '%a' if chart_days <= 7 else '%b %d'
+    daily_assessments = [
+        {'day': point['bucket'].strftime(day_format), 'count': point['value']}
+        for point in time_series(NIHSSAssessment, today - timedelta(days=chart_days - 1), interval='day')
+    ]
     
     return render(request, 'assessments/doctor_dashboard.html', {
         'total_assessments': total_assessments,
@@ -188,5 +201,267 @@ def doctor_dashboard(request):
         'severity_counts': severity_counts,
         'recent_assessments': recent_assessments,
         'daily_assessments': daily_assessments,
+        'chart_days': chart_days,
     })
 
+
+
+def _api_user(request, realm, forbidden_message):
+    """
+    Resolve the staff user calling a device-facing endpoint
+
+    Monitor gateways and tablets send HTTP Basic credentials; browser
+    sessions are accepted too but must then pass the usual CSRF check.
+    Returns (user, error_response).
+    """
+    import base64
+    import binascii
+    from django.contrib.auth import authenticate
+    from django.http import JsonResponse
+    from django.middleware.csrf import CsrfViewMiddleware
+
+    user = None
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() == 'basic':
+        try:
+            username, _, password = base64.b64decode(credentials).decode('utf-8').partition(':')
+        except (binascii.Error, UnicodeDecodeError):
+            username = password = None
+        if username:
+            user = authenticate(request, username=username, password=password)
+    elif request.user.is_authenticated:
+        rejected = CsrfViewMiddleware(lambda request: None).process_view(request, None, (), {})
+        if rejected is not None:
+            return None, rejected
+        user = request.user
+
+    if user is None:
+        response = JsonResponse({'error': "Authentication required."}, status=401)
+        response['WWW-Authenticate'] = f'Basic realm="{realm}"'
+        return None, response
+    if getattr(user, 'role', None) not in ('TECHNICIAN', 'NEUROLOGIST'):
+        return None, JsonResponse({'error': forbidden_message}, status=403)
+    return user, None
+
+
+@csrf_exempt
+@require_POST
+def ingest_vitals(request):
+    """
+    Accept a batch of monitor readings as NDJSON
+
+    Each line is one reading: patient_id, the vital sign fields and an
+    optional ISO 8601 recorded_at. Valid lines are stored even if others
+    are rejected; rejected lines are reported by line number.
+    """
+    from django.http import JsonResponse
+    from .ingest import BatchTooLarge, ingest_vitals as ingest
+
+    user, error_response = _api_user(request, 'vitals', "Only clinical staff can submit vital signs.")
+    if error_response is not None:
+        return error_response
+
+    # Read the body line by line rather than loading it whole
+    try:
+        result = ingest(request, recorded_by=user)
+    except BatchTooLarge as e:
+        return JsonResponse({'error': str(e)}, status=413)
+
+    status = 400 if result['errors'] and not result['created'] else 200
+    return JsonResponse(result, status=status)
+
+
+@login_required
+def vitals_series(request, patient_id):
+    """
+    A patient's vitals as downsampled parallel arrays for trend charts
+
+    Accepts ?hours= (window length, default 72), ?end= (ISO 8601, default
+    now), ?points= (most points per vital, default 300) and ?fields= (comma
+    separated, default all charted vitals).
+    """
+    from datetime import timedelta
+    from django.http import JsonResponse
+    from django.utils import timezone
+    from django.utils.dateparse import parse_datetime
+    from .series import DEFAULT_POINTS, MAX_POINTS, SERIES_FIELDS, vitals_series as build_series
+
+    if getattr(request.user, 'role', None) not in ('TECHNICIAN', 'NEUROLOGIST'):
+        return JsonResponse({'error': "Only clinical staff can view vital signs."}, status=403)
+    patient = get_object_or_404(Patient, id=patient_id)
+
+    try:
+        hours = min(max(int(request.GET.get('hours', 72)), 1), 24 * 90)
+        points = min(max(int(request.GET.get('points', DEFAULT_POINTS)), 3), MAX_POINTS)
+    except ValueError:
+        return JsonResponse({'error': "hours and points must be whole numbers."}, status=400)
+
+    end = timezone.now()
+    if request.GET.get('end'):
+        try:
+            end = parse_datetime(request.GET['end'])
+        except ValueError:
+            end = None
+        if end is None:
+            return JsonResponse({'error': "end must be an ISO 8601 date and time."}, status=400)
+        if timezone.is_naive(end):
+            end = timezone.make_aware(end)
+    start = end - timedelta(hours=hours)
+
+    fields = SERIES_FIELDS
+    if request.GET.get('fields'):
+        fields = request.GET['fields'].split(',')
+        unknown = [field for field in fields if field not in SERIES_FIELDS]
+        if unknown:
+            return JsonResponse({'error': f"Unknown fields: {', '.join(unknown)}."}, status=400)
+
+    return JsonResponse({
+        'patient_id': patient.id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'points': points,
+        **build_series(patient.id, start, end, points, fields),
+    }, json_dumps_params={'separators': (',', ':')})
+
+
+def _upload_user(request):
+    return _api_user(request, 'imaging', "Only clinical staff can upload imaging.")
+
+
+def _upload_response(upload, status=200):
+    from django.http import JsonResponse
+    from .uploads import upload_status
+
+    body = upload_status(upload)
+    response = JsonResponse(body, status=status)
+    response['Upload-Offset'] = str(body['offset'])
+    return response
+
+
+def _get_upload(upload_id, user):
+    """The caller's unexpired upload, or None"""
+    from django.utils import timezone
+    from .models import ImagingUpload
+
+    return ImagingUpload.objects.filter(
+        pk=upload_id, created_by=user, expires_at__gt=timezone.now()
+    ).first()
+
+
+@csrf_exempt
+@require_POST
+def create_imaging_upload(request):
+    """
+    Start a resumable imaging upload
+
+    Takes JSON with patient_id, study_type, filename, size (bytes) and
+    optionally chunk_size and findings. Answers 201 with the upload's
+    status; chunks are then PUT to imaging_upload_chunk and the upload
+    finalized with imaging_upload_finalize.
+    """
+    import json
+    from django.http import JsonResponse
+    from django.urls import reverse
+    from .uploads import UploadError, create_upload
+
+    user, error_response = _upload_user(request)
+    if error_response is not None:
+        return error_response
+
+    try:
+        data = json.loads(request.body)
+        patient_id = int(data['patient_id'])
+        size = int(data['size'])
+        chunk_size = int(data['chunk_size']) if data.get('chunk_size') else None
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({'error': "Send JSON with patient_id, study_type, filename and size."}, status=400)
+
+    patient = Patient.objects.filter(pk=patient_id).first()
+    if patient is None:
+        return JsonResponse({'error': "Unknown patient."}, status=404)
+
+    try:
+        upload = create_upload(
+            patient, user, str(data.get('study_type', '')), str(data.get('filename', '')), size,
+            chunk_size=chunk_size, findings=str(data.get('findings', '')),
+        )
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+
+    response = _upload_response(upload, status=201)
+    response['Location'] = reverse('assessments:imaging_upload', kwargs={'upload_id': upload.id})
+    return response
+
+
+@require_http_methods(['GET', 'HEAD'])
+def imaging_upload(request, upload_id):
+    """Status of an upload: bytes received from the start (offset) and chunks still missing"""
+    from django.http import JsonResponse
+
+    user, error_response = _upload_user(request)
+    if error_response is not None:
+        return error_response
+    upload = _get_upload(upload_id, user)
+    if upload is None:
+        return JsonResponse({'error': "Unknown or expired upload."}, status=404)
+    return _upload_response(upload)
+
+
+@csrf_exempt
+@require_http_methods(['PUT'])
+def imaging_upload_chunk(request, upload_id, index):
+    """
+    Store one chunk of an upload; the body is the chunk's bytes
+
+    An optional X-Chunk-SHA256 header is checked against the body. Sending
+    a chunk again replaces it. Answers with the upload's status.
+    """
+    from django.http import JsonResponse
+    from .uploads import UploadError, write_chunk
+
+    user, error_response = _upload_user(request)
+    if error_response is not None:
+        return error_response
+    upload = _get_upload(upload_id, user)
+    if upload is None:
+        return JsonResponse({'error': "Unknown or expired upload."}, status=404)
+
+    try:
+        length = int(request.headers.get('Content-Length') or 0)
+        # Read from the request stream; request.body would hold the chunk in memory
+        write_chunk(upload, index, request, length, sha256=request.headers.get('X-Chunk-SHA256'))
+    except ValueError:
+        return JsonResponse({'error': "Content-Length must be a whole number."}, status=400)
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    return _upload_response(upload)
+
+
+@csrf_exempt
+@require_POST
+def finalize_imaging_upload(request, upload_id):
+    """
+    Turn a fully received upload into an ImagingStudy
+
+    Answers 201 with the study id; finalizing again returns the same study.
+    """
+    from django.http import JsonResponse
+    from .uploads import UploadError, finalize_upload
+
+    user, error_response = _upload_user(request)
+    if error_response is not None:
+        return error_response
+    upload = _get_upload(upload_id, user)
+    if upload is None:
+        return JsonResponse({'error': "Unknown or expired upload."}, status=404)
+
+    try:
+        study = finalize_upload(upload)
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    return JsonResponse({
+        'study_id': study.id,
+        'patient_id': study.patient_id,
+        'derivatives_status': study.derivatives_status,
+    }, status=201)
+
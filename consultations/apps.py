@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class ConsultationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'consultations'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from .stats import connect_statistics
+        from .thresholds import invalidate_threshold_table
+
+        post_save.connect(invalidate_threshold_table, sender='consultations.VitalSignThreshold',
+                          dispatch_uid='threshold_table_save')
+        post_delete.connect(invalidate_threshold_table, sender='consultations.VitalSignThreshold',
+                            dispatch_uid='threshold_table_delete')
+        connect_statistics()
@@ -0,0 +1,12 @@
+from django.conf import settings
+
+
+def unread_notifications(request):
+    """Expose the current user's unread notification counter, and whether live notifications are on, to every template"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {
+        'unread_notification_count': user.unread_notification_count,
+        'notification_stream': settings.NOTIFICATION_STREAM,
+    }
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.urls import reverse
+
+
+def notification_payload(notification):
+    """JSON-ready summary of a notification for push clients"""
+    if notification.related_consultation_id:
+        url = reverse('consultations:detail', kwargs={'consultation_id': notification.related_consultation_id})
+    else:
+        url = notification.related_url or ''
+    return {
+        'id': notification.id,
+        'type': notification.notification_type,
+        'title': notification.title,
+        'message': notification.message,
+        'url': url,
+        'created_at': notification.created_at.isoformat() if notification.created_at else None,
+    }
+
+
+class NotificationHub:
+    """
+    In-process publish/subscribe hub for new notifications
+
+    Streaming responses subscribe per user and receive payloads on an
+    asyncio queue bound to their event loop. publish() can be called from
+    any thread (sync views run in a worker thread under ASGI), so delivery
+    is handed to each subscriber's loop with call_soon_threadsafe.
+
+    Only clients connected to this process are reached; with several
+    server processes each one delivers to its own subscribers.
+    """
+
+    # Events a slow client may fall behind by before new ones are dropped;
+    # a reconnect with Last-Event-ID catches up from the database
+    QUEUE_SIZE = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, user_id):
+        """Register a queue for a user's notifications; call from the consuming loop"""
+        queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        subscription = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def subscriber_count(self, user_id=None):
+        with self._lock:
+            if user_id is not None:
+                return len(self._subscribers.get(user_id, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, notifications):
+        """Push saved notifications to their recipients' open streams"""
+        with self._lock:
+            if not self._subscribers:
+                return
+            deliveries = [
+                (subscription, notification_payload(notification))
+                for notification in notifications
+                for subscription in self._subscribers.get(notification.user_id, ())
+            ]
+
+        for (loop, queue), payload in deliveries:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, payload)
+            except RuntimeError:
+                # The subscriber's loop has closed; it unsubscribes on its way out
+                pass
+
+
+def _offer(queue, payload):
+    try:
+        queue.put_nowait(payload)
+    except asyncio.QueueFull:
+        pass
+
+
+def format_event(payload):
+    """Encode a payload as a server-sent event carrying its notification id"""
+    return f"id: {payload['id']}\nevent: notification\ndata: {json.dumps(payload)}\n\n"
+
+
+hub = NotificationHub()
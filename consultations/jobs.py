@@ -0,0 +1,228 @@
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, F, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE = 'default'
+DEFAULT_MAX_ATTEMPTS = 5
+
+# A failed job is retried after BACKOFF_BASE, doubling per attempt up to BACKOFF_MAX
+BACKOFF_BASE = timedelta(seconds=15)
+BACKOFF_MAX = timedelta(hours=1)
+
+# A job still running after this is taken to have lost its worker and runs again
+LEASE = timedelta(minutes=15)
+
+# Finished jobs, and so their idempotency keys, are kept this long
+RETENTION = timedelta(days=7)
+
+# Due jobs a worker considers per claim
+CLAIM_BATCH = 20
+
+
+def task(queue=DEFAULT_QUEUE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Mark a module-level function as a background task
+
+    Its queue and attempt limit become the defaults for enqueue(). Tasks take
+    JSON-serialisable keyword arguments and must be safe to run twice, since a
+    job whose worker is lost part-way through is run again.
+    """
+    def decorate(func):
+        func.job_queue = queue
+        func.job_max_attempts = max_attempts
+        return func
+    return decorate
+
+
+def enqueue(func, key=None, delay=None, queue=None, **kwargs):
+    """
+    Queue ``func(**kwargs)`` for a worker
+
+    The job row is inserted in the current transaction, so workers see it
+    exactly when the caller's own writes commit and never if they roll back.
+    While a job enqueued under idempotency ``key`` is kept (see RETENTION),
+    enqueueing under it again does nothing. ``delay`` holds the job back.
+    """
+    from .models import Job
+
+    job = Job(
+        task=f'{func.__module__}.{func.__qualname__}',
+        kwargs=kwargs,
+        queue=queue or getattr(func, 'job_queue', DEFAULT_QUEUE),
+        idempotency_key=key,
+        max_attempts=getattr(func, 'job_max_attempts', DEFAULT_MAX_ATTEMPTS),
+        run_at=timezone.now() + (delay or timedelta()),
+    )
+    # One INSERT OR IGNORE: a repeated key needs no lookup or savepoint
+    Job.objects.bulk_create([job], ignore_conflicts=key is not None)
+
+
+def backoff(attempts):
+    """Wait before retrying a job that has failed ``attempts`` times, jittered so failures spread out"""
+    # The exponent is capped so many attempts cannot overflow the timedelta
+    delay = min(BACKOFF_BASE * 2 ** min(max(attempts - 1, 0), 16), BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1)
+
+
+def claim_job(worker, queues=None, now=None):
+    """
+    Mark the next due job as running for ``worker`` and return it, or None
+
+    Each claim is a conditional UPDATE of a queued row, so no two workers
+    take the same job. A queue listed in JOB_CONCURRENCY runs at most that
+    many jobs at once across all workers; the running count is checked in
+    the same statement, which SQLite's single writer makes exact.
+    """
+    from .models import Job
+
+    now = now or timezone.now()
+    limits = getattr(settings, 'JOB_CONCURRENCY', {})
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+    if queues:
+        due = due.filter(queue__in=queues)
+
+    full = set()
+    for job_id, queue in due.order_by('run_at', 'id').values_list('id', 'queue')[:CLAIM_BATCH]:
+        if queue in full:
+            continue
+        claim = Job.objects.filter(pk=job_id, status=Job.QUEUED)
+        limit = limits.get(queue)
+        if limit is not None:
+            running = (
+                Job.objects.filter(queue=queue, status=Job.RUNNING)
+                .order_by().values('queue').annotate(n=Count('pk')).values('n')
+            )
+            claim = claim.alias(running=Coalesce(Subquery(running), 0)).filter(running__lt=limit)
+        if claim.update(status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1):
+            return Job.objects.get(pk=job_id)
+        if limit is not None:
+            full.add(queue)
+    return None
+
+
+def run_job(job, worker):
+    """
+    Run a claimed job in its own transaction and record how it went
+
+    A failure is retried after backoff() until max_attempts, then the job is
+    left FAILED with its traceback. Returns True when the job succeeded.
+    """
+    from .models import Job
+
+    retry = False
+    try:
+        func = import_string(job.task)
+    except ImportError:
+        error = traceback.format_exc()
+    else:
+        try:
+            with transaction.atomic():
+                func(**job.kwargs)
+        except Exception:
+            error = traceback.format_exc()
+            retry = job.attempts < job.max_attempts
+        else:
+            error = None
+
+    now = timezone.now()
+    # Unless the lease expired and another worker has taken the job since
+    held = Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=worker)
+    released = {'locked_by': '', 'locked_at': None}
+    if error is None:
+        held.update(status=Job.DONE, finished_at=now, last_error='', **released)
+    elif retry:
+        logger.warning("Job %s (%s) failed on attempt %s, will retry", job.pk, job.task, job.attempts)
+        held.update(status=Job.QUEUED, run_at=now + backoff(job.attempts), last_error=error, **released)
+    else:
+        logger.error("Job %s (%s) failed after %s attempts:\n%s", job.pk, job.task, job.attempts, error)
+        held.update(status=Job.FAILED, finished_at=now, last_error=error, **released)
+    return error is None
+
+
+def release_expired_leases(now=None):
+    """Requeue jobs held past LEASE, e.g. by a killed worker, or fail them when out of attempts; returns how many"""
+    from .models import Job
+
+    now = now or timezone.now()
+    expired = Job.objects.filter(status=Job.RUNNING, locked_at__lt=now - LEASE)
+    released = {'locked_by': '', 'locked_at': None}
+    failed = expired.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, finished_at=now, last_error='Worker lost while running the job', **released,
+    )
+    return failed + expired.update(status=Job.QUEUED, run_at=now, **released)
+
+
+def prune_jobs(now=None):
+    """Delete jobs that finished successfully more than RETENTION ago; returns how many"""
+    from .models import Job
+
+    now = now or timezone.now()
+    deleted, _ = Job.objects.filter(status=Job.DONE, finished_at__lt=now - RETENTION).delete()
+    return deleted
+
+
+class Worker:
+    """
+    Claims and runs due jobs until stopped
+
+    Any number of workers, in separate processes or threads, can share the
+    queue. Create each in the thread that runs it. stop() lets the job in
+    hand finish first.
+    """
+
+    # Polls between deleting old finished jobs
+    PRUNE_EVERY = 3600
+
+    def __init__(self, queues=None, name=None, poll_interval=1.0):
+        self.queues = queues or None
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+        self.poll_interval = poll_interval
+        self._stopping = threading.Event()
+
+    def run_once(self):
+        """Claim and run one due job; False when none was due"""
+        job = claim_job(self.name, self.queues)
+        if job is None:
+            return False
+        run_job(job, self.name)
+        return True
+
+    def run(self, burst=False):
+        """Work until stop(), or with ``burst`` until no job is due; returns the jobs run"""
+        ran = polls = 0
+        while not self._stopping.is_set():
+            if not connection.in_atomic_block:
+                # Like a request would: drop a broken connection or one past CONN_MAX_AGE
+                close_old_connections()
+            if polls % self.PRUNE_EVERY == 0:
+                prune_jobs()
+            polls += 1
+            release_expired_leases()
+            while not self._stopping.is_set() and self.run_once():
+                ran += 1
+            if burst:
+                break
+            self._stopping.wait(self.poll_interval)
+        return ran
+
+    def stop(self):
+        self._stopping.set()
+
+
+def run_pending_jobs(queues=None):
+    """Run every due job in this thread and return how many ran, e.g. in tests"""
+    return Worker(queues, name=f'inline:{os.getpid()}:{threading.get_ident()}').run(burst=True)
@@ -0,0 +1,189 @@
+import json
+import math
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+
+from accounts.models import User
+from assessments.models import NIHSSAssessment
+from consultations.models import Consultation, Notification, TPARequest
+from patients.models import Patient
+from stroke_unit.instrumentation import QueryRecorder
+
+
+# Routes that cannot be timed with a plain GET
+SKIP = {
+    'media': "needs a stored file",
+    'logout': "ends the session",
+    'patients:patient_logout': "ends the session",
+    'assessments:ingest_vitals': "POST only",
+    'assessments:imaging_upload_create': "POST only",
+    'assessments:imaging_upload': "needs an upload in progress",
+    'assessments:imaging_upload_chunk': "PUT only",
+    'assessments:imaging_upload_finalize': "POST only",
+    'consultations:notification_stream': "streams until the client disconnects",
+}
+
+# Views run as a neurologist; everything else runs as a technician
+NEUROLOGIST_VIEWS = {
+    'assessments:nihss_list',
+    'assessments:doctor_dashboard',
+    'consultations:update',
+    'consultations:accept_consultation',
+    'consultations:review_tpa',
+    'consultations:administer_tpa',
+    'consultations:mark_notification_read',
+    'consultations:neurologist_dashboard',
+}
+
+# Views a patient reaches through an access-code session rather than a login
+PATIENT_SESSION_VIEWS = {'patients:patient_dashboard'}
+
+
+def routed_views(resolver=None, namespace=''):
+    """Yield (qualified name, URLPattern) for every named route, admin excluded"""
+    resolver = resolver or get_resolver()
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.app_name == 'admin':
+                continue
+            prefix = f'{namespace}{pattern.namespace}:' if pattern.namespace else namespace
+            yield from routed_views(pattern, prefix)
+        elif pattern.name:
+            yield f'{namespace}{pattern.name}', pattern
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time a GET of every named view in stroke_unit/urls.py against the current "
+        "database and write p50/p95 latencies (ms) and query counts to a JSON file. "
+        "Load data with generate_scale_data first; compare runs with --compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help="Timed requests per view (default 20)")
+        parser.add_argument('--warmup', type=int, default=2, help="Untimed requests per view first (default 2)")
+        parser.add_argument('--output', default='benchmark-results.json', help="Where to write the results")
+        parser.add_argument('--compare', help="Earlier results file to print changes against")
+        parser.add_argument('--only', nargs='*', default=None, help="Only these view names, e.g. patients:list")
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1 or options['warmup'] < 0:
+            raise CommandError("--repeat must be at least 1 and --warmup cannot be negative")
+
+        self.users = {}
+        for role in (User.Role.TECHNICIAN, User.Role.NEUROLOGIST):
+            self.users[role] = User.objects.filter(role=role).order_by('id').first()
+            if self.users[role] is None:
+                raise CommandError(f"No {role.lower()} user found; run generate_scale_data first")
+        self.url_kwargs = self.sample_ids()
+
+        results = {}
+        seen = set()
+        for name, pattern in routed_views():
+            if name in seen or name in SKIP or (options['only'] and name not in options['only']):
+                continue
+            seen.add(name)
+            results[name] = self.time_view(name, pattern, options['warmup'], options['repeat'])
+            result = results[name]
+            self.stdout.write(
+                f"{name:45} {result['status']}  p50 {result['p50_ms']:8.2f} ms  "
+                f"p95 {result['p95_ms']:8.2f} ms  {result['queries']} queries"
+            )
+
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'repeat': options['repeat'],
+            'rows': {
+                model._meta.label: model.objects.count()
+                for model in (Patient, NIHSSAssessment, Consultation, TPARequest, Notification)
+            },
+            'views': results,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} views to {options['output']}"))
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def sample_ids(self):
+        """Ids for routes that take one; the newest rows, as a dashboard would show"""
+        def newest(queryset):
+            return queryset.order_by('-id').values_list('id', flat=True).first()
+
+        kwargs = {
+            'patient_id': newest(Patient.objects.all()),
+            'assessment_id': newest(NIHSSAssessment.objects.all()),
+            'consultation_id': newest(Consultation.objects.all()),
+            'tpa_request_id': newest(TPARequest.objects.all()),
+        }
+        missing = [key for key, value in kwargs.items() if value is None]
+        if missing:
+            raise CommandError(f"No rows for {', '.join(missing)}; run generate_scale_data first")
+        return kwargs
+
+    def client_for(self, name):
+        client = Client(HTTP_HOST='localhost', raise_request_exception=False)
+        if name in PATIENT_SESSION_VIEWS:
+            session = client.session
+            session['patient_access_verified'] = True
+            session['patient_id'] = self.url_kwargs['patient_id']
+            session['patient_access_time'] = timezone.now().isoformat()
+            session.save()
+            return client, None
+        role = User.Role.NEUROLOGIST if name in NEUROLOGIST_VIEWS else User.Role.TECHNICIAN
+        client.force_login(self.users[role])
+        return client, self.users[role]
+
+    def time_view(self, name, pattern, warmup, repeat):
+        client, user = self.client_for(name)
+        kwargs = dict(self.url_kwargs)
+        if user is not None:
+            kwargs['notification_id'] = Notification.objects.filter(user=user).order_by('-id').values_list('id', flat=True).first() or 0
+        url = reverse(name, kwargs={key: kwargs[key] for key in pattern.pattern.converters})
+
+        for _ in range(warmup):
+            client.get(url)
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = client.get(url)
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        return {
+            'url': url,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+        }
+
+    def compare(self, path, results):
+        with open(path) as f:
+            previous = json.load(f)['views']
+        self.stdout.write(f"\nChange against {path}:")
+        for name, result in results.items():
+            if name not in previous:
+                continue
+            before = previous[name]
+            self.stdout.write(
+                f"{name:45} p50 {result['p50_ms'] - before['p50_ms']:+8.2f} ms  "
+                f"p95 {result['p95_ms'] - before['p95_ms']:+8.2f} ms  "
+                f"queries {result['queries'] - before['queries']:+d}"
+            )
@@ -0,0 +1,301 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import User
+from assessments.models import ImagingStudy, LabResult, NIHSSAssessment, VitalSigns
+from consultations.models import Consultation, Notification, TPARequest
+from consultations.stats import rebuild_unit_statistics
+from consultations.utils import recount_unread_notifications
+from patients.models import Patient
+
+
+FIRST_NAMES = [
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda',
+    'David', 'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica',
+    'Thomas', 'Sarah', 'Carlos', 'Maria', 'Wei', 'Aisha', 'Omar', 'Priya',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+    'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Wilson', 'Anderson', 'Thomas', 'Taylor',
+    'Moore', 'Jackson', 'Martin', 'Lee', 'Nguyen', 'Patel', 'Khan', 'Chen',
+]
+UNITS = ['STROKE', 'STROKE', 'STROKE', 'ICU', 'ED']
+COMPLAINTS = [
+    'Sudden left-sided weakness', 'Slurred speech and facial droop', 'Acute aphasia',
+    'Right arm numbness', 'Sudden vision loss', 'Severe headache with confusion',
+]
+FINDINGS = [
+    'No acute intracranial hemorrhage', 'Hyperdense MCA sign', 'Early ischemic changes',
+    'Large vessel occlusion', 'Chronic small vessel disease', 'No acute findings',
+]
+# (test name, reference range, low, high, decimal places)
+LAB_TESTS = [
+    ('Glucose', '70-140 mg/dL', 70, 140, 0),
+    ('INR', '0.8-1.2', 0.8, 1.2, 1),
+    ('Platelets', '150-400 x10^9/L', 150, 400, 0),
+    ('Creatinine', '0.6-1.2 mg/dL', 0.6, 1.2, 1),
+]
+
+CONSULTATION_STATUSES = ['REQUESTED', 'IN_PROGRESS', 'COMPLETED', 'COMPLETED', 'COMPLETED', 'CANCELLED']
+TPA_STATUSES = ['REQUESTED', 'APPROVED', 'APPROVED', 'DENIED']
+
+# Minutes between a patient's vital sign readings
+VITALS_INTERVAL = 15
+VITALS_COLUMNS = [
+    'patient', 'recorded_by', 'recorded_at', 'blood_pressure_systolic', 'blood_pressure_diastolic',
+    'heart_rate', 'respiratory_rate', 'temperature', 'oxygen_saturation', 'blood_glucose',
+]
+
+
+def insert_vitals(rows):
+    """
+    Insert vital sign rows (tuples in VITALS_COLUMNS order) with executemany
+
+    Vitals are by far the largest table, and building model instances for
+    millions of rows costs several times more than the inserts themselves.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(VitalSigns._meta.get_field(name).column) for name in VITALS_COLUMNS)
+    placeholders = ', '.join(['%s'] * len(VITALS_COLUMNS))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {quote(VitalSigns._meta.db_table)} ({columns}) VALUES ({placeholders})', rows,
+        )
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the auto_now_add values given instead of stamping now"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now_add', False)
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-create synthetic patients with vitals, NIHSS assessments, imaging, "
+        "labs, consultations, tPA requests and notifications for performance work. "
+        "The same --seed gives the same data (timestamps are relative to the run). "
+        "Rows are bulk inserted, so no threshold alerts are raised; the statistics "
+        "row and unread counters are recounted at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1000, help="Patients to create (default 1000)")
+        parser.add_argument(
+            '--vitals-per-patient', type=int, default=20,
+            help="Vital sign readings per patient (default 20; 50000 patients x 100 is 5M rows)",
+        )
+        parser.add_argument('--staff', type=int, default=10, help="Technicians and neurologists each (default 10)")
+        parser.add_argument('--days', type=int, default=365, help="Spread registrations over this many days")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed (default 0)")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Patients per transaction (default 1000)")
+
+    def handle(self, *args, **options):
+        if options['patients'] < 0 or options['vitals_per_patient'] < 0:
+            raise CommandError("--patients and --vitals-per-patient cannot be negative")
+        if options['batch_size'] < 1 or options['staff'] < 1 or options['days'] < 1:
+            raise CommandError("--batch-size, --staff and --days must be at least 1")
+
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.options = options
+        self.technicians = self.staff(User.Role.TECHNICIAN, 'scale_tech')
+        self.neurologists = self.staff(User.Role.NEUROLOGIST, 'scale_neuro')
+
+        total = options['patients']
+        done = 0
+        models = (Patient, NIHSSAssessment, ImagingStudy, LabResult, Consultation, TPARequest, Notification)
+        with explicit_timestamps(*models):
+            while done < total:
+                count = min(options['batch_size'], total - done)
+                with transaction.atomic():
+                    self.create_batch(count)
+                done += count
+                self.stdout.write(f"Created {done}/{total} patients")
+
+        rebuild_unit_statistics()
+        recount_unread_notifications()
+        self.stdout.write(self.style.SUCCESS(f"Generated data for {total} patients"))
+
+    def staff(self, role, prefix):
+        users = []
+        for i in range(self.options['staff']):
+            user, created = User.objects.get_or_create(
+                username=f'{prefix}_{i}',
+                defaults={'role': role, 'first_name': self.rng.choice(FIRST_NAMES), 'last_name': self.rng.choice(LAST_NAMES)},
+            )
+            if created:
+                user.set_unusable_password()
+                user.save(update_fields=['password'])
+            users.append(user)
+        return users
+
+    def moment(self, start, minutes):
+        """A time up to ``minutes`` after ``start``, never in the future"""
+        return min(start + timedelta(minutes=self.rng.uniform(0, minutes)), self.now)
+
+    def create_batch(self, count):
+        rng = self.rng
+        span = self.options['days'] * 24 * 60
+        today = timezone.localdate(self.now)
+
+        patients = Patient.objects.bulk_create([
+            Patient(
+                first_name=rng.choice(FIRST_NAMES),
+                last_name=rng.choice(LAST_NAMES),
+                date_of_birth=today - timedelta(days=rng.randint(18 * 365, 95 * 365)),
+                gender=rng.choice('MF') if rng.random() < 0.98 else 'O',
+                phone_number=f'555-{rng.randint(0, 9999):04d}',
+                unit=rng.choice(UNITS),
+                registered_by=rng.choice(self.technicians),
+                registration_date=self.now - timedelta(minutes=rng.uniform(0, span)),
+            )
+            for _ in range(count)
+        ])
+
+        vitals, assessments, imaging, labs, consultations = [], [], [], [], []
+        for patient in patients:
+            vitals.extend(self.vitals_for(patient))
+            for _ in range(rng.randint(1, 2)):
+                assessments.append(self.assessment_for(patient))
+            imaging.append(ImagingStudy(
+                patient=patient,
+                study_type=rng.choice(['CT', 'CT', 'CTA', 'MRI', 'MRA']),
+                performed_at=self.moment(patient.registration_date, 60),
+                performed_by=rng.choice(self.technicians),
+                findings=rng.choice(FINDINGS),
+            ))
+            for name, reference, low, high, places in LAB_TESTS:
+                value = round(rng.uniform(low * 0.7, high * 1.3), places)
+                labs.append(LabResult(
+                    patient=patient, test_name=name, test_value=str(value), reference_range=reference,
+                    is_abnormal=not low <= value <= high, recorded_by=rng.choice(self.technicians),
+                    recorded_at=self.moment(patient.registration_date, 120),
+                ))
+            if rng.random() < 0.6:
+                consultations.append(self.consultation_for(patient))
+
+        insert_vitals(vitals)
+        NIHSSAssessment.objects.bulk_create(assessments)
+        ImagingStudy.objects.bulk_create(imaging)
+        LabResult.objects.bulk_create(labs)
+        Consultation.objects.bulk_create(consultations)
+
+        tpa_requests = TPARequest.objects.bulk_create([
+            self.tpa_request_for(consultation)
+            for consultation in consultations
+            if consultation.status != 'CANCELLED' and rng.random() < 0.25
+        ])
+        Notification.objects.bulk_create(self.notifications_for(consultations, tpa_requests))
+
+    def vitals_for(self, patient):
+        rng = self.rng
+        ops = connection.ops
+        # Each patient drifts around their own baseline
+        systolic, diastolic = rng.randint(110, 170), rng.randint(65, 100)
+        heart_rate, saturation = rng.randint(60, 100), rng.randint(93, 99)
+        start = patient.registration_date
+        rows = []
+        for i in range(self.options['vitals_per_patient']):
+            recorded_at = start + timedelta(minutes=i * VITALS_INTERVAL)
+            if recorded_at > self.now:
+                break
+            temperature = Decimal(str(round(rng.gauss(36.9, 0.4), 1)))
+            rows.append((
+                patient.id,
+                rng.choice(self.technicians).id,
+                ops.adapt_datetimefield_value(recorded_at),
+                max(70, int(rng.gauss(systolic, 12))),
+                max(40, int(rng.gauss(diastolic, 8))),
+                max(35, int(rng.gauss(heart_rate, 8))),
+                max(8, int(rng.gauss(16, 3))),
+                ops.adapt_decimalfield_value(temperature, 4, 1),
+                min(100, int(rng.gauss(saturation, 2))),
+                max(40, int(rng.gauss(130, 35))),
+            ))
+        return rows
+
+    def assessment_for(self, patient):
+        # Most items score 0, so most strokes come out minor
+        scores = {}
+        for field in NIHSSAssessment._meta.concrete_fields:
+            if field.choices and field.name != 'severity':
+                values = [value for value, _ in field.choices]
+                scores[field.name] = values[0] if self.rng.random() < 0.7 else self.rng.choice(values)
+        assessment = NIHSSAssessment(
+            patient=patient, assessed_by=self.rng.choice(self.technicians),
+            assessed_at=self.moment(patient.registration_date, 90), **scores,
+        )
+        # bulk_create skips save(), which keeps these two up to date
+        assessment.total_score = assessment.get_total_score()
+        assessment.severity = NIHSSAssessment.severity_for_score(assessment.total_score)
+        return assessment
+
+    def consultation_for(self, patient):
+        rng = self.rng
+        status = rng.choice(CONSULTATION_STATUSES)
+        requested_at = self.moment(patient.registration_date, 30)
+        consultation = Consultation(
+            patient=patient, requested_by=rng.choice(self.technicians), status=status,
+            chief_complaint=rng.choice(COMPLAINTS), requested_at=requested_at,
+        )
+        if status != 'REQUESTED' or rng.random() < 0.3:
+            consultation.neurologist = rng.choice(self.neurologists)
+        if status in ('IN_PROGRESS', 'COMPLETED'):
+            consultation.started_at = self.moment(requested_at, 20)
+        if status == 'COMPLETED':
+            consultation.completed_at = self.moment(consultation.started_at, 60)
+            consultation.diagnosis = 'Acute ischemic stroke'
+        return consultation
+
+    def tpa_request_for(self, consultation):
+        rng = self.rng
+        status = rng.choice(TPA_STATUSES)
+        tpa_request = TPARequest(
+            consultation=consultation, requested_by=consultation.requested_by, status=status,
+            justification='Within treatment window, no contraindications',
+            requested_at=self.moment(consultation.requested_at, 30),
+        )
+        if status != 'REQUESTED':
+            tpa_request.reviewed_by = consultation.neurologist or rng.choice(self.neurologists)
+            tpa_request.reviewed_at = self.moment(tpa_request.requested_at, 15)
+        if status == 'APPROVED' and rng.random() < 0.8:
+            tpa_request.administered = True
+            tpa_request.administered_by = rng.choice(self.technicians)
+            tpa_request.administered_at = self.moment(tpa_request.reviewed_at, 20)
+        return tpa_request
+
+    def notifications_for(self, consultations, tpa_requests):
+        rng = self.rng
+        notifications = []
+        for consultation in consultations:
+            notifications.append(Notification(
+                user=consultation.neurologist or rng.choice(self.neurologists),
+                notification_type='CONSULTATION', title='New Consultation Request',
+                message=f'Consultation requested for {consultation.patient}',
+                related_consultation=consultation, created_at=consultation.requested_at,
+                is_read=consultation.status != 'REQUESTED' or rng.random() < 0.5,
+            ))
+        for tpa_request in tpa_requests:
+            notifications.append(Notification(
+                user=tpa_request.requested_by, notification_type='TPA', title=f'tPA Request {tpa_request.status.title()}',
+                message=f'tPA request for {tpa_request.consultation.patient} is {tpa_request.status.lower()}',
+                related_tpa_request=tpa_request, created_at=tpa_request.reviewed_at or tpa_request.requested_at,
+                is_read=rng.random() < 0.7,
+            ))
+        return notifications
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from consultations.stats import rebuild_unit_statistics
+
+
+class Command(BaseCommand):
+    help = "Recount the dashboard statistics row from the patient, consultation, tPA and NIHSS tables"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            values = rebuild_unit_statistics()
+        for field, value in values.items():
+            self.stdout.write(f"{field}: {value}")
+        self.stdout.write(self.style.SUCCESS("Unit statistics rebuilt"))
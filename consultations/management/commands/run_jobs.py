@@ -0,0 +1,62 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from consultations.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs (notifications, vital-sign checks, imaging derivatives) as they come due. "
+        "Start as many as needed; per-queue limits in JOB_CONCURRENCY hold across all of them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue', action='append', dest='queues',
+            help="Only run jobs from this queue; repeat for several (default: all)",
+        )
+        parser.add_argument('--threads', type=int, default=1, help="Jobs to run at once (default %(default)s)")
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help="Seconds to wait when no job is due (default %(default)s)",
+        )
+        parser.add_argument('--burst', action='store_true', help="Exit once no job is due")
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1:
+            raise CommandError("--threads must be at least 1")
+        if options['poll_interval'] <= 0:
+            raise CommandError("--poll-interval must be positive")
+
+        workers = []
+        ran = []
+        ready = threading.Lock()
+
+        def work():
+            worker = Worker(options['queues'], poll_interval=options['poll_interval'])
+            with ready:
+                workers.append(worker)
+            try:
+                ran.append(worker.run(burst=options['burst']))
+            finally:
+                # Each thread has its own connection
+                connection.close()
+
+        def stop(signum, frame):
+            self.stdout.write("Stopping once the running jobs finish")
+            with ready:
+                for worker in workers:
+                    worker.stop()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        threads = [threading.Thread(target=work, name=f'jobs-{n}') for n in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.stdout.write(self.style.SUCCESS(f"Ran {sum(ran)} jobs"))
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.10 on 2026-10-18 19:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0005_patient_unit'),
+        ('consultations', '0003_list_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VitalSignThreshold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parameter', models.CharField(choices=[('blood_pressure_systolic', 'Systolic BP'), ('blood_pressure_diastolic', 'Diastolic BP'), ('heart_rate', 'Heart Rate'), ('respiratory_rate', 'Respiratory Rate'), ('temperature', 'Temperature'), ('oxygen_saturation', 'Oxygen Saturation'), ('blood_glucose', 'Blood Glucose')], max_length=30)),
+                ('unit', models.CharField(blank=True, max_length=20)),
+                ('min_value', models.FloatField(blank=True, null=True)),
+                ('max_value', models.FloatField(blank=True, null=True)),
+                ('criticality', models.CharField(blank=True, choices=[('WARNING', 'Warning'), ('CRITICAL', 'Critical')], max_length=10)),
+                ('low_message', models.CharField(blank=True, max_length=200)),
+                ('high_message', models.CharField(blank=True, max_length=200)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('patient', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='vital_sign_thresholds', to='patients.patient')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='vitalsignthreshold',
+            constraint=models.UniqueConstraint(condition=models.Q(('patient__isnull', False)), fields=('parameter', 'patient'), name='threshold_patient_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='vitalsignthreshold',
+            constraint=models.UniqueConstraint(condition=models.Q(('patient__isnull', True)), fields=('parameter', 'unit'), name='threshold_unit_unique'),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 4.2.10 on 2026-10-18 19:55
+
+from datetime import datetime, time
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+
+def build_statistics(apps, schema_editor):
+    # A frozen copy of consultations.stats.compute_unit_statistics as of this migration
+    Patient = apps.get_model('patients', 'Patient')
+    Consultation = apps.get_model('consultations', 'Consultation')
+    TPARequest = apps.get_model('consultations', 'TPARequest')
+    NIHSSAssessment = apps.get_model('assessments', 'NIHSSAssessment')
+    UnitStatistics = apps.get_model('consultations', 'UnitStatistics')
+
+    today = timezone.localdate()
+    start = timezone.make_aware(datetime.combine(today, time.min))
+
+    values = {'day': today}
+    values.update(Patient.objects.aggregate(
+        total_patients=Count('pk'),
+        patients_today=Count('pk', filter=Q(registration_date__gte=start)),
+    ))
+    values.update(Consultation.objects.aggregate(
+        consultations_requested=Count('pk', filter=Q(status='REQUESTED')),
+        consultations_in_progress=Count('pk', filter=Q(status='IN_PROGRESS')),
+        consultations_completed=Count('pk', filter=Q(status='COMPLETED')),
+        consultations_cancelled=Count('pk', filter=Q(status='CANCELLED')),
+        consultations_unassigned=Count('pk', filter=Q(status='REQUESTED', neurologist__isnull=True)),
+    ))
+    values.update(TPARequest.objects.aggregate(
+        tpa_requested=Count('pk', filter=Q(status='REQUESTED')),
+        tpa_approved=Count('pk', filter=Q(status='APPROVED')),
+        tpa_denied=Count('pk', filter=Q(status='DENIED')),
+        tpa_administered=Count('pk', filter=Q(administered=True)),
+    ))
+    values.update(NIHSSAssessment.objects.aggregate(
+        total_assessments=Count('pk'),
+        assessments_today=Count('pk', filter=Q(assessed_at__gte=start)),
+        nihss_minor=Count('pk', filter=Q(severity='MINOR')),
+        nihss_moderate=Count('pk', filter=Q(severity='MODERATE')),
+        nihss_severe=Count('pk', filter=Q(severity='SEVERE')),
+        nihss_score_total=Sum('total_score'),
+    ))
+    values['nihss_score_total'] = values['nihss_score_total'] or 0
+    UnitStatistics.objects.update_or_create(pk=1, defaults=values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assessments', '0003_nihss_total_score_severity'),
+        ('consultations', '0004_vital_sign_thresholds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnitStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(null=True)),
+                ('total_patients', models.IntegerField(default=0)),
+                ('patients_today', models.IntegerField(default=0)),
+                ('consultations_requested', models.IntegerField(default=0)),
+                ('consultations_in_progress', models.IntegerField(default=0)),
+                ('consultations_completed', models.IntegerField(default=0)),
+                ('consultations_cancelled', models.IntegerField(default=0)),
+                ('consultations_unassigned', models.IntegerField(default=0)),
+                ('tpa_requested', models.IntegerField(default=0)),
+                ('tpa_approved', models.IntegerField(default=0)),
+                ('tpa_denied', models.IntegerField(default=0)),
+                ('tpa_administered', models.IntegerField(default=0)),
+                ('total_assessments', models.IntegerField(default=0)),
+                ('assessments_today', models.IntegerField(default=0)),
+                ('nihss_minor', models.IntegerField(default=0)),
+                ('nihss_moderate', models.IntegerField(default=0)),
+                ('nihss_severe', models.IntegerField(default=0)),
+                ('nihss_score_total', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Unit statistics',
+            },
+        ),
+        migrations.RunPython(build_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.10 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultations', '0005_unit_statistics'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['status', '-requested_at', '-id'], name='consult_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['neurologist', 'status', '-started_at'], name='consult_neuro_started_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['neurologist', 'status', '-completed_at'], name='consult_neuro_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user', '-created_at'], name='notif_user_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tparequest',
+            index=models.Index(fields=['status', '-requested_at'], name='tpa_status_idx'),
+        ),
+    ]
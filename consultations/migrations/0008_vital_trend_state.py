@@ -0,0 +1,23 @@
+# Generated by Django 4.2.10 on 2026-10-18 20:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0006_access_code_sequence'),
+        ('consultations', '0007_background_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VitalTrendState',
+            fields=[
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='vital_trend_state', serialize=False, to='patients.patient')),
+                ('state', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
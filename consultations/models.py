@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from patients.models import Patient
 from accounts.models import User
 
@@ -29,6 +30,15 @@ class Consultation(models.Model):
     
     class Meta:
         ordering = ['-requested_at']
+        indexes = [
+            # Keyset pagination of the consultation list
+            models.Index(fields=['-requested_at', '-id'], name='consult_requested_idx'),
+            # Status-filtered list pages and the pending queue
+            models.Index(fields=['status', '-requested_at', '-id'], name='consult_status_idx'),
+            # A neurologist's dashboard counters and panels
+            models.Index(fields=['neurologist', 'status', '-started_at'], name='consult_neuro_started_idx'),
+            models.Index(fields=['neurologist', 'status', '-completed_at'], name='consult_neuro_completed_idx'),
+        ]
 
 class TPARequest(models.Model):
     STATUS_CHOICES = [
@@ -61,6 +71,10 @@ class TPARequest(models.Model):
         ordering = ['-requested_at']
         verbose_name = "tPA Request"
         verbose_name_plural = "tPA Requests"
+        indexes = [
+            # Pending tPA queues on both dashboards
+            models.Index(fields=['status', '-requested_at'], name='tpa_status_idx'),
+        ]
 
 class Notification(models.Model):
     TYPE_CHOICES = [
@@ -84,4 +98,169 @@ class Notification(models.Model):
         return f"{self.notification_type} notification for {self.user.username}"
     
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of a user's notifications
+            models.Index(fields=['user', '-created_at', '-id'], name='notif_user_created_idx'),
+            # A user's unread notifications, e.g. when marking them all read
+            models.Index(
+                fields=['user', '-created_at'], condition=models.Q(is_read=False), name='notif_user_unread_idx',
+            ),
+        ]
+
+class VitalSignThreshold(models.Model):
+    """
+    Override of a default vital-sign alert rule (see consultations.thresholds)
+
+    A row with neither unit nor patient replaces the default everywhere, a
+    unit row applies to that unit's patients and a patient row to one
+    patient. Empty fields inherit from the next broader rule.
+    """
+    PARAMETER_CHOICES = [
+        ('blood_pressure_systolic', 'Systolic BP'),
+        ('blood_pressure_diastolic', 'Diastolic BP'),
+        ('heart_rate', 'Heart Rate'),
+        ('respiratory_rate', 'Respiratory Rate'),
+        ('temperature', 'Temperature'),
+        ('oxygen_saturation', 'Oxygen Saturation'),
+        ('blood_glucose', 'Blood Glucose'),
+    ]
+    
+    CRITICALITY_CHOICES = [
+        ('WARNING', 'Warning'),
+        ('CRITICAL', 'Critical'),
+    ]
+    
+    parameter = models.CharField(max_length=30, choices=PARAMETER_CHOICES)
+    unit = models.CharField(max_length=20, blank=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, null=True, blank=True, related_name='vital_sign_thresholds')
+    min_value = models.FloatField(null=True, blank=True)
+    max_value = models.FloatField(null=True, blank=True)
+    criticality = models.CharField(max_length=10, choices=CRITICALITY_CHOICES, blank=True)
+    # Templates receive {value}
+    low_message = models.CharField(max_length=200, blank=True)
+    high_message = models.CharField(max_length=200, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        scope = self.patient or self.unit or 'all patients'
+        return f"{self.get_parameter_display()} threshold for {scope}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['parameter', 'patient'], condition=models.Q(patient__isnull=False),
+                name='threshold_patient_unique'
+            ),
+            models.UniqueConstraint(
+                fields=['parameter', 'unit'], condition=models.Q(patient__isnull=True),
+                name='threshold_unit_unique'
+            ),
+        ]
+
+
+class VitalTrendState(models.Model):
+    """
+    A patient's rolling vital-sign windows (see consultations.trends)
+
+    Kept in the database so monitor ingest and the job worker, in different
+    processes, feed the same windows.
+    """
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, primary_key=True, related_name='vital_trend_state')
+    state = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Vital sign trends for {self.patient}"
+
+class UnitStatistics(models.Model):
+    """
+    Single-row summary of unit-wide counts read by the dashboards
+
+    Kept current by save/delete hooks (see consultations.stats) and rebuilt
+    from the base tables with ``manage.py rebuild_unit_statistics``. The
+    *_today counters belong to ``day`` and restart when the date changes.
+    """
+    day = models.DateField(null=True)
+    
+    total_patients = models.IntegerField(default=0)
+    patients_today = models.IntegerField(default=0)
+    
+    consultations_requested = models.IntegerField(default=0)
+    consultations_in_progress = models.IntegerField(default=0)
+    consultations_completed = models.IntegerField(default=0)
+    consultations_cancelled = models.IntegerField(default=0)
+    # Requested and not yet picked up by a neurologist
+    consultations_unassigned = models.IntegerField(default=0)
+    
+    tpa_requested = models.IntegerField(default=0)
+    tpa_approved = models.IntegerField(default=0)
+    tpa_denied = models.IntegerField(default=0)
+    tpa_administered = models.IntegerField(default=0)
+    
+    total_assessments = models.IntegerField(default=0)
+    assessments_today = models.IntegerField(default=0)
+    nihss_minor = models.IntegerField(default=0)
+    nihss_moderate = models.IntegerField(default=0)
+    nihss_severe = models.IntegerField(default=0)
+    nihss_score_total = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"Unit statistics for {self.day}"
+    
+    @property
+    def average_nihss_score(self):
+        if not self.total_assessments:
+            return 0
+        return round(self.nihss_score_total / self.total_assessments, 1)
+    
+    class Meta:
+        verbose_name_plural = "Unit statistics"
+
+
+class Job(models.Model):
+    """
+    A unit of background work, run by ``manage.py run_jobs`` (see consultations.jobs)
+
+    Jobs are written in the transaction that enqueues them, so a worker only
+    sees one once that work has committed and never if it rolled back.
+    """
+    QUEUED = 'QUEUED'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    
+    # Dotted path of the task function
+    task = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    queue = models.CharField(max_length=50, default='default')
+    # Enqueueing again under a key already used adds no second job
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.task} ({self.get_status_display()})"
+    
+    class Meta:
+        indexes = [
+            # Due jobs in the order workers claim them
+            models.Index(fields=['run_at', 'id'], condition=models.Q(status='QUEUED'), name='job_due_idx'),
+            # Running jobs per queue, for concurrency limits and expired leases
+            models.Index(fields=['queue', 'locked_at'], condition=models.Q(status='RUNNING'), name='job_running_idx'),
+            # Finished jobs past retention
+            models.Index(fields=['finished_at'], condition=models.Q(status='DONE'), name='job_done_idx'),
+        ]
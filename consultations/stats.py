@@ -0,0 +1,216 @@
+from datetime import datetime, time
+
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.utils import timezone
+
+
+# Counters that only cover records created on UnitStatistics.day
+DAILY_FIELDS = ['patients_today', 'assessments_today']
+
+
+def _local_day(moment):
+    return timezone.localdate(moment) if moment else None
+
+
+def patient_counts(values):
+    return {'total_patients': 1}, _local_day(values['registration_date']), {'patients_today': 1}
+
+
+def consultation_counts(values):
+    counts = {f"consultations_{values['status'].lower()}": 1}
+    if values['status'] == 'REQUESTED' and values['neurologist_id'] is None:
+        counts['consultations_unassigned'] = 1
+    return counts, None, {}
+
+
+def tpa_counts(values):
+    counts = {f"tpa_{values['status'].lower()}": 1}
+    if values['administered']:
+        counts['tpa_administered'] = 1
+    return counts, None, {}
+
+
+def assessment_counts(values):
+    counts = {
+        'total_assessments': 1,
+        f"nihss_{values['severity'].lower()}": 1,
+        'nihss_score_total': values['total_score'],
+    }
+    return counts, _local_day(values['assessed_at']), {'assessments_today': 1}
+
+
+# model label: (fields the counts depend on, function giving a row's contribution)
+TRACKED_MODELS = {
+    'patients.Patient': (['registration_date'], patient_counts),
+    'consultations.Consultation': (['status', 'neurologist_id'], consultation_counts),
+    'consultations.TPARequest': (['status', 'administered'], tpa_counts),
+    'assessments.NIHSSAssessment': (['severity', 'total_score', 'assessed_at'], assessment_counts),
+}
+
+
+def _snapshot(instance, fields):
+    # Read straight from __dict__ so deferred fields are never loaded here
+    values = instance.__dict__
+    if any(field not in values for field in fields):
+        return None
+    return {field: values[field] for field in fields}
+
+
+def _contribution(label, values):
+    """(totals, daily) deltas a row with ``values`` adds to the statistics"""
+    fields, counts = TRACKED_MODELS[label]
+    totals, day, daily = counts(values)
+    if day != timezone.localdate():
+        daily = {}
+    return totals, daily
+
+
+def apply_deltas(totals, daily=None):
+    """Add {field: delta} changes to the statistics row in one UPDATE"""
+    from .models import UnitStatistics
+
+    # Statuses outside the model's choices have no counter
+    known = {field.name for field in UnitStatistics._meta.concrete_fields}
+    daily = daily or {}
+    updates = {field: F(field) + delta for field, delta in totals.items() if delta and field in known}
+    if not updates and not any(daily.values()):
+        return
+
+    today = timezone.localdate()
+    if any(daily.values()):
+        # Counters left over from an earlier day restart from this change
+        for field in DAILY_FIELDS:
+            delta = daily.get(field, 0)
+            updates[field] = Case(When(day=today, then=F(field) + delta), default=Value(max(delta, 0)))
+        updates['day'] = Value(today)
+
+    if not UnitStatistics.objects.filter(pk=1).update(**updates):
+        rebuild_unit_statistics()
+
+
+def _difference(before, after):
+    changes = dict(after)
+    for field, value in before.items():
+        changes[field] = changes.get(field, 0) - value
+    return changes
+
+
+def record_saved(sender, instance, created, **kwargs):
+    label = sender._meta.label
+    fields, _ = TRACKED_MODELS[label]
+    after = _snapshot(instance, fields)
+    if after is None:
+        # Saved with some tracked field deferred; counts cannot be adjusted safely
+        return
+    before = None if created else getattr(instance, '_stats_snapshot', None)
+
+    new_totals, new_daily = _contribution(label, after)
+    if before is None:
+        apply_deltas(new_totals, new_daily)
+    elif before != after:
+        old_totals, old_daily = _contribution(label, before)
+        apply_deltas(_difference(old_totals, new_totals), _difference(old_daily, new_daily))
+    instance._stats_snapshot = after
+
+
+def record_deleted(sender, instance, **kwargs):
+    label = sender._meta.label
+    fields, _ = TRACKED_MODELS[label]
+    values = _snapshot(instance, fields) or getattr(instance, '_stats_snapshot', None)
+    if values is None:
+        # Never stored, so it counted for nothing
+        return
+    totals, daily = _contribution(label, values)
+    apply_deltas(
+        {field: -delta for field, delta in totals.items()},
+        {field: -delta for field, delta in daily.items()},
+    )
+
+
+def remember_loaded_values(sender, instance, **kwargs):
+    fields, _ = TRACKED_MODELS[sender._meta.label]
+    instance._stats_snapshot = _snapshot(instance, fields)
+
+
+def remember_stored_values(sender, instance, **kwargs):
+    """
+    Read the stored values of a row loaded with tracked fields deferred, so
+    saving or deleting it can adjust the counts by its old contribution
+    """
+    if getattr(instance, '_stats_snapshot', None) is not None or instance.pk is None:
+        return
+    fields, _ = TRACKED_MODELS[sender._meta.label]
+    instance._stats_snapshot = sender._base_manager.filter(pk=instance.pk).values(*fields).first()
+
+
+def connect_statistics():
+    for label in TRACKED_MODELS:
+        uid = f'unit_stats_{label}'
+        post_init.connect(remember_loaded_values, sender=label, dispatch_uid=f'{uid}_init')
+        pre_save.connect(remember_stored_values, sender=label, dispatch_uid=f'{uid}_pre_save')
+        pre_delete.connect(remember_stored_values, sender=label, dispatch_uid=f'{uid}_pre_delete')
+        post_save.connect(record_saved, sender=label, dispatch_uid=f'{uid}_save')
+        post_delete.connect(record_deleted, sender=label, dispatch_uid=f'{uid}_delete')
+
+
+def compute_unit_statistics():
+    """Count every statistic from the base tables (a handful of aggregate queries)"""
+    from assessments.models import NIHSSAssessment
+    from patients.models import Patient
+    from .models import Consultation, TPARequest
+
+    today = timezone.localdate()
+    start = timezone.make_aware(datetime.combine(today, time.min))
+
+    values = {'day': today}
+    values.update(Patient.objects.aggregate(
+        total_patients=Count('pk'),
+        patients_today=Count('pk', filter=Q(registration_date__gte=start)),
+    ))
+    values.update(Consultation.objects.aggregate(
+        consultations_requested=Count('pk', filter=Q(status='REQUESTED')),
+        consultations_in_progress=Count('pk', filter=Q(status='IN_PROGRESS')),
+        consultations_completed=Count('pk', filter=Q(status='COMPLETED')),
+        consultations_cancelled=Count('pk', filter=Q(status='CANCELLED')),
+        consultations_unassigned=Count('pk', filter=Q(status='REQUESTED', neurologist__isnull=True)),
+    ))
+    values.update(TPARequest.objects.aggregate(
+        tpa_requested=Count('pk', filter=Q(status='REQUESTED')),
+        tpa_approved=Count('pk', filter=Q(status='APPROVED')),
+        tpa_denied=Count('pk', filter=Q(status='DENIED')),
+        tpa_administered=Count('pk', filter=Q(administered=True)),
+    ))
+    values.update(NIHSSAssessment.objects.aggregate(
+        total_assessments=Count('pk'),
+        assessments_today=Count('pk', filter=Q(assessed_at__gte=start)),
+        nihss_minor=Count('pk', filter=Q(severity='MINOR')),
+        nihss_moderate=Count('pk', filter=Q(severity='MODERATE')),
+        nihss_severe=Count('pk', filter=Q(severity='SEVERE')),
+        nihss_score_total=Sum('total_score'),
+    ))
+    values['nihss_score_total'] = values['nihss_score_total'] or 0
+    return values
+
+
+def rebuild_unit_statistics():
+    """Recount the statistics row from scratch; returns the new values"""
+    from .models import UnitStatistics
+
+    values = compute_unit_statistics()
+    UnitStatistics.objects.update_or_create(pk=1, defaults=values)
+    return values
+
+
+def get_unit_statistics():
+    """The statistics row, with daily counters zeroed if they belong to an earlier day"""
+    from .models import UnitStatistics
+
+    stats = UnitStatistics.objects.filter(pk=1).first()
+    if stats is None:
+        rebuild_unit_statistics()
+        stats = UnitStatistics.objects.get(pk=1)
+    if stats.day != timezone.localdate():
+        for field in DAILY_FIELDS:
+            setattr(stats, field, 0)
+    return stats
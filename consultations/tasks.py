@@ -0,0 +1,116 @@
+from .jobs import task
+from .utils import check_vital_signs_batch, create_notification, dispatch_notifications
+
+
+@task(queue='vitals')
+def check_vital_signs(vital_signs_ids):
+    """Check new vital signs against thresholds and trends, alerting staff to findings"""
+    from assessments.models import VitalSigns
+
+    records = list(
+        VitalSigns.objects.filter(pk__in=vital_signs_ids)
+        .select_related('patient').order_by('recorded_at', 'id')
+    )
+    check_vital_signs_batch(records)
+
+
+@task(queue='notifications')
+def notify_consultation_requested(consultation_id):
+    """Tell every neurologist about a new consultation request (one bulk insert)"""
+    from accounts.models import User
+    from .models import Consultation, Notification
+
+    consultation = Consultation.objects.select_related('patient').filter(pk=consultation_id).first()
+    if consultation is None:
+        return
+    patient = consultation.patient
+    dispatch_notifications([
+        Notification(
+            user=neurologist,
+            notification_type='CONSULTATION',
+            title='New Consultation Request',
+            message=f'New consultation requested for {patient.first_name} {patient.last_name}',
+            related_consultation=consultation
+        )
+        for neurologist in User.objects.filter(role='NEUROLOGIST')
+    ])
+
+
+@task(queue='notifications')
+def notify_consultation_updated(consultation_id, status, completed=False):
+    """
+    Tell the requesting technician a consultation moved to ``status``
+
+    Parameters:
+    consultation_id: The consultation that changed
+    status: Its status when the change was saved
+    completed: True when the neurologist completed it with their findings
+    """
+    from .models import Consultation
+
+    consultation = Consultation.objects.select_related('patient', 'requested_by').filter(pk=consultation_id).first()
+    if consultation is None or not consultation.requested_by:
+        return
+    patient = consultation.patient
+    if completed:
+        title = 'Consultation Completed'
+        message = f'Consultation for {patient.first_name} {patient.last_name} has been completed.'
+    else:
+        title = 'Consultation Update'
+        message = (f'Consultation for {patient.first_name} {patient.last_name} status updated to '
+                   f'{dict(Consultation.STATUS_CHOICES).get(status, status)}.')
+    create_notification(
+        user=consultation.requested_by,
+        notification_type='CONSULTATION',
+        title=title,
+        message=message,
+        related_consultation=consultation
+    )
+
+
+@task(queue='notifications')
+def notify_tpa_reviewed(tpa_request_id, status, reviewer_name):
+    """Tell the requesting technician, and the patient if they have an account, a tPA request was reviewed"""
+    from .models import TPARequest
+
+    tpa_request = TPARequest.objects.select_related(
+        'requested_by', 'consultation__patient__user_account'
+    ).filter(pk=tpa_request_id).first()
+    if tpa_request is None:
+        return
+    patient = tpa_request.consultation.patient
+    if tpa_request.requested_by:
+        create_notification(
+            user=tpa_request.requested_by,
+            notification_type='TPA',
+            title='tPA Request Reviewed',
+            message=f'tPA request for {patient.get_full_name()} has been {status.lower()}.',
+            related_tpa_request=tpa_request
+        )
+    if patient.user_account:
+        create_notification(
+            user=patient.user_account,
+            notification_type='TPA',
+            title='tPA Request Update',
+            message=f'Your tPA request has been {status.lower()} by Dr. {reviewer_name}.',
+            related_tpa_request=tpa_request
+        )
+
+
+@task(queue='notifications')
+def notify_tpa_administered(tpa_request_id):
+    """Tell the patient, if they have an account, that tPA was given"""
+    from .models import TPARequest
+
+    tpa_request = TPARequest.objects.select_related(
+        'consultation__patient__user_account'
+    ).filter(pk=tpa_request_id).first()
+    if tpa_request is None or not tpa_request.consultation.patient.user_account:
+        return
+    create_notification(
+        user=tpa_request.consultation.patient.user_account,
+        notification_type='TPA',
+        title='tPA Administered',
+        message='tPA has been administered for your stroke treatment.',
+        related_tpa_request=tpa_request
+    )
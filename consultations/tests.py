@@ -1,3 +1,921 @@
-from django.test import TestCase
+import asyncio
+import gc
+import json
+import math
+import random
+import statistics
+import tempfile
+import threading
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from assessments.models import NIHSSAssessment, VitalSigns
+from assessments.tests import NIHSS_ITEMS
+from patients.models import Patient
+from stroke_unit.instrumentation import QueryRecorder, fingerprint
+from stroke_unit.testing import QueryBudgetMixin, QueryPlanMixin
+from .events import hub
+from .jobs import backoff, claim_job, enqueue, release_expired_leases, run_job, run_pending_jobs, task
+from .models import (Consultation, Job, Notification, TPARequest, UnitStatistics, VitalSignThreshold,
+                     VitalTrendState)
+from .stats import compute_unit_statistics, get_unit_statistics
+from .tasks import check_vital_signs
+from .thresholds import THRESHOLD_CACHE_KEY, ThresholdTable, load_threshold_table, scan_vital_signs
+from .trends import RollingWindow, update_trends
+from .utils import create_notification, recount_unread_notifications
+
+
+class AlertFanoutBenchmarkTests(TestCase):
+    """Abnormal-vital fan-out cost must not grow with staff headcount"""
+
+    # The largest headcount's fan-out spans several SQLite bulk-insert batches
+    HEADCOUNTS = [4, 16, 40, 120]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(
+            first_name='Test', last_name='Patient',
+            date_of_birth=date(1950, 1, 1), gender='F'
+        )
+
+    def setUp(self):
+        # The threshold rule table is cached per process; measure warm
+        load_threshold_table()
+
+    def _add_staff(self, count):
+        existing = User.objects.exclude(role=User.Role.PATIENT).count()
+        User.objects.bulk_create([
+            User(
+                username=f'staff{existing + i}',
+                role=User.Role.TECHNICIAN if i % 2 else User.Role.NEUROLOGIST
+            )
+            for i in range(count - existing)
+        ])
+
+    def _record_abnormal_vitals(self):
+        # Three abnormal parameters: systolic, heart rate and oxygen saturation
+        return VitalSigns.objects.create(
+            patient=self.patient,
+            blood_pressure_systolic=200,
+            blood_pressure_diastolic=80,
+            heart_rate=130,
+            respiratory_rate=16,
+            temperature=37.0,
+            oxygen_saturation=88,
+        )
+
+    def test_query_count_is_flat_as_headcount_grows(self):
+        fields = [f for f in Notification._meta.concrete_fields if not f.primary_key]
+        for headcount in self.HEADCOUNTS:
+            self._add_staff(headcount)
+            Notification.objects.all().delete()
+
+            # Saving only inserts the reading and the job that checks it
+            with self.assertNumQueries(2):
+                vitals = self._record_abnormal_vitals()
+
+            technicians = headcount // 2
+            neurologists = headcount - technicians
+            expected = 3 * technicians + 2 * neurologists
+            # SQLite caps the parameters per statement, so the bulk insert is
+            # split into batches; nothing else grows with headcount
+            batches = math.ceil(expected / connection.ops.bulk_batch_size(fields, [None] * expected))
+
+            # vitals SELECT, trend state SELECT and upsert, recipient SELECT,
+            # the bulk notification INSERT(s), one unread-counter UPDATE each
+            # for technicians and neurologists
+            with self.assertNumQueries(6 + batches):
+                with self.captureOnCommitCallbacks(execute=True):
+                    check_vital_signs([vitals.id])
+
+            self.assertEqual(Notification.objects.count(), expected)
+        self.assertGreater(batches, 1)
+
+    def test_normal_vitals_do_not_query_recipients(self):
+        self._add_staff(10)
+        vitals = VitalSigns.objects.create(
+            patient=self.patient,
+            blood_pressure_systolic=120,
+            blood_pressure_diastolic=80,
+            heart_rate=70,
+            respiratory_rate=16,
+            temperature=37.0,
+            oxygen_saturation=98,
+        )
+        # The reading and its patient's trend state, read and written
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(3):
+                check_vital_signs([vitals.id])
+        self.assertFalse(Notification.objects.exists())
+
+
+class NotificationPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('neuro', password='pw', role=User.Role.NEUROLOGIST)
+        Notification.objects.bulk_create([
+            Notification(user=cls.user, notification_type='SYSTEM', title=f'n{i}', message='m')
+            for i in range(60)
+        ])
+        # Give half of them the same timestamp so the id tiebreak is exercised
+        tie = Notification.objects.order_by('id')[10].created_at
+        Notification.objects.filter(id__lte=Notification.objects.order_by('id')[40].id).update(created_at=tie)
+
+    def _page(self, query=''):
+        response = self.client.get(reverse('consultations:notifications') + ('?' + query if query else ''))
+        self.assertEqual(response.status_code, 200)
+        return response.context['notifications']
+
+    def test_walks_forward_and_back_without_gaps(self):
+        self.client.force_login(self.user)
+        expected = list(Notification.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        first = self._page()
+        second = self._page(first.next_query)
+        third = self._page(second.next_query)
+        seen = [n.id for page in (first, second, third) for n in page]
+        self.assertEqual(seen, expected)
+        self.assertFalse(first.has_previous)
+        self.assertFalse(third.has_next)
+
+        back = self._page(third.previous_query)
+        self.assertEqual([n.id for n in back], [n.id for n in second])
+        self.assertEqual([n.id for n in self._page(back.previous_query)], [n.id for n in first])
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        self.client.force_login(self.user)
+        self.assertEqual(len(self._page('cursor=not-a-cursor')), 25)
+
+
+class UnreadCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.technician = User.objects.create_user('tech', password='pw', role=User.Role.TECHNICIAN)
+        cls.neurologist = User.objects.create_user('neuro', password='pw', role=User.Role.NEUROLOGIST)
+        cls.patient = Patient.objects.create(
+            first_name='Test', last_name='Patient',
+            date_of_birth=date(1950, 1, 1), gender='F'
+        )
+
+    def _unread(self, user):
+        user.refresh_from_db()
+        return user.unread_notification_count
+
+    def test_counter_follows_creation_and_reads(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            # Abnormal systolic and heart rate: 2 technician alerts, 1 neurologist alert
+            VitalSigns.objects.create(
+                patient=self.patient, blood_pressure_systolic=200, blood_pressure_diastolic=80,
+                heart_rate=130, respiratory_rate=16, temperature=37.0, oxygen_saturation=98,
+            )
+            run_pending_jobs()
+        create_notification(user=self.technician, notification_type='SYSTEM', title='t', message='m')
+        self.assertEqual(self._unread(self.technician), 3)
+        self.assertEqual(self._unread(self.neurologist), 1)
+
+        self.client.force_login(self.technician)
+        first = Notification.objects.filter(user=self.technician).first()
+        self.client.get(reverse('consultations:notifications'), {'mark_read': first.id})
+        self.client.get(reverse('consultations:notifications'), {'mark_read': first.id})
+        self.assertEqual(self._unread(self.technician), 2)
+
+        response = self.client.get(reverse('consultations:notifications'))
+        self.assertEqual(response.context['unread_notification_count'], 2)
+        self.assertContains(response, 'notification-badge')
+
+        self.client.post(reverse('consultations:notifications'), {'mark_all_read': '1'})
+        self.assertEqual(self._unread(self.technician), 0)
+        self.assertEqual(self._unread(self.neurologist), 1)
+
+    def test_recount_repairs_drift(self):
+        create_notification(user=self.neurologist, notification_type='SYSTEM', title='t', message='m')
+        User.objects.filter(pk=self.neurologist.pk).update(unread_notification_count=7)
+        recount_unread_notifications()
+        self.assertEqual(self._unread(self.neurologist), 1)
+
+
+class NotificationStreamTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('neuro', password='pw', role=User.Role.NEUROLOGIST)
+
+    async def test_hub_delivers_across_threads(self):
+        subscription = hub.subscribe(self.user.pk)
+        try:
+            notification = Notification(id=1, user_id=self.user.pk, notification_type='SYSTEM', title='Alert', message='m')
+            thread = threading.Thread(target=hub.publish, args=([notification],))
+            thread.start()
+            thread.join()
+            payload = await asyncio.wait_for(subscription[1].get(), timeout=1)
+            self.assertEqual(payload['title'], 'Alert')
+        finally:
+            hub.unsubscribe(self.user.pk, subscription)
+        self.assertEqual(hub.subscriber_count(self.user.pk), 0)
+
+    async def test_stream_pushes_new_and_missed_notifications(self):
+        missed = await sync_to_async(create_notification)(
+            user=self.user, notification_type='SYSTEM', title='Missed', message='m'
+        )
+        await sync_to_async(self.client.force_login)(self.user)
+        self.async_client.cookies = self.client.cookies
+
+        response = await self.async_client.get(
+            reverse('consultations:notification_stream'),
+            headers={'Last-Event-ID': str(missed.id - 1)}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = response.streaming_content.__aiter__()
+        try:
+            self.assertTrue((await events.__anext__()).startswith(b'retry:'))
+            self.assertIn(b'"Missed"', await events.__anext__())
+
+            live = await sync_to_async(create_notification)(
+                user=self.user, notification_type='TPA', title='Live', message='m'
+            )
+            hub.publish([live])
+            chunk = await asyncio.wait_for(events.__anext__(), timeout=2)
+            self.assertIn(f'id: {live.id}'.encode(), chunk)
+            self.assertIn(b'"Live"', chunk)
+        finally:
+            await events.aclose()
+
+        # Dropping the response (as on disconnect) finalizes the stream and unsubscribes it
+        del response, events
+        gc.collect()
+        for _ in range(3):
+            await asyncio.sleep(0)
+        self.assertEqual(hub.subscriber_count(self.user.pk), 0)
+
+    async def test_stream_picks_up_notifications_written_by_other_processes(self):
+        await sync_to_async(self.client.force_login)(self.user)
+        self.async_client.cookies = self.client.cookies
+        response = await self.async_client.get(reverse('consultations:notification_stream'))
+        events = response.streaming_content.__aiter__()
+        try:
+            self.assertTrue((await events.__anext__()).startswith(b'retry:'))
+
+            # Written by the job worker, so never published to this process's hub
+            worker = await Notification.objects.acreate(
+                user=self.user, notification_type='CONSULTATION', title='From worker', message='m'
+            )
+            local = await Notification.objects.acreate(
+                user=self.user, notification_type='TPA', title='Local', message='m'
+            )
+            hub.publish([local])
+
+            chunks = [await asyncio.wait_for(events.__anext__(), timeout=3) for _ in range(2)]
+            self.assertIn(b'"Local"', chunks[0])
+            self.assertIn(b'"From worker"', chunks[1])
+            self.assertIn(f'id: {worker.id}'.encode(), chunks[1])
+        finally:
+            await events.aclose()
+
+    def test_wsgi_deployment_does_not_stream(self):
+        self.client.force_login(self.user)
+        page = reverse('consultations:notifications')
+        self.assertNotContains(self.client.get(page), 'EventSource')
+        with self.settings(NOTIFICATION_STREAM=True):
+            self.assertContains(self.client.get(page), 'EventSource')
+
+        environ = RequestFactory().get(reverse('consultations:notification_stream')).environ
+        environ['HTTP_COOKIE'] = self.client.cookies.output(header='', sep=';').strip()
+        statuses = []
+        # Like the test client, keep the handler from closing the test's connection
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            response = WSGIHandler()(environ, lambda status, headers: statuses.append(status))
+            content = b''.join(response)
+            response.close()
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+        self.assertEqual((statuses, content), (['204 No Content'], b''))
+
+    async def test_anonymous_stream_is_rejected(self):
+        response = await self.async_client.get(reverse('consultations:notification_stream'))
+        self.assertEqual(response.status_code, 401)
+
+
+class ThresholdTableTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.stroke_patient = Patient.objects.create(
+            first_name='Unit', last_name='Patient', unit='STROKE',
+            date_of_birth=date(1950, 1, 1), gender='M'
+        )
+        cls.other_patient = Patient.objects.create(
+            first_name='Ward', last_name='Patient',
+            date_of_birth=date(1950, 1, 1), gender='F'
+        )
+
+    def _systolic_breaches(self, values, patients):
+        table = load_threshold_table()
+        return table.evaluate(
+            {'blood_pressure_systolic': values},
+            [p.unit for p in patients], [p.id for p in patients]
+        )
+
+    def test_defaults_match_clinical_thresholds(self):
+        table = ThresholdTable()
+        breaches = table.evaluate(
+            {'blood_pressure_systolic': [200, 120], 'oxygen_saturation': [88, 100], 'heart_rate': [40, 70]},
+            ['', ''], [1, 2]
+        )
+        self.assertEqual([(b.row, b.parameter) for b in breaches], [
+            (0, 'blood_pressure_systolic'), (0, 'heart_rate'), (0, 'oxygen_saturation'),
+        ])
+        self.assertEqual(breaches[0].message, "Systolic BP exceeds tPA threshold at 200 mmHg")
+        self.assertTrue(breaches[0].is_critical)
+        self.assertFalse(breaches[1].is_critical)
+
+    def test_patient_overrides_unit_overrides_global(self):
+        patients = [self.stroke_patient, self.other_patient]
+        self.assertEqual(len(self._systolic_breaches([170, 170], patients)), 0)
+
+        VitalSignThreshold.objects.create(parameter='blood_pressure_systolic', max_value=160)
+        self.assertEqual([b.row for b in self._systolic_breaches([170, 170], patients)], [0, 1])
+
+        VitalSignThreshold.objects.create(parameter='blood_pressure_systolic', unit='STROKE', max_value=180)
+        self.assertEqual([b.row for b in self._systolic_breaches([170, 170], patients)], [1])
+
+        VitalSignThreshold.objects.create(
+            parameter='blood_pressure_systolic', patient=self.stroke_patient, max_value=140,
+            criticality='WARNING', high_message="Above target at {value}"
+        )
+        breaches = self._systolic_breaches([170, 165], patients)
+        self.assertEqual([b.row for b in breaches], [0, 1])
+        self.assertEqual(breaches[0].message, "Above target at 170")
+        self.assertFalse(breaches[0].is_critical)
+        self.assertTrue(breaches[1].is_critical)
+
+    def test_saved_threshold_reaches_other_processes(self):
+        load_threshold_table()
+        # A second connection reads the shared cache as another process would
+        other_process = caches.create_connection('default')
+        self.assertIsNotNone(other_process.get(THRESHOLD_CACHE_KEY))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            VitalSignThreshold.objects.create(parameter='heart_rate', max_value=110)
+        self.assertIsNone(other_process.get(THRESHOLD_CACHE_KEY))
+
+    def test_rescanning_history_is_fast(self):
+        readings = 5000
+        VitalSigns.objects.bulk_create([
+            VitalSigns(
+                patient=self.stroke_patient if i % 2 else self.other_patient,
+                blood_pressure_systolic=100 + i % 100, blood_pressure_diastolic=80, heart_rate=70,
+                respiratory_rate=16, temperature='37.0', oxygen_saturation=98,
+            )
+            for i in range(readings)
+        ])
+        VitalSignThreshold.objects.create(parameter='blood_pressure_systolic', max_value=189)
+
+        # One read of the thresholds and one of the readings, however many there are
+        with self.assertNumQueries(2):
+            breaches = scan_vital_signs(VitalSigns.objects.all())
+
+        # Systolic 190-199 breaches the new limit: 10 of every 100 readings
+        self.assertEqual(len(breaches), readings // 10)
+
+
+class VitalTrendTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(
+            first_name='Trend', last_name='Patient', date_of_birth=date(1950, 1, 1), gender='F'
+        )
+        cls.technician = User.objects.create_user('trend_tech', password='pw', role=User.Role.TECHNICIAN)
+        cls.neurologist = User.objects.create_user('trend_neuro', password='pw', role=User.Role.NEUROLOGIST)
+
+    def setUp(self):
+        load_threshold_table()
+        self.start = timezone.now() - timedelta(hours=2)
+
+    def reading(self, minutes, **fields):
+        values = {
+            'blood_pressure_systolic': 130, 'blood_pressure_diastolic': 80, 'heart_rate': 75,
+            'respiratory_rate': 16, 'temperature': 37.0, 'oxygen_saturation': 98,
+        }
+        values.update(fields)
+        return VitalSigns(patient=self.patient, recorded_at=self.start + timedelta(minutes=minutes), **values)
+
+    def test_rolling_window_matches_statistics_recomputed_from_history(self):
+        rng = random.Random(7)
+        window = RollingWindow(600)
+        history = []
+        t = 0.0
+        for _ in range(500):
+            t += rng.uniform(5, 120)
+            y = rng.uniform(80, 200)
+            window.add(t, y)
+            history.append((t, y))
+
+            held = [(s, v) for s, v in history if s >= t - 600]
+            self.assertEqual(window.count, len(held))
+            self.assertEqual(window.minimum, min(v for _, v in held))
+            self.assertEqual(window.maximum, max(v for _, v in held))
+            self.assertAlmostEqual(window.mean, statistics.fmean(v for _, v in held), places=6)
+            if len(held) > 1:
+                mean_t = statistics.fmean(s for s, _ in held)
+                mean_y = statistics.fmean(v for _, v in held)
+                expected = sum((s - mean_t) * (v - mean_y) for s, v in held) / sum((s - mean_t) ** 2 for s, _ in held)
+                self.assertAlmostEqual(window.slope, expected * 3600, places=4)
+
+        self.assertFalse(window.add(t - 1, 100), "An out-of-order reading is ignored")
+        self.assertFalse(window.add(t, 100), "A repeat of the latest reading is ignored")
+
+    def test_systolic_rise_within_an_hour_alerts_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for minutes, systolic in [(0, 130), (20, 145), (40, 165), (50, 170)]:
+                self.reading(minutes, blood_pressure_systolic=systolic).save()
+            run_pending_jobs()
+
+        notifications = Notification.objects.order_by('user__role')
+        self.assertEqual(
+            [(n.user, n.title) for n in notifications],
+            [
+                (self.neurologist, "CRITICAL Vital Sign Trend - Trend Patient"),
+                (self.technician, "Deteriorating Vital Sign - Trend Patient"),
+            ],
+        )
+        self.assertIn("Systolic BP rose 35 mmHg within 60 minutes to 165 mmHg", notifications[0].message)
+
+    def test_readings_an_hour_apart_do_not_trend(self):
+        alerts = update_trends([self.reading(0), self.reading(90, blood_pressure_systolic=175)])
+        self.assertEqual(alerts, [])
+
+    def test_steady_oxygen_decline_in_a_batch(self):
+        # Out of order, as a monitor feed may send them
+        records = [self.reading(minutes, oxygen_saturation=spo2) for minutes, spo2 in [(30, 95), (0, 98), (20, 96), (10, 97)]]
+        alerts = update_trends(records)
+
+        self.assertEqual([(alert.row, alert.rule.name) for alert in alerts], [(0, 'oxygen_saturation_decline')])
+        self.assertTrue(alerts[0].is_critical)
+        self.assertAlmostEqual(alerts[0].slope, -6.0)
+
+        # State carries over to the next batch without re-reading history:
+        # the patient's state row is read and written once
+        self.assertEqual(update_trends([self.reading(40, oxygen_saturation=94)]), [])
+        with self.assertNumQueries(2):
+            alerts = update_trends([self.reading(45, heart_rate=110)])
+        self.assertEqual([alert.rule.name for alert in alerts], ['heart_rate_rise'])
+
+    def test_retried_batch_is_not_counted_twice(self):
+        batch = [self.reading(minutes, blood_pressure_systolic=systolic) for minutes, systolic in [(0, 130), (20, 150)]]
+        self.assertEqual(update_trends(batch), [])
+        self.assertEqual(update_trends(batch), [])
+
+        state = VitalTrendState.objects.get(patient=self.patient).state
+        windows = {(parameter, minutes): readings for parameter, minutes, readings in state['windows']}
+        self.assertEqual(len(windows[('blood_pressure_systolic', 60)]), 2)
+        alerts = update_trends([self.reading(40, blood_pressure_systolic=165)])
+        self.assertEqual([alert.rule.name for alert in alerts], ['systolic_rise'])
+
+    def test_rolled_back_batch_leaves_the_windows_unchanged(self):
+        update_trends([self.reading(0, blood_pressure_systolic=130)])
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            update_trends([self.reading(20, blood_pressure_systolic=150)])
+            raise RuntimeError
+        # Retrying the batch sees it as new
+        update_trends([self.reading(20, blood_pressure_systolic=150)])
+        self.assertEqual(
+            [alert.rule.name for alert in update_trends([self.reading(30, blood_pressure_systolic=162)])],
+            ['systolic_rise'],
+        )
+
+
+
+# Arguments of each record_job_call run
+JOB_CALLS = []
+
+
+@task(queue='test', max_attempts=3)
+def record_job_call(label, fail=False):
+    JOB_CALLS.append(label)
+    if fail:
+        raise RuntimeError(f'{label} failed')
+
+
+class BackgroundJobTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.technician = User.objects.create_user('job_tech', password='pw', role=User.Role.TECHNICIAN)
+        cls.neurologist = User.objects.create_user('job_neuro', password='pw', role=User.Role.NEUROLOGIST)
+        cls.patient = Patient.objects.create(
+            first_name='Queued', last_name='Patient', date_of_birth=date(1950, 1, 1), gender='F'
+        )
+
+    def setUp(self):
+        JOB_CALLS.clear()
+
+    def test_jobs_follow_their_transaction_and_idempotency_key(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            enqueue(record_job_call, label='rolled back')
+            raise RuntimeError
+        enqueue(record_job_call, key='once', label='kept')
+        enqueue(record_job_call, key='once', label='duplicate')
+
+        self.assertEqual(run_pending_jobs(), 1)
+        self.assertEqual(JOB_CALLS, ['kept'])
+        enqueue(record_job_call, key='once', label='after it ran')
+        self.assertEqual(run_pending_jobs(), 0)
+
+    def test_failing_job_backs_off_then_fails(self):
+        enqueue(record_job_call, label='broken', fail=True)
+        with self.assertLogs('consultations.jobs', 'WARNING'):
+            self.assertEqual(run_pending_jobs(), 1)
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('broken failed', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=5))
+        self.assertEqual(run_pending_jobs(), 0, "Not due until the backoff has passed")
+
+        for _ in range(2):
+            Job.objects.update(run_at=timezone.now())
+            with self.assertLogs('consultations.jobs', 'WARNING'):
+                run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 3))
+        self.assertEqual(JOB_CALLS, ['broken'] * 3)
+
+        delays = [backoff(attempts) for attempts in (1, 2, 3, 50)]
+        self.assertTrue(timedelta(seconds=7) < delays[0] <= timedelta(seconds=15))
+        self.assertTrue(delays[1] <= timedelta(seconds=30) < delays[2] * 2)
+        self.assertLessEqual(delays[3], timedelta(hours=1))
+
+    @override_settings(JOB_CONCURRENCY={'test': 1})
+    def test_queue_limit_holds_across_workers(self):
+        enqueue(record_job_call, label='first')
+        enqueue(record_job_call, label='second')
+        enqueue(record_job_call, queue='other', label='elsewhere')
+
+        first = claim_job('worker-a')
+        self.assertEqual(first.kwargs, {'label': 'first'})
+        # The test queue is full, so the next worker takes from another queue
+        self.assertEqual(claim_job('worker-b').queue, 'other')
+        self.assertIsNone(claim_job('worker-b'))
+
+        run_job(first, 'worker-a')
+        self.assertEqual(claim_job('worker-b').kwargs, {'label': 'second'})
+
+    def test_job_held_by_a_lost_worker_runs_again(self):
+        enqueue(record_job_call, label='orphaned')
+        claim_job('killed')
+        self.assertEqual(release_expired_leases(), 0)
+
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(release_expired_leases(), 1)
+        self.assertEqual(run_pending_jobs(), 1)
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts, job.locked_by), (Job.DONE, 2, ''))
+
+    def test_consultation_request_notifies_neurologists_in_the_background(self):
+        self.client.force_login(self.technician)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('consultations:request_consultation', args=[self.patient.id]),
+                {'chief_complaint': 'Left-sided weakness'},
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Notification.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(run_pending_jobs(), 1)
+        self.assertEqual(
+            list(Notification.objects.values_list('user', 'title')),
+            [(self.neurologist.id, 'New Consultation Request')],
+        )
+
+    def test_every_review_notifies_even_when_a_status_repeats(self):
+        consultation = Consultation.objects.create(
+            patient=self.patient, requested_by=self.technician, neurologist=self.neurologist,
+            chief_complaint='Aphasia', status='IN_PROGRESS',
+        )
+        tpa = TPARequest.objects.create(consultation=consultation, requested_by=self.technician, justification='LKW 1h')
+        self.client.force_login(self.neurologist)
+        for status in ['APPROVED', 'DENIED', 'APPROVED']:
+            response = self.client.post(
+                reverse('consultations:review_tpa', args=[tpa.id]), {'status': status, 'review_notes': ''}
+            )
+            self.assertEqual(response.status_code, 302)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(run_pending_jobs(), 3)
+        self.assertEqual(
+            [n.message for n in Notification.objects.filter(user=self.technician).order_by('id')],
+            [f'tPA request for Queued Patient has been {status}.' for status in ['approved', 'denied', 'approved']],
+        )
+
+
+class UnitStatisticsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.neurologist = User.objects.create_user('neuro', password='pw', role=User.Role.NEUROLOGIST)
+
+    def assertMatchesRecount(self):
+        stats = get_unit_statistics()
+        recount = compute_unit_statistics()
+        self.assertEqual({field: getattr(stats, field) for field in recount}, recount)
+        return stats
+
+    def test_counters_follow_the_record_lifecycle(self):
+        patient = Patient.objects.create(first_name='A', last_name='B', date_of_birth=date(1950, 1, 1), gender='F')
+        stats = self.assertMatchesRecount()
+        self.assertEqual((stats.total_patients, stats.patients_today), (1, 1))
+
+        consultation = Consultation.objects.create(patient=patient, chief_complaint='Left weakness')
+        self.assertEqual(self.assertMatchesRecount().consultations_unassigned, 1)
+
+        consultation = Consultation.objects.get(pk=consultation.pk)
+        consultation.neurologist = self.neurologist
+        consultation.status = 'IN_PROGRESS'
+        consultation.save()
+        stats = self.assertMatchesRecount()
+        self.assertEqual((stats.consultations_unassigned, stats.consultations_in_progress), (0, 1))
+
+        tpa = TPARequest.objects.create(consultation=consultation, justification='Within window')
+        tpa.status = 'APPROVED'
+        tpa.administered = True
+        tpa.save()
+        stats = self.assertMatchesRecount()
+        self.assertEqual((stats.tpa_requested, stats.tpa_approved, stats.tpa_administered), (0, 1, 1))
+
+        items = {field: 0 for field in NIHSS_ITEMS}
+        items.update(loc=3, motor_arm_left=4, language=3)
+        assessment = NIHSSAssessment.objects.create(patient=patient, **items)
+        assessment.motor_leg_left = 4
+        assessment.gaze = 2
+        assessment.save()
+        stats = self.assertMatchesRecount()
+        self.assertEqual((stats.nihss_moderate, stats.nihss_severe, stats.average_nihss_score), (0, 1, 16))
+
+        # Deleting the patient cascades to everything above
+        patient.delete()
+        stats = self.assertMatchesRecount()
+        self.assertEqual((stats.total_patients, stats.total_assessments, stats.tpa_approved), (0, 0, 0))
+
+    def test_deferred_rows_adjust_the_counts_without_a_recount(self):
+        patient = Patient.objects.create(first_name='A', last_name='B', date_of_birth=date(1950, 1, 1), gender='F')
+        consultation = Consultation.objects.create(patient=patient, chief_complaint='Left weakness')
+
+        consultation = Consultation.objects.only('id', 'patient').get(pk=consultation.pk)
+        consultation.status = 'IN_PROGRESS'
+        consultation.neurologist = self.neurologist
+        # Reading the stored status, the UPDATE and one counter UPDATE
+        with self.assertNumQueries(3):
+            consultation.save()
+        stats = self.assertMatchesRecount()
+        self.assertEqual((stats.consultations_requested, stats.consultations_in_progress), (0, 1))
+
+        Consultation.objects.only('id').get(pk=consultation.pk).delete()
+        self.assertEqual(self.assertMatchesRecount().consultations_in_progress, 0)
+
+    def test_daily_counters_restart_on_a_new_day(self):
+        UnitStatistics.objects.filter(pk=1).update(day=date(2000, 1, 1), patients_today=7, assessments_today=3)
+        self.assertEqual(get_unit_statistics().patients_today, 0)
+
+        Patient.objects.create(first_name='A', last_name='B', date_of_birth=date(1950, 1, 1), gender='F')
+        stats = get_unit_statistics()
+        self.assertEqual((stats.patients_today, stats.assessments_today), (1, 0))
+
+    def test_rebuild_command_repairs_drift(self):
+        Patient.objects.create(first_name='A', last_name='B', date_of_birth=date(1950, 1, 1), gender='F')
+        UnitStatistics.objects.filter(pk=1).update(total_patients=99)
+
+        call_command('rebuild_unit_statistics', stdout=StringIO())
+        self.assertEqual(self.assertMatchesRecount().total_patients, 1)
+
+    def test_dashboard_reads_the_statistics_row(self):
+        self.client.force_login(self.neurologist)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('assessments:doctor_dashboard'))
+        self.assertEqual(response.context['total_assessments'], 0)
+        # Only the per-doctor count is still run live
+        counts = [q['sql'] for q in queries.captured_queries if 'COUNT(*)' in q['sql']]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('assessed_by_id', counts[0])
+
+
+class NeurologistDashboardTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.neurologist = User.objects.create_user('neuro', password='pw', role=User.Role.NEUROLOGIST)
+        cls.technician = User.objects.create_user('tech', password='pw', role=User.Role.TECHNICIAN)
+        cls.patient = Patient.objects.create(
+            first_name='Queue', last_name='Patient', date_of_birth=date(1950, 1, 1), gender='F'
+        )
+
+    def _fill_queue(self, depth):
+        for _ in range(depth):
+            Consultation.objects.create(patient=self.patient, requested_by=self.technician, chief_complaint='Aphasia')
+            Consultation.objects.create(
+                patient=self.patient, requested_by=self.technician, neurologist=self.neurologist,
+                status='IN_PROGRESS', chief_complaint='Weakness'
+            )
+            Consultation.objects.create(
+                patient=self.patient, neurologist=self.neurologist, status='COMPLETED', chief_complaint='Resolved'
+            )
+            consultation = Consultation.objects.create(
+                patient=self.patient, requested_by=self.technician, chief_complaint='Within window'
+            )
+            TPARequest.objects.create(consultation=consultation, requested_by=self.technician, justification='NIHSS 12')
+
+    def _load(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('consultations:neurologist_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_the_queue(self):
+        self.client.force_login(self.neurologist)
+        self._fill_queue(2)
+        response, shallow = self._load()
+        self.assertEqual(response.context['pending_consultations_count'], 4)
+        self.assertEqual(response.context['in_progress_consultations_count'], 2)
+        self.assertEqual(response.context['pending_tpa_count'], 2)
+
+        self._fill_queue(15)
+        response, deep = self._load()
+        self.assertEqual(response.context['pending_tpa_count'], 17)
+        self.assertEqual(len(response.context['pending_tpa_requests']), 10)
+        self.assertEqual(shallow, deep)
+
+    def test_tpa_review_link_resolves(self):
+        self._fill_queue(1)
+        self.client.force_login(self.neurologist)
+        tpa = TPARequest.objects.get()
+        self.assertContains(self._load()[0], reverse('consultations:review_tpa', args=[tpa.id]))
+
+
+@override_settings(QUERY_INSTRUMENTATION=True)
+class QueryInstrumentationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('neuro', password='pw', role=User.Role.NEUROLOGIST)
+
+    def test_fingerprint_ignores_literals_and_list_lengths(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE a = %s AND b IN (%s, %s)  LIMIT 21'),
+            fingerprint("SELECT * FROM t WHERE a = %s AND b IN (%s) LIMIT 5"),
+        )
+        self.assertEqual(fingerprint("SELECT 'x' FROM t1"), "SELECT ? FROM t1")
+
+    def test_repeated_statements_are_reported(self):
+        recorder = QueryRecorder()
+        with recorder.record():
+            for _ in range(5):
+                list(User.objects.filter(pk=self.user.pk))
+            User.objects.count()
+        self.assertEqual(recorder.count, 6)
+        [(statement, times)] = recorder.repeated()
+        self.assertEqual(times, 5)
+        self.assertIn('FROM "accounts_user"', statement)
+
+    def test_middleware_logs_and_sets_headers(self):
+        self.client.force_login(self.user)
+        with self.assertLogs('stroke_unit.queries', 'INFO') as logs:
+            response = self.client.get(reverse('consultations:notifications'))
+        self.assertEqual(response['X-Query-Count'], '3')
+        self.assertTrue(response['Server-Timing'].startswith('db;dur='))
+        self.assertIn('consultations:notifications: 3 queries', logs.output[0])
+
+
+class CompositeIndexPlanTests(QueryPlanMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.neurologist = User.objects.create_user('neuro', password='pw', role=User.Role.NEUROLOGIST)
+        cls.technician = User.objects.create_user('tech', password='pw', role=User.Role.TECHNICIAN)
+        patient = Patient.objects.create(first_name='A', last_name='B', date_of_birth=date(1950, 1, 1), gender='F')
+        for status in ('REQUESTED', 'IN_PROGRESS', 'COMPLETED'):
+            consultation = Consultation.objects.create(
+                patient=patient, requested_by=cls.technician, status=status, chief_complaint='Aphasia',
+                neurologist=None if status == 'REQUESTED' else cls.neurologist,
+            )
+            TPARequest.objects.create(consultation=consultation, requested_by=cls.technician, justification='NIHSS 12')
+            create_notification(
+                user=cls.technician, notification_type='CONSULTATION', title='Update',
+                message='Consultation updated', related_consultation=consultation,
+            )
+
+    def setUp(self):
+        get_unit_statistics()
+
+    def test_neurologist_dashboard(self):
+        self.client.force_login(self.neurologist)
+        self.assertUsesIndexes(lambda: self.client.get(reverse('consultations:neurologist_dashboard')))
+
+    def test_consultation_list_filtered_by_status(self):
+        url = reverse('consultations:list') + '?status=COMPLETED'
+        for user in (self.neurologist, self.technician):
+            self.client.force_login(user)
+            self.assertUsesIndexes(lambda: self.client.get(url))
+
+    def test_pending_tpa_queue(self):
+        # As on the technician dashboard
+        self.assertUsesIndexes(
+            TPARequest.objects.filter(status='REQUESTED')
+            .select_related('consultation__patient').order_by('-requested_at')[:5]
+        )
+
+    def test_marking_all_notifications_read(self):
+        self.client.force_login(self.technician)
+        self.assertUsesIndexes(lambda: self.client.get(reverse('consultations:notifications') + '?mark_all_read=1'))
+        self.assertFalse(Notification.objects.filter(user=self.technician, is_read=False).exists())
+
+
+class ConsultationsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    urlconf = 'consultations.urls'
+    # review_tpa renders consultations/review_tpa.html, which does not exist yet
+    skip = {'notification_stream', 'review_tpa'}
+    roles = {
+        'update': 'NEUROLOGIST',
+        'accept_consultation': 'NEUROLOGIST',
+        'administer_tpa': 'NEUROLOGIST',
+        'mark_notification_read': 'NEUROLOGIST',
+        'neurologist_dashboard': 'NEUROLOGIST',
+    }
+    budgets = {
+        'list': 3,
+        'detail': 10,
+        'update': 5,
+        'accept_consultation': 3,
+        'request_consultation': 3,
+        'request_tpa': 4,
+        'administer_tpa': 2,
+        'notifications': 3,
+        'mark_notification_read': 6,
+        'technician_dashboard': 6,
+        'neurologist_dashboard': 8,
+    }
+
+
+class ScaleBenchmarkTests(TestCase):
+
+    def generate(self, seed=1):
+        call_command(
+            'generate_scale_data', patients=12, vitals_per_patient=4, staff=2, batch_size=5,
+            seed=seed, stdout=StringIO(),
+        )
+
+    def snapshot(self):
+        return (
+            list(Patient.objects.order_by('id').values_list('first_name', 'last_name', 'date_of_birth', 'unit')),
+            list(VitalSigns.objects.order_by('id').values_list('heart_rate', 'temperature', 'oxygen_saturation')),
+            list(NIHSSAssessment.objects.order_by('id').values_list('total_score', 'severity')),
+            list(Consultation.objects.order_by('id').values_list('status', flat=True)),
+        )
+
+    def test_generator_is_deterministic_and_keeps_derived_data(self):
+        self.generate()
+        self.assertEqual(Patient.objects.count(), 12)
+        self.assertEqual(VitalSigns.objects.count(), 48)
+        self.assertEqual(User.objects.filter(username__startswith='scale_').count(), 4)
+        self.assertEqual(get_unit_statistics().total_patients, 12)
+        for assessment in NIHSSAssessment.objects.all():
+            self.assertEqual(assessment.total_score, assessment.get_total_score())
+        # Timestamps are spread out rather than all stamped at insert time
+        self.assertGreater(len(set(Patient.objects.values_list('registration_date', flat=True))), 1)
+
+        first = self.snapshot()
+        Patient.objects.all().delete()
+        self.generate()
+        self.assertEqual(self.snapshot(), first)
+
+    def test_benchmark_writes_percentiles_for_routed_views(self):
+        self.generate()
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / 'results.json'
+            call_command('benchmark_views', repeat=2, warmup=0, output=str(output), stdout=StringIO())
+            report = json.loads(output.read_text())
+
+        views = report['views']
+        self.assertIn('patients:list', views)
+        self.assertIn('consultations:neurologist_dashboard', views)
+        self.assertNotIn('consultations:notification_stream', views)
+        self.assertEqual(views['patients:list']['status'], 200)
+        self.assertLessEqual(views['patients:list']['p50_ms'], views['patients:list']['p95_ms'])
+        self.assertEqual(report['rows']['patients.Patient'], 12)
@@ -0,0 +1,212 @@
+from collections import defaultdict, namedtuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+WARNING, CRITICAL = 'WARNING', 'CRITICAL'
+
+# One rule per parameter; a None bound is not checked. Message templates receive {value}
+Rule = namedtuple('Rule', ['minimum', 'maximum', 'criticality', 'low_message', 'high_message'])
+
+# Defaults, in the order findings are reported for a record
+DEFAULT_RULES = {
+    'blood_pressure_systolic': Rule(
+        90, 185, CRITICAL,
+        "Systolic BP is critically low at {value} mmHg",
+        "Systolic BP exceeds tPA threshold at {value} mmHg",
+    ),
+    'blood_pressure_diastolic': Rule(
+        60, 110, CRITICAL,
+        "Diastolic BP is critically low at {value} mmHg",
+        "Diastolic BP exceeds tPA threshold at {value} mmHg",
+    ),
+    'heart_rate': Rule(
+        50, 120, WARNING,
+        "Heart rate is critically low at {value} bpm",
+        "Heart rate is critically elevated at {value} bpm",
+    ),
+    'respiratory_rate': Rule(
+        10, 30, WARNING,
+        "Respiratory rate is critically low at {value} br/min",
+        "Respiratory rate is critically elevated at {value} br/min",
+    ),
+    'temperature': Rule(
+        35.0, 38.5, WARNING,
+        "Temperature is critically low at {value}°C",
+        "Temperature is critically elevated at {value}°C",
+    ),
+    'oxygen_saturation': Rule(
+        92, None, CRITICAL,
+        "Oxygen saturation is critically low at {value}%",
+        "Oxygen saturation is elevated at {value}%",
+    ),
+    'blood_glucose': Rule(
+        50, 400, CRITICAL,
+        "Blood glucose is critically low at {value} mg/dL",
+        "Blood glucose exceeds tPA threshold at {value} mg/dL",
+    ),
+}
+
+PARAMETERS = list(DEFAULT_RULES)
+
+THRESHOLD_CACHE_KEY = 'vital_sign_thresholds'
+
+# Saves and deletes drop the cached table in every process (the cache is
+# shared); the timeout bounds how long writes that skip signals, such as
+# queryset update(), go unseen
+THRESHOLD_CACHE_TIMEOUT = 5 * 60
+
+
+class Breach(namedtuple('Breach', ['row', 'parameter', 'value', 'criticality', 'message'])):
+    """A reading outside its rule; ``row`` indexes the evaluated batch"""
+    __slots__ = ()
+
+    @property
+    def is_critical(self):
+        return self.criticality == CRITICAL
+
+
+class ThresholdTable:
+    """
+    Default rules layered with unit and patient overrides
+
+    Rules are resolved once per (unit, patient) and reused, so evaluating a
+    batch costs one pass over each parameter column per distinct rule set
+    rather than a rule lookup per reading.
+    """
+
+    def __init__(self, overrides=()):
+        self._global = dict(DEFAULT_RULES)
+        self._units = defaultdict(dict)
+        self._patients = defaultdict(dict)
+        self._resolved = {}
+
+        # Apply broad overrides first so narrower ones merge on top
+        overrides = sorted(overrides, key=lambda o: (o['patient_id'] is not None, bool(o['unit'])))
+        for override in overrides:
+            if override['patient_id'] is not None:
+                self._patients[override['patient_id']][override['parameter']] = override
+            elif override['unit']:
+                self._units[override['unit']][override['parameter']] = override
+            else:
+                parameter = override['parameter']
+                self._global[parameter] = _merge(self._global[parameter], override)
+
+    def rules_for(self, unit='', patient_id=None):
+        """Effective {parameter: Rule} for a patient in a unit"""
+        if patient_id not in self._patients:
+            patient_id = None
+        if unit not in self._units:
+            unit = ''
+        key = (unit, patient_id)
+        rules = self._resolved.get(key)
+        if rules is None:
+            rules = dict(self._global)
+            for layer in (self._units.get(unit, {}), self._patients.get(patient_id, {})):
+                for parameter, override in layer.items():
+                    rules[parameter] = _merge(rules[parameter], override)
+            self._resolved[key] = rules
+        return rules
+
+    def evaluate(self, columns, units, patient_ids):
+        """
+        Score a batch of readings held as columns
+
+        Parameters:
+        columns: {parameter: [value, ...]}, one list per parameter, None where not recorded
+        units: Each row's patient unit
+        patient_ids: Each row's patient id
+
+        Returns every Breach in the batch, ordered by row and then parameter.
+        """
+        # Rows sharing a rule set are scanned together
+        groups = {}
+        for row, (unit, patient_id) in enumerate(zip(units, patient_ids)):
+            rules = self.rules_for(unit, patient_id)
+            groups.setdefault(id(rules), (rules, []))[1].append(row)
+
+        breaches = []
+        for rules, rows in groups.values():
+            for parameter in PARAMETERS:
+                values = columns.get(parameter)
+                if values is None:
+                    continue
+                rule = rules[parameter]
+                low, high = rule.minimum, rule.maximum
+                if low is not None:
+                    breaches.extend(
+                        Breach(row, parameter, values[row], rule.criticality, rule.low_message.format(value=values[row]))
+                        for row in rows if values[row] is not None and values[row] < low
+                    )
+                if high is not None:
+                    breaches.extend(
+                        Breach(row, parameter, values[row], rule.criticality, rule.high_message.format(value=values[row]))
+                        for row in rows if values[row] is not None and values[row] > high
+                    )
+
+        order = {parameter: i for i, parameter in enumerate(PARAMETERS)}
+        breaches.sort(key=lambda breach: (breach.row, order[breach.parameter]))
+        return breaches
+
+
+def _merge(rule, override):
+    return Rule(
+        override['min_value'] if override['min_value'] is not None else rule.minimum,
+        override['max_value'] if override['max_value'] is not None else rule.maximum,
+        override['criticality'] or rule.criticality,
+        override['low_message'] or rule.low_message,
+        override['high_message'] or rule.high_message,
+    )
+
+
+def load_threshold_table():
+    """
+    The current ThresholdTable, with overrides read from the cache
+
+    The override table is small and changes rarely; it is cached whole
+    (even when empty) for web and job worker processes alike, and dropped
+    whenever a threshold is saved or deleted.
+    """
+    from .models import VitalSignThreshold
+
+    overrides = cache.get(THRESHOLD_CACHE_KEY)
+    if overrides is None:
+        overrides = list(VitalSignThreshold.objects.values(
+            'parameter', 'unit', 'patient_id', 'min_value', 'max_value',
+            'criticality', 'low_message', 'high_message'
+        ))
+        cache.set(THRESHOLD_CACHE_KEY, overrides, THRESHOLD_CACHE_TIMEOUT)
+    return ThresholdTable(overrides)
+
+
+def invalidate_threshold_table(sender=None, **kwargs):
+    # Again on commit, so a concurrent load cannot re-cache the old overrides
+    cache.delete(THRESHOLD_CACHE_KEY)
+    transaction.on_commit(lambda: cache.delete(THRESHOLD_CACHE_KEY))
+
+
+def evaluate_vital_signs(records, table=None):
+    """Breaches for VitalSigns instances; each record's patient must be loaded"""
+    table = table or load_threshold_table()
+    columns = {parameter: [getattr(record, parameter) for record in records] for parameter in PARAMETERS}
+    units = [record.patient.unit for record in records]
+    patient_ids = [record.patient_id for record in records]
+    return table.evaluate(columns, units, patient_ids)
+
+
+def scan_vital_signs(queryset, table=None):
+    """
+    Re-check stored readings against the current rules
+
+    Reads only the needed columns (no model instances) and returns a list
+    of (vital_signs_id, Breach) pairs. Meant for reviewing history after a
+    threshold change; it raises no alerts.
+    """
+    table = table or load_threshold_table()
+    rows = list(queryset.order_by().values_list('id', 'patient_id', 'patient__unit', *PARAMETERS))
+    if not rows:
+        return []
+    ids, patient_ids, units, *values = zip(*rows)
+    columns = dict(zip(PARAMETERS, values))
+    return [(ids[breach.row], breach) for breach in table.evaluate(columns, units, patient_ids)]
@@ -0,0 +1,264 @@
+from collections import deque, namedtuple
+
+from django.db import transaction
+
+from .thresholds import CRITICAL, WARNING
+
+
+RISE, FALL, DECLINE = 'RISE', 'FALL', 'DECLINE'
+
+# RISE / FALL: the latest reading is at least ``amount`` above the lowest / below
+# the highest reading of the last ``minutes``. DECLINE: the least-squares slope
+# over the window is falling by at least ``amount`` per hour. A rule needs
+# ``min_readings`` in its window and fires at most once per window length.
+# Message templates receive {value}, {change}, {slope} and {minutes}
+TrendRule = namedtuple('TrendRule', [
+    'name', 'parameter', 'kind', 'amount', 'minutes', 'min_readings', 'criticality', 'message',
+])
+
+DEFAULT_TREND_RULES = [
+    TrendRule(
+        'systolic_rise', 'blood_pressure_systolic', RISE, 30, 60, 2, CRITICAL,
+        "Systolic BP rose {change} mmHg within {minutes} minutes to {value} mmHg",
+    ),
+    TrendRule(
+        'systolic_fall', 'blood_pressure_systolic', FALL, 30, 60, 2, CRITICAL,
+        "Systolic BP fell {change} mmHg within {minutes} minutes to {value} mmHg",
+    ),
+    TrendRule(
+        'heart_rate_rise', 'heart_rate', RISE, 30, 60, 2, WARNING,
+        "Heart rate rose {change} bpm within {minutes} minutes to {value} bpm",
+    ),
+    TrendRule(
+        'oxygen_saturation_decline', 'oxygen_saturation', DECLINE, 3, 60, 4, CRITICAL,
+        "Oxygen saturation is falling steadily ({slope}% per hour over {minutes} minutes), now {value}%",
+    ),
+    TrendRule(
+        'temperature_rise', 'temperature', RISE, 1.0, 240, 2, WARNING,
+        "Temperature rose {change}°C within {minutes} minutes to {value}°C",
+    ),
+]
+
+class TrendAlert(namedtuple('TrendAlert', ['row', 'rule', 'value', 'change', 'slope', 'message'])):
+    """A trend rule that fired; ``row`` indexes the evaluated batch"""
+    __slots__ = ()
+
+    @property
+    def is_critical(self):
+        return self.rule.criticality == CRITICAL
+
+
+class RollingWindow:
+    """
+    Mean, least-squares slope and range of one parameter over the last ``seconds``
+
+    Running sums are adjusted as readings enter and leave the window, and
+    monotonic deques keep the candidates for its minimum and maximum, so a
+    reading costs O(1) amortised however many the window holds. Readings
+    must arrive in time order; older ones, and repeats of the latest (e.g.
+    from a retried batch), are ignored.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.readings = deque()
+        self.lows = deque()
+        self.highs = deque()
+        # Times are summed relative to origin so the sums stay small
+        self.origin = None
+        self.sum_t = self.sum_y = self.sum_tt = self.sum_ty = 0.0
+
+    def add(self, t, y):
+        """Add a reading at ``t`` (seconds); returns False unless it is newer than the latest"""
+        if self.readings and t <= self.readings[-1][0]:
+            return False
+        if self.origin is None:
+            self.origin = t
+        self.readings.append((t, y))
+        self._count(t, y, 1)
+
+        while self.lows and self.lows[-1][1] >= y:
+            self.lows.pop()
+        self.lows.append((t, y))
+        while self.highs and self.highs[-1][1] <= y:
+            self.highs.pop()
+        self.highs.append((t, y))
+
+        cutoff = t - self.seconds
+        while self.readings[0][0] < cutoff:
+            self._count(*self.readings.popleft(), -1)
+        while self.lows[0][0] < cutoff:
+            self.lows.popleft()
+        while self.highs[0][0] < cutoff:
+            self.highs.popleft()
+
+        if self.readings[0][0] - self.origin > self.seconds:
+            # At most once per window length, so still O(1) amortised
+            self._rebase()
+        return True
+
+    def _count(self, t, y, sign):
+        x = t - self.origin
+        self.sum_t += sign * x
+        self.sum_y += sign * y
+        self.sum_tt += sign * x * x
+        self.sum_ty += sign * x * y
+
+    def _rebase(self):
+        self.origin = self.readings[0][0]
+        self.sum_t = self.sum_y = self.sum_tt = self.sum_ty = 0.0
+        for t, y in self.readings:
+            self._count(t, y, 1)
+
+    @property
+    def count(self):
+        return len(self.readings)
+
+    @property
+    def latest(self):
+        return self.readings[-1][1] if self.readings else None
+
+    @property
+    def minimum(self):
+        return self.lows[0][1] if self.lows else None
+
+    @property
+    def maximum(self):
+        return self.highs[0][1] if self.highs else None
+
+    @property
+    def mean(self):
+        return self.sum_y / self.count if self.readings else None
+
+    @property
+    def slope(self):
+        """Least-squares change per hour, or None without two distinct times"""
+        n = self.count
+        spread = n * self.sum_tt - self.sum_t * self.sum_t
+        if n < 2 or spread <= 1e-9:
+            return None
+        return (n * self.sum_ty - self.sum_t * self.sum_y) / spread * 3600
+
+
+class PatientTrends:
+    """One patient's rolling windows, keyed by (parameter, minutes), and when each rule last fired"""
+
+    def __init__(self):
+        self.windows = {}
+        self.fired = {}
+
+    def to_json(self):
+        """The readings in each window and when each rule fired, as stored in VitalTrendState"""
+        return {
+            'windows': [
+                [parameter, minutes, [list(reading) for reading in window.readings]]
+                for (parameter, minutes), window in self.windows.items()
+            ],
+            'fired': self.fired,
+        }
+
+    @classmethod
+    def from_json(cls, state):
+        """Rebuild from to_json() output by replaying each window's readings"""
+        trends = cls()
+        for parameter, minutes, readings in state.get('windows', ()):
+            window = trends.windows[(parameter, minutes)] = RollingWindow(minutes * 60)
+            for t, y in readings:
+                window.add(t, y)
+        trends.fired = dict(state.get('fired', {}))
+        return trends
+
+    def add(self, row, recorded_at, values, rules):
+        """Feed one reading ({parameter: value}) and return the TrendAlerts it raises"""
+        t = recorded_at.timestamp()
+        updated = set()
+        for rule in rules:
+            key = (rule.parameter, rule.minutes)
+            value = values.get(rule.parameter)
+            if value is None or key in updated:
+                continue
+            window = self.windows.get(key)
+            if window is None:
+                window = self.windows[key] = RollingWindow(rule.minutes * 60)
+            if window.add(t, float(value)):
+                updated.add(key)
+
+        alerts = []
+        for rule in rules:
+            window = self.windows.get((rule.parameter, rule.minutes))
+            if (rule.parameter, rule.minutes) not in updated or window.count < rule.min_readings:
+                continue
+            if t - self.fired.get(rule.name, float('-inf')) < rule.minutes * 60:
+                continue
+            alert = _check(rule, window, row)
+            if alert:
+                self.fired[rule.name] = t
+                alerts.append(alert)
+        return alerts
+
+
+def _check(rule, window, row):
+    slope = window.slope
+    if rule.kind == RISE:
+        change = window.latest - window.minimum
+    elif rule.kind == FALL:
+        change = window.maximum - window.latest
+    else:
+        change = window.maximum - window.latest
+        if slope is None or slope > -rule.amount:
+            return None
+    if rule.kind != DECLINE and change < rule.amount:
+        return None
+
+    message = rule.message.format(
+        value=_display(window.latest),
+        change=_display(change),
+        slope=_display(slope) if slope is not None else '',
+        minutes=rule.minutes,
+    )
+    return TrendAlert(row, rule, window.latest, change, slope, message)
+
+
+def _display(number):
+    number = round(number, 1)
+    return int(number) if number == int(number) else number
+
+
+def update_trends(records, rules=None):
+    """
+    Feed new VitalSigns into their patients' rolling windows
+
+    Each patient's windows are a VitalTrendState row, fed by the vitals job
+    queue one batch at a time in the order readings were saved (see
+    JOB_CONCURRENCY). The rows of a batch are read
+    with one locking query and written back with one upsert, in the caller's
+    transaction, so a batch that rolls back leaves them as they were and
+    concurrent batches cannot overwrite each other's readings. Readings are
+    taken in time order and rules are checked after each one. Returns the
+    TrendAlerts raised, ordered by row.
+    """
+    from .models import VitalTrendState
+
+    rules = DEFAULT_TREND_RULES if rules is None else rules
+    if not records or not rules:
+        return []
+
+    with transaction.atomic(savepoint=False):
+        rows = VitalTrendState.objects.select_for_update().filter(
+            patient_id__in={record.patient_id for record in records}
+        )
+        states = {row.patient_id: PatientTrends.from_json(row.state) for row in rows}
+
+        alerts = []
+        for row in sorted(range(len(records)), key=lambda row: records[row].recorded_at):
+            record = records[row]
+            state = states.setdefault(record.patient_id, PatientTrends())
+            values = {rule.parameter: getattr(record, rule.parameter) for rule in rules}
+            alerts.extend(state.add(row, record.recorded_at, values, rules))
+
+        VitalTrendState.objects.bulk_create(
+            [VitalTrendState(patient_id=patient_id, state=state.to_json()) for patient_id, state in states.items()],
+            update_conflicts=True, unique_fields=['patient'], update_fields=['state', 'updated_at'],
+        )
+    alerts.sort(key=lambda alert: alert.row)
+    return alerts
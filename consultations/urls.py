@@ -25,6 +25,7 @@ urlpatterns = [
     # Notifications
     path('notifications/', views.notifications, name='notifications'),
     path('notifications/<int:notification_id>/read/', views.mark_notification_read, name='mark_notification_read'),
+    path('notifications/stream/', views.notification_stream, name='notification_stream'),
     
     # Dashboards
     path('technician-dashboard/', views.technician_dashboard, name='technician_dashboard'),
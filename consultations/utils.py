@@ -1,117 +1,192 @@
 def check_vital_signs_thresholds(vital_signs, patient):
     """
     Check vital signs against clinical thresholds and create notifications if needed
-    
+
+    Every abnormal finding for the record is collected first, recipients are
+    resolved once, and all notifications are written with a single bulk insert
+    after the surrounding transaction commits.
+
     Parameters:
     vital_signs: The vital signs record to check
     patient: The patient these vital signs belong to
     """
-    # Import here to avoid circular imports
+    vital_signs.patient = patient
+    return check_vital_signs_batch([vital_signs])
+
+def check_vital_signs_batch(vital_signs_list):
+    """
+    Check many vital signs records at once and create notifications if needed
+
+    Readings are scored together against the threshold rule table (see
+    consultations.thresholds) and fed to the patients' rolling trend windows
+    (see consultations.trends). Recipients are resolved once for the whole
+    batch and every notification is written with a single bulk insert.
+    Each record must have its patient loaded so no per-row queries are made.
+
+    Returns the list of (unsaved until commit) notifications.
+    """
+    from consultations.thresholds import evaluate_vital_signs
+    from consultations.trends import update_trends
+
+    breaches = evaluate_vital_signs(vital_signs_list)
+    trend_alerts = update_trends(vital_signs_list)
+
+    notifications = []
+    if not breaches and not trend_alerts:
+        return notifications
+
+    technicians, neurologists = get_alert_recipients()
+    for breach in breaches:
+        patient = vital_signs_list[breach.row].patient
+        _create_notifications(technicians, neurologists, patient, breach.message, breach.is_critical, notifications)
+    for alert in trend_alerts:
+        patient = vital_signs_list[alert.row].patient
+        _create_notifications(
+            technicians, neurologists, patient, alert.message, alert.is_critical, notifications,
+            title='Deteriorating Vital Sign', critical_title='CRITICAL Vital Sign Trend'
+        )
+
+    dispatch_notifications(notifications)
+    return notifications
+
+def get_alert_recipients():
+    """
+    Resolve the staff who receive abnormal-vital alerts in a single query
+
+    Returns a (technicians, neurologists) tuple of lists, selected on the
+    indexed role column.
+    """
     from django.contrib.auth import get_user_model
+
+    User = get_user_model()
+
+    technicians, neurologists = [], []
+    staff = User.objects.filter(
+        role__in=[User.Role.TECHNICIAN, User.Role.NEUROLOGIST],
+        is_active=True
+    ).only('id', 'role')
+    for user in staff:
+        if user.role == User.Role.TECHNICIAN:
+            technicians.append(user)
+        else:
+            neurologists.append(user)
+    return technicians, neurologists
+
+def dispatch_notifications(notifications):
+    """
+    Write unsaved notifications with one bulk insert once the current
+    transaction commits (immediately when no transaction is open)
+    """
+    from django.db import transaction
+
+    if not notifications:
+        return
+
+    transaction.on_commit(lambda: _write_notifications(notifications))
+
+def _write_notifications(notifications):
+    from collections import Counter
+    from consultations.models import Notification
+
+    from consultations.events import hub
+
+    Notification.objects.bulk_create(notifications)
+    adjust_unread_counts(Counter(n.user_id for n in notifications if not n.is_read))
+    hub.publish(notifications)
+
+def create_notification(**fields):
+    """
+    Create a single notification, bump its recipient's unread counter and
+    push it to their open streams once the transaction commits
+    """
+    from django.db import transaction
+    from consultations.events import hub
     from consultations.models import Notification
-    
+
+    notification = Notification.objects.create(**fields)
+    if not notification.is_read:
+        adjust_unread_counts({notification.user_id: 1})
+    transaction.on_commit(lambda: hub.publish([notification]))
+    return notification
+
+def mark_notifications_read(user, notifications):
+    """
+    Mark a user's notifications as read and lower their unread counter
+
+    notifications: A Notification queryset; rows belonging to other users
+    or already read are left alone. Returns the number of rows marked.
+    """
+    updated = notifications.filter(user=user, is_read=False).update(is_read=True)
+    if updated:
+        adjust_unread_counts({user.pk: -updated})
+        # Keep the request's user in step so this response shows the new count
+        user.unread_notification_count = max(user.unread_notification_count - updated, 0)
+    return updated
+
+def adjust_unread_counts(deltas):
+    """
+    Apply {user_id: delta} changes to unread notification counters
+
+    Users sharing the same delta are updated together, so a fan-out to any
+    number of staff costs one UPDATE per distinct delta.
+    """
+    from collections import defaultdict
+    from django.contrib.auth import get_user_model
+    from django.db.models import F, Value
+    from django.db.models.functions import Greatest
+
     User = get_user_model()
-    
-    # Define thresholds
-    systolic_min, systolic_max = 90, 185
-    diastolic_min, diastolic_max = 60, 110
-    heart_rate_min, heart_rate_max = 50, 120
-    resp_rate_min, resp_rate_max = 10, 30
-    temp_min, temp_max = 35.0, 38.5
-    o2_min, o2_max = 92, 100
-    glucose_min, glucose_max = 50, 400
-    
-    # Find users to notify
-    technicians = User.objects.filter(is_technician=True)
-    neurologists = User.objects.filter(is_neurologist=True)
-    
-    notifications = []
-    
-    # Systolic BP
-    if vital_signs.blood_pressure_systolic < systolic_min:
-        message = f"Systolic BP is critically low at {vital_signs.blood_pressure_systolic} mmHg"
-        _create_notifications(technicians, neurologists, patient, message, True, notifications)
-    elif vital_signs.blood_pressure_systolic > systolic_max:
-        message = f"Systolic BP exceeds tPA threshold at {vital_signs.blood_pressure_systolic} mmHg"
-        _create_notifications(technicians, neurologists, patient, message, True, notifications)
-    
-    # Diastolic BP
-    if vital_signs.blood_pressure_diastolic < diastolic_min:
-        message = f"Diastolic BP is critically low at {vital_signs.blood_pressure_diastolic} mmHg"
-        _create_notifications(technicians, neurologists, patient, message, True, notifications)
-    elif vital_signs.blood_pressure_diastolic > diastolic_max:
-        message = f"Diastolic BP exceeds tPA threshold at {vital_signs.blood_pressure_diastolic} mmHg"
-        _create_notifications(technicians, neurologists, patient, message, True, notifications)
-    
-    # Heart rate
-    if vital_signs.heart_rate < heart_rate_min:
-        message = f"Heart rate is critically low at {vital_signs.heart_rate} bpm"
-        _create_notifications(technicians, neurologists, patient, message, False, notifications)
-    elif vital_signs.heart_rate > heart_rate_max:
-        message = f"Heart rate is critically elevated at {vital_signs.heart_rate} bpm"
-        _create_notifications(technicians, neurologists, patient, message, False, notifications)
-    
-    # Respiratory rate
-    if vital_signs.respiratory_rate < resp_rate_min:
-        message = f"Respiratory rate is critically low at {vital_signs.respiratory_rate} br/min"
-        _create_notifications(technicians, neurologists, patient, message, False, notifications)
-    elif vital_signs.respiratory_rate > resp_rate_max:
-        message = f"Respiratory rate is critically elevated at {vital_signs.respiratory_rate} br/min"
-        _create_notifications(technicians, neurologists, patient, message, False, notifications)
-    
-    # Temperature
-    if vital_signs.temperature < temp_min:
-        message = f"Temperature is critically low at {vital_signs.temperature}°C"
-        _create_notifications(technicians, neurologists, patient, message, False, notifications)
-    elif vital_signs.temperature > temp_max:
-        message = f"Temperature is critically elevated at {vital_signs.temperature}°C"
-        _create_notifications(technicians, neurologists, patient, message, False, notifications)
-    
-    # Oxygen saturation
-    if vital_signs.oxygen_saturation < o2_min:
-        message = f"Oxygen saturation is critically low at {vital_signs.oxygen_saturation}%"
-        _create_notifications(technicians, neurologists, patient, message, True, notifications)
-    
-    # Blood glucose (if provided)
-    if vital_signs.blood_glucose is not None:
-        if vital_signs.blood_glucose < glucose_min:
-            message = f"Blood glucose is critically low at {vital_signs.blood_glucose} mg/dL"
-            _create_notifications(technicians, neurologists, patient, message, True, notifications)
-        elif vital_signs.blood_glucose > glucose_max:
-            message = f"Blood glucose exceeds tPA threshold at {vital_signs.blood_glucose} mg/dL"
-            _create_notifications(technicians, neurologists, patient, message, True, notifications)
-    
-    return notifications
 
-def _create_notifications(technicians, neurologists, patient, message, is_critical, notifications_list):
-    """Helper function to create notifications for users"""
+    by_delta = defaultdict(list)
+    for user_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(user_id)
+
+    for delta, user_ids in by_delta.items():
+        User.objects.filter(pk__in=user_ids).update(
+            unread_notification_count=Greatest(F('unread_notification_count') + delta, Value(0))
+        )
+
+def recount_unread_notifications(users=None):
+    """Rebuild unread counters from the notification table (all users by default)"""
+    from django.contrib.auth import get_user_model
+    from django.db.models import Count, Q
+
+    User = get_user_model()
+
+    users = User.objects.all() if users is None else users
+    counted = users.annotate(unread=Count('notifications', filter=Q(notifications__is_read=False)))
+    for user in counted.only('id', 'unread_notification_count').iterator():
+        if user.unread != user.unread_notification_count:
+            User.objects.filter(pk=user.pk).update(unread_notification_count=user.unread)
+
+def _create_notifications(technicians, neurologists, patient, message, is_critical, notifications_list,
+                          title='Abnormal Vital Sign', critical_title='CRITICAL Vital Sign'):
+    """Helper function to build (unsaved) notifications for users"""
     from consultations.models import Notification
     from django.urls import reverse
-    
+
     # Create patient URL for linking in notifications
     patient_url = reverse('patients:detail', kwargs={'patient_id': patient.id})
-    
+    patient_name = f"{patient.first_name} {patient.last_name}"
+
     # Always notify technicians
     for tech in technicians:
-        notification = Notification(
+        notifications_list.append(Notification(
             user=tech,
             notification_type='SYSTEM',
-            title=f"Abnormal Vital Sign - {patient.first_name} {patient.last_name}",
-            message=f"{message} for patient {patient.first_name} {patient.last_name}. Immediate attention may be required.",
+            title=f"{title} - {patient_name}",
+            message=f"{message} for patient {patient_name}. Immediate attention may be required.",
             related_url=patient_url
-        )
-        notification.save()
-        notifications_list.append(notification)
-    
+        ))
+
     # Notify neurologists for critical values
     if is_critical:
         for neuro in neurologists:
-            notification = Notification(
+            notifications_list.append(Notification(
                 user=neuro,
                 notification_type='SYSTEM',
-                title=f"CRITICAL Vital Sign - {patient.first_name} {patient.last_name}",
-                message=f"CRITICAL: {message} for patient {patient.first_name} {patient.last_name}. Immediate assessment required.",
+                title=f"{critical_title} - {patient_name}",
+                message=f"CRITICAL: {message} for patient {patient_name}. Immediate assessment required.",
                 related_url=patient_url
-            )
-            notification.save()
-            notifications_list.append(notification)
\ No newline at end of file
+            ))
@@ -1,5 +1,10 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 from django.db.models import Q
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.http import url_has_allowed_host_and_scheme
 from assessments.models import VitalSigns
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
@@ -7,8 +12,15 @@ from django.contrib import messages
 from django.utils import timezone
 from patients.models import Patient
 from .models import Consultation, TPARequest, Notification
-from .forms import (ConsultationRequestForm, ConsultationCompleteForm, 
+from .forms import (ConsultationRequestForm, ConsultationUpdateForm, ConsultationCompleteForm,
                    TPARequestForm, TPAReviewForm, TPAAdministrationForm)
+from stroke_unit.pagination import paginate_by_cursor
+from .utils import create_notification, mark_notifications_read
+from .jobs import enqueue
+from .tasks import (notify_consultation_requested, notify_consultation_updated,
+                    notify_tpa_administered, notify_tpa_reviewed)
+from .events import format_event, hub, notification_payload
+from .stats import get_unit_statistics
 
 
 
@@ -111,17 +123,9 @@ def request_consultation(request, patient_id):
             status='REQUESTED'
         )
         
-        # Create notification for neurologists
-        from accounts.models import User
-        neurologists = User.objects.filter(role='NEUROLOGIST')
-        for neurologist in neurologists:
-            Notification.objects.create(
-                user=neurologist,
-                notification_type='CONSULTATION',
-                title='New Consultation Request',
-                message=f'New consultation requested for {patient.first_name} {patient.last_name}',
-                related_consultation=consultation
-            )
+        # Neurologists are notified by a background job once this commits
+        enqueue(notify_consultation_requested, key=f'consultation-requested:{consultation.id}',
+                consultation_id=consultation.id)
         
         messages.success(request, "Consultation request submitted successfully.")
         return redirect('consultations:detail', consultation_id=consultation.id)
@@ -162,11 +166,10 @@ def consultation_detail(request, consultation_id):
     
     # Mark related notifications as read
     if request.user.is_authenticated:
-        Notification.objects.filter(
-            user=request.user,
-            related_consultation=consultation,
-            is_read=False
-        ).update(is_read=True)
+        mark_notifications_read(
+            request.user,
+            Notification.objects.filter(related_consultation=consultation)
+        )
     
     return render(request, 'consultations/consultation_detail.html', {
         'consultation': consultation,
@@ -206,7 +209,7 @@ def accept_consultation(request, consultation_id):
     
     # Create notification for the technician
     if consultation.requested_by:
-        Notification.objects.create(
+        create_notification(
             user=consultation.requested_by,
             notification_type='CONSULTATION',
             title='Consultation Accepted',
@@ -254,13 +257,13 @@ def request_tpa(request, consultation_id):
     })
 
 @login_required
-def review_tpa(request, tpa_id):
+def review_tpa(request, tpa_request_id):
     """Review tPA request - for neurologists only"""
     if not request.user.is_neurologist:
         messages.error(request, "Only neurologists can review tPA requests.")
         return redirect('home')
     
-    tpa_request = get_object_or_404(TPARequest, id=tpa_id)
+    tpa_request = get_object_or_404(TPARequest, id=tpa_request_id)
     consultation = tpa_request.consultation
     
     if request.method == 'POST':
@@ -271,23 +274,11 @@ def review_tpa(request, tpa_id):
             tpa_request.reviewed_at = timezone.now()
             tpa_request.save()
             
-            # Create notification for the technician and patient
-            Notification.objects.create(
-                user=tpa_request.requested_by,
-                notification_type='TPA',
-                title='tPA Request Reviewed',
-                message=f'tPA request for {consultation.patient.get_full_name()} has been {tpa_request.status.lower()}.',
-                related_tpa_request=tpa_request
-            )
-            
-            if consultation.patient.user_account:
-                Notification.objects.create(
-                    user=consultation.patient.user_account,
-                    notification_type='TPA',
-                    title='tPA Request Update',
-                    message=f'Your tPA request has been {tpa_request.status.lower()} by Dr. {request.user.get_full_name()}.',
-                    related_tpa_request=tpa_request
-                )
+            # Notify the technician and patient in the background; the key
+            # names this review, so a later one notifies again
+            enqueue(notify_tpa_reviewed, key=f'tpa-reviewed:{tpa_request.id}:{tpa_request.reviewed_at.isoformat()}',
+                    tpa_request_id=tpa_request.id, status=tpa_request.status,
+                    reviewer_name=request.user.get_full_name())
             
             messages.success(request, "tPA request has been reviewed.")
             return redirect('consultations:detail', consultation_id=consultation.id)
@@ -301,13 +292,13 @@ def review_tpa(request, tpa_id):
     })
 
 @login_required
-def administer_tpa(request, tpa_id):
+def administer_tpa(request, tpa_request_id):
     """Record tPA administration - for technicians only"""
     if not request.user.is_technician:
         messages.error(request, "Only technicians can record tPA administration.")
         return redirect('home')
     
-    tpa_request = get_object_or_404(TPARequest, id=tpa_id)
+    tpa_request = get_object_or_404(TPARequest, id=tpa_request_id)
     consultation = tpa_request.consultation
     
     if tpa_request.status != 'APPROVED':
@@ -323,15 +314,11 @@ def administer_tpa(request, tpa_id):
                 tpa_request.administered_at = timezone.now()
             tpa_request.save()
             
-            # Create notification for the patient
-            if consultation.patient.user_account:
-                Notification.objects.create(
-                    user=consultation.patient.user_account,
-                    notification_type='TPA',
-                    title='tPA Administered',
-                    message='tPA has been administered for your stroke treatment.',
-                    related_tpa_request=tpa_request
-                )
+            # Notify the patient in the background
+            if tpa_request.administered:
+                enqueue(notify_tpa_administered,
+                        key=f'tpa-administered:{tpa_request.id}:{tpa_request.administered_at.isoformat()}',
+                        tpa_request_id=tpa_request.id)
             
             messages.success(request, "tPA administration has been recorded.")
             return redirect('consultations:detail', consultation_id=consultation.id)
@@ -350,8 +337,7 @@ def notification_list(request):
     notifications = request.user.notifications.order_by('-created_at')
     
     # Mark all as read when viewed
-    unread = notifications.filter(is_read=False)
-    unread.update(is_read=True)
+    mark_notifications_read(request.user, notifications)
     
     return render(request, 'consultations/notification_list.html', {
         'notifications': notifications
@@ -364,8 +350,8 @@ def notification_detail(request, notification_id):
     
     # Mark as read
     if not notification.is_read:
+        mark_notifications_read(request.user, Notification.objects.filter(id=notification.id))
         notification.is_read = True
-        notification.save()
     
     # Determine related object to display
     related_object = None
@@ -391,7 +377,7 @@ def technician_dashboard(request):
     # Get recent consultations
     active_consultations = Consultation.objects.filter(
         status__in=['REQUESTED', 'IN_PROGRESS']
-    ).order_by('-requested_at')[:5]
+    ).select_related('patient').order_by('-requested_at')[:5]
     
     # Get recent patients
     recent_patients = Patient.objects.all().order_by('-registration_date' if hasattr(Patient, 'registration_date') else '-id')[:5]
@@ -399,16 +385,17 @@ def technician_dashboard(request):
     # Get pending tPA requests
     pending_tpa_requests = TPARequest.objects.filter(
         status='REQUESTED'
-    ).order_by('-requested_at')[:5]
+    ).select_related('consultation__patient').order_by('-requested_at')[:5]
     
-    # Get notification count
-    notification_count = Notification.objects.filter(user=request.user, is_read=False).count()
+    # Get notification count (maintained incrementally on the user)
+    notification_count = request.user.unread_notification_count
     
     return render(request, 'consultations/technician_dashboard.html', {
         'active_consultations': active_consultations,
         'recent_patients': recent_patients,
         'pending_tpa_requests': pending_tpa_requests,
-        'notification_count': notification_count
+        'notification_count': notification_count,
+        'unit_stats': get_unit_statistics(),
     })
 
 
@@ -429,119 +416,49 @@ def neurologist_dashboard(request):
         messages.error(request, "You don't have permission to access the neurologist dashboard.")
         return redirect('home')
     
-    # Get pending consultations (no neurologist assigned or assigned to this neurologist)
+    from django.db.models import Count
+    
+    # Consultations this neurologist can act on: assigned to them or unassigned
+    mine_or_unassigned = Q(neurologist=request.user) | Q(neurologist=None)
+    
+    # Every counter in one conditional-aggregate query
+    # (every counter is within mine_or_unassigned, so only those rows are read)
+    counts = Consultation.objects.filter(mine_or_unassigned).aggregate(
+        pending_consultations_count=Count('id', filter=Q(status='REQUESTED', neurologist=None)),
+        in_progress_consultations_count=Count('id', filter=Q(status='IN_PROGRESS', neurologist=request.user)),
+        pending_tpa_count=Count('tpa_request', filter=Q(tpa_request__status='REQUESTED')),
+    )
+    
+    # One joined fetch per panel, each capped so queue depth only changes the counters
     pending_consultations = Consultation.objects.filter(
         status='REQUESTED',
         neurologist=None
-    ).order_by('-requested_at')[:10]
+    ).select_related('patient', 'requested_by').order_by('-requested_at')[:10]
     
-    # Get in-progress consultations assigned to this neurologist
     in_progress_consultations = Consultation.objects.filter(
         status='IN_PROGRESS',
         neurologist=request.user
-    ).order_by('-started_at')[:10]
+    ).select_related('patient').order_by('-started_at')[:10]
     
-    # Get recently completed consultations by this neurologist
     recent_completed_consultations = Consultation.objects.filter(
         status='COMPLETED', 
         neurologist=request.user
-    ).order_by('-completed_at')[:5]
+    ).select_related('patient').order_by('-completed_at')[:5]
     
-    # Get pending tPA requests
     pending_tpa_requests = TPARequest.objects.filter(
-        status='REQUESTED',
-        consultation__neurologist=request.user
-    ) | TPARequest.objects.filter(
-        status='REQUESTED',
-        consultation__neurologist=None
-    ).order_by('-requested_at')
-    
-    # Get counts for the dashboard stats
-    pending_consultations_count = Consultation.objects.filter(
-        status='REQUESTED', 
-        neurologist=None
-    ).count()
-    
-    in_progress_consultations_count = Consultation.objects.filter(
-        status='IN_PROGRESS', 
-        neurologist=request.user
-    ).count()
-    
-    pending_tpa_count = pending_tpa_requests.count()
+        Q(consultation__neurologist=request.user) | Q(consultation__neurologist=None),
+        status='REQUESTED'
+    ).select_related('consultation__patient', 'requested_by').order_by('-requested_at')[:10]
     
     return render(request, 'consultations/neurologist_dashboard.html', {
+        'unit_stats': get_unit_statistics(),
         'pending_consultations': pending_consultations,
-        'in_progress_consultations': in_progress_consultations,
+        'active_consultations': in_progress_consultations,
         'recent_completed_consultations': recent_completed_consultations,
         'pending_tpa_requests': pending_tpa_requests,
-        'pending_consultations_count': pending_consultations_count,
-        'in_progress_consultations_count': in_progress_consultations_count,
-        'pending_tpa_count': pending_tpa_count,
+        **counts,
     })
 
-# @login_required
-# def notifications(request):
-#     return render(request, 'consultations/notifications.html', {'notifications': []})
-
-@login_required
-def notifications(request):
-    """View system notifications for the current user"""
-    notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
-    
-    # Mark all as read if requested
-    if request.GET.get('mark_all_read'):
-        notifications.update(is_read=True)
-        messages.success(request, "All notifications marked as read")
-        return redirect('consultations:notifications')
-    
-    # Mark one as read if requested
-    if request.GET.get('mark_read'):
-        try:
-            notif_id = int(request.GET.get('mark_read'))
-            notif = Notification.objects.get(id=notif_id, user=request.user)
-            notif.is_read = True
-            notif.save()
-            messages.success(request, "Notification marked as read")
-            
-            # If there's a next parameter, redirect there
-            next_url = request.GET.get('next')
-            if next_url:
-                return HttpResponseRedirect(next_url)
-        except (ValueError, Notification.DoesNotExist):
-            messages.error(request, "Notification not found")
-        
-        return redirect('consultations:notifications')
-    
-    # View notification and redirect to related URL if provided
-    if request.GET.get('view'):
-        try:
-            notif_id = int(request.GET.get('view'))
-            notif = Notification.objects.get(id=notif_id, user=request.user)
-            
-            # Mark as read
-            notif.is_read = True
-            notif.save()
-            
-            # Redirect to related content if available
-            if notif.related_consultation:
-                return redirect('consultations:detail', consultation_id=notif.related_consultation.id)
-            elif notif.related_tpa_request:
-                return redirect('consultations:detail', consultation_id=notif.related_tpa_request.consultation.id)
-            elif notif.related_url:
-                return HttpResponseRedirect(notif.related_url)
-            
-            messages.info(request, "Viewed notification: " + notif.title)
-        except (ValueError, Notification.DoesNotExist):
-            messages.error(request, "Notification not found")
-            
-    unread_count = notifications.filter(is_read=False).count()
-    
-    return render(request, 'consultations/notifications.html', {
-        'notifications': notifications,
-        'unread_count': unread_count
-    })
-
-
 @login_required
 def update_consultation(request, consultation_id):
     """Update an existing consultation"""
@@ -568,15 +485,10 @@ def update_consultation(request, consultation_id):
                 consultation.completed_at = timezone.now()
                 consultation.save()
                 
-                # Create notification for technician
-                if consultation.requested_by:
-                    Notification.objects.create(
-                        user=consultation.requested_by,
-                        notification_type='CONSULTATION',
-                        title='Consultation Completed',
-                        message=f'Consultation for {consultation.patient.first_name} {consultation.patient.last_name} has been completed.',
-                        related_consultation=consultation
-                    )
+                # Notify the technician in the background
+                enqueue(notify_consultation_updated,
+                        key=f'consultation-completed:{consultation.id}:{consultation.completed_at.isoformat()}',
+                        consultation_id=consultation.id, status=consultation.status, completed=True)
                 
                 messages.success(request, "Consultation completed successfully.")
                 return redirect('consultations:detail', consultation_id=consultation_id)
@@ -596,15 +508,12 @@ def update_consultation(request, consultation_id):
                     
                 consultation.save()
                 
-                # Create notification for technician
-                if consultation.requested_by:
-                    Notification.objects.create(
-                        user=consultation.requested_by,
-                        notification_type='CONSULTATION',
-                        title='Consultation Update',
-                        message=f'Consultation for {consultation.patient.first_name} {consultation.patient.last_name} status updated to {consultation.get_status_display()}.',
-                        related_consultation=consultation
-                    )
+                # Notify the technician in the background; the key names this
+                # change, so returning to an earlier status notifies again
+                changed_at = timezone.now()
+                enqueue(notify_consultation_updated,
+                        key=f'consultation-status:{consultation.id}:{changed_at.isoformat()}',
+                        consultation_id=consultation.id, status=consultation.status)
                 
                 messages.success(request, "Consultation updated successfully.")
                 return redirect('consultations:detail', consultation_id=consultation_id)
@@ -628,8 +537,7 @@ def update_consultation(request, consultation_id):
 def mark_notification_read(request, notification_id):
     """Mark a specific notification as read"""
     notification = get_object_or_404(Notification, id=notification_id, user=request.user)
-    notification.is_read = True
-    notification.save()
+    mark_notifications_read(request.user, Notification.objects.filter(id=notification.id))
     
     # Redirect to related content if available
     if notification.related_consultation:
@@ -643,28 +551,165 @@ def mark_notification_read(request, notification_id):
 @login_required
 def notifications(request):
     """View and manage user notifications"""
-    notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
+    notifications = Notification.objects.filter(user=request.user)
     
     # Mark all as read if requested
-    if request.method == 'POST' and 'mark_all_read' in request.POST:
-        notifications.update(is_read=True)
+    if request.GET.get('mark_all_read') or (request.method == 'POST' and 'mark_all_read' in request.POST):
+        mark_notifications_read(request.user, notifications)
         messages.success(request, "All notifications marked as read.")
         return redirect('consultations:notifications')
     
+    # Mark one as read if requested
+    if request.GET.get('mark_read'):
+        try:
+            notif = notifications.get(id=int(request.GET.get('mark_read')))
+            mark_notifications_read(request.user, notifications.filter(id=notif.id))
+            messages.success(request, "Notification marked as read")
+            
+            # If there's a next parameter, redirect there
+            next_url = request.GET.get('next')
+            if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+                return HttpResponseRedirect(next_url)
+        except (ValueError, Notification.DoesNotExist):
+            messages.error(request, "Notification not found")
+        
+        return redirect('consultations:notifications')
+    
+    # View notification and redirect to related URL if provided
+    if request.GET.get('view'):
+        try:
+            notif = notifications.select_related('related_tpa_request').get(id=int(request.GET.get('view')))
+            mark_notifications_read(request.user, notifications.filter(id=notif.id))
+            
+            # Redirect to related content if available
+            if notif.related_consultation_id:
+                return redirect('consultations:detail', consultation_id=notif.related_consultation_id)
+            elif notif.related_tpa_request:
+                return redirect('consultations:detail', consultation_id=notif.related_tpa_request.consultation_id)
+            elif notif.related_url:
+                return HttpResponseRedirect(notif.related_url)
+            
+            messages.info(request, "Viewed notification: " + notif.title)
+        except (ValueError, Notification.DoesNotExist):
+            messages.error(request, "Notification not found")
+    
+    # Newest first, one page at a time
+    page = paginate_by_cursor(
+        request,
+        notifications.select_related('related_consultation', 'related_tpa_request'),
+        ['created_at']
+    )
+    
     return render(request, 'consultations/notifications.html', {
-        'notifications': notifications,
-        'unread_count': notifications.filter(is_read=False).count()
+        'notifications': page,
+        'unread_count': request.user.unread_notification_count
     })
 
 
+# Seconds between keepalive comments on an idle notification stream
+STREAM_HEARTBEAT = 15
+
+# Seconds between database checks for notifications written by other
+# processes, e.g. the job worker; this process's own arrive through the hub
+STREAM_POLL = 1
+
+
+async def notification_stream(request):
+    """Server-sent event stream pushing the current user's new notifications"""
+    if not isinstance(request, ASGIRequest):
+        # A WSGI server would collect this endless stream into a list before
+        # sending any of it, holding a worker for good; 204 stops EventSource
+        # reconnecting
+        return HttpResponse(status=204)
+    
+    user = await sync_to_async(_authenticated_user)(request)
+    if user is None:
+        return HttpResponse(status=401)
+    
+    # Browsers send the id of the last event they saw when they reconnect
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+    
+    response = StreamingHttpResponse(
+        _notification_events(user.pk, last_event_id),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _authenticated_user(request):
+    return request.user if request.user.is_authenticated else None
+
+
+@sync_to_async
+def _notifications_after(user_id, notification_id):
+    return list(Notification.objects.filter(user_id=user_id, id__gt=notification_id).order_by('id')[:100])
+
+
+@sync_to_async
+def _latest_notification_id(user_id):
+    return Notification.objects.filter(user_id=user_id).order_by('-id').values_list('id', flat=True).first() or 0
+
+
+async def _notification_events(user_id, last_event_id):
+    subscription = hub.subscribe(user_id)
+    queue = subscription[1]
+    loop = asyncio.get_running_loop()
+    try:
+        # The database is read from its own cursor, so hub events (which can
+        # arrive out of id order with the worker's) never skip past a row
+        if last_event_id is None:
+            db_cursor = await _latest_notification_id(user_id)
+            next_poll = loop.time() + STREAM_POLL
+        else:
+            # Catch up on anything created while the client was disconnected
+            db_cursor = last_event_id
+            next_poll = loop.time()
+        
+        yield 'retry: 3000\n\n'
+        # Ids above db_cursor already sent from the hub
+        delivered = set()
+        last_sent = loop.time()
+        
+        while True:
+            try:
+                payload = await asyncio.wait_for(queue.get(), timeout=max(next_poll - loop.time(), 0))
+            except asyncio.TimeoutError:
+                payload = None
+            if payload is not None and payload['id'] > db_cursor and payload['id'] not in delivered:
+                delivered.add(payload['id'])
+                last_sent = loop.time()
+                yield format_event(payload)
+            
+            if loop.time() < next_poll:
+                continue
+            for notification in await _notifications_after(user_id, db_cursor):
+                db_cursor = notification.id
+                if notification.id not in delivered:
+                    last_sent = loop.time()
+                    yield format_event(notification_payload(notification))
+            delivered = {notification_id for notification_id in delivered if notification_id > db_cursor}
+            next_poll = loop.time() + STREAM_POLL
+            if loop.time() - last_sent >= STREAM_HEARTBEAT:
+                last_sent = loop.time()
+                yield ': keepalive\n\n'
+    finally:
+        hub.unsubscribe(user_id, subscription)
+
+
 @login_required
 def consultation_list(request):
     """View list of consultations with filtering options"""
     # Get filter parameters
     status_filter = request.GET.get('status', None)
     
-    # Base queryset
-    consultations = Consultation.objects.all()
+    # Base queryset, with the per-row relations the template renders
+    consultations = Consultation.objects.select_related('patient', 'neurologist', 'tpa_request')
     
     # Apply filters
     if status_filter:
@@ -681,8 +726,8 @@ def consultation_list(request):
                 Q(neurologist=request.user) | Q(neurologist=None)
             )
     
-    # Order by most recent first
-    consultations = consultations.order_by('-requested_at')
+    # Most recent first, one page at a time
+    consultations = paginate_by_cursor(request, consultations, ['requested_at'])
     
     return render(request, 'consultations/consultation_list.html', {
         'consultations': consultations,
@@ -0,0 +1,128 @@
+import hashlib
+import secrets
+import string
+import threading
+
+from django.db import transaction
+from django.db.models import F
+
+
+ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 8
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH
+
+# Sequence values a process reserves at a time; unused ones are simply skipped
+BLOCK_SIZE = 100
+
+# The permutation works on 42-bit blocks (two 21-bit halves), the smallest
+# even bit width covering CODE_SPACE; values past it are cycle-walked back in
+HALF_BITS = 21
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 4
+
+
+class AccessCodesExhausted(Exception):
+    pass
+
+
+def _round_keys(key):
+    return [hashlib.sha256(f'{key}:{i}'.encode()).digest()[:16] for i in range(ROUNDS)]
+
+
+def _round(round_key, half):
+    digest = hashlib.blake2b(half.to_bytes(3, 'big'), key=round_key, digest_size=4).digest()
+    return int.from_bytes(digest, 'big') & HALF_MASK
+
+
+def permute(value, round_keys):
+    """
+    Map a sequence value to a unique position in the code space
+
+    A balanced Feistel network is a bijection on 42-bit integers whatever
+    the round function; re-applying it until the result falls inside
+    CODE_SPACE keeps it a bijection on [0, CODE_SPACE).
+    """
+    while True:
+        left, right = value >> HALF_BITS, value & HALF_MASK
+        for round_key in round_keys:
+            left, right = right, left ^ _round(round_key, right)
+        value = (left << HALF_BITS) | right
+        if value < CODE_SPACE:
+            return value
+
+
+def encode(value):
+    """Fixed-length code for a position in the code space"""
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, digit = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def reserve(count):
+    """
+    Reserve ``count`` consecutive sequence values in one atomic update
+
+    Returns (key, start). Concurrent callers always get disjoint ranges.
+    """
+    from .models import AccessCodeSequence
+
+    with transaction.atomic():
+        updated = AccessCodeSequence.objects.filter(pk=1).update(next_value=F('next_value') + count)
+        if not updated:
+            AccessCodeSequence.objects.get_or_create(pk=1, defaults={'key': secrets.token_hex(32)})
+            AccessCodeSequence.objects.filter(pk=1).update(next_value=F('next_value') + count)
+        sequence = AccessCodeSequence.objects.get(pk=1)
+
+    start = sequence.next_value - count
+    if sequence.next_value > CODE_SPACE:
+        raise AccessCodesExhausted("Every access code has been issued.")
+    return sequence.key, start
+
+
+class AccessCodeAllocator:
+    """
+    Issues unique access codes without checking existing ones
+
+    Each code is the keyed permutation of a sequence value no other caller
+    can hold, so codes cannot collide and the patient table is never
+    probed. Values are reserved from the database a block at a time, so
+    most codes cost no query at all.
+    """
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._key = None
+        self._round_keys = None
+        self._next = self._end = 0
+
+    def issue(self, count=1):
+        """Return a list of ``count`` new codes"""
+        values = []
+        with self._lock:
+            while len(values) < count:
+                if self._next >= self._end:
+                    wanted = max(count - len(values), self.block_size)
+                    key, self._next = reserve(wanted)
+                    self._end = self._next + wanted
+                    if key != self._key:
+                        self._key, self._round_keys = key, _round_keys(key)
+                take = min(count - len(values), self._end - self._next)
+                values.extend(range(self._next, self._next + take))
+                self._next += take
+            round_keys = self._round_keys
+        return [encode(permute(value, round_keys)) for value in values]
+
+
+allocator = AccessCodeAllocator()
+
+
+def issue_access_code():
+    return allocator.issue(1)[0]
+
+
+def issue_access_codes(count):
+    """Issue ``count`` unique codes at once, e.g. for bulk registration"""
+    return allocator.issue(count)
@@ -0,0 +1,79 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404
+
+from .models import Patient
+
+
+# Snapshots are invalidated on every write, by web and job worker processes
+# alike (the cache is shared, see CACHES), so the timeout only bounds how
+# long an idle chart is kept
+CHART_CACHE_TIMEOUT = 60 * 60
+
+# Readings listed in the chart's vitals table; longer histories are drawn
+# from the downsampled series endpoint (assessments:vitals_series) instead
+VITALS_TABLE_ROWS = 20
+
+
+def chart_cache_key(patient_id):
+    return f'patient_chart:{patient_id}'
+
+
+def load_chart(patient_id):
+    """
+    Load a patient's chart from the database in five queries
+
+    One query for the patient and one per history (vital signs, NIHSS,
+    imaging, labs), each with the recording user joined in. Only the
+    latest VITALS_TABLE_ROWS vital signs are loaded.
+    """
+    from assessments.models import VitalSigns, NIHSSAssessment, ImagingStudy, LabResult
+
+    try:
+        patient = Patient.objects.get(id=patient_id)
+    except Patient.DoesNotExist:
+        return None
+
+    return {
+        'patient': patient,
+        'vital_signs': list(
+            VitalSigns.objects.filter(patient_id=patient_id)
+            .select_related('recorded_by').order_by('-recorded_at')[:VITALS_TABLE_ROWS]
+        ),
+        'nihss_assessments': list(
+            NIHSSAssessment.objects.filter(patient_id=patient_id)
+            .select_related('assessed_by').order_by('-assessed_at')
+        ),
+        'imaging_studies': list(
+            ImagingStudy.objects.filter(patient_id=patient_id)
+            .select_related('performed_by').order_by('-performed_at')
+        ),
+        'lab_results': list(
+            LabResult.objects.filter(patient_id=patient_id)
+            .select_related('recorded_by').order_by('-recorded_at')
+        ),
+    }
+
+
+def get_chart_snapshot(patient_id):
+    """Return the cached chart for a patient, loading it on a miss; 404 if unknown"""
+    key = chart_cache_key(patient_id)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = load_chart(patient_id)
+        if snapshot is None:
+            raise Http404("No Patient matches the given query.")
+        cache.set(key, snapshot, CHART_CACHE_TIMEOUT)
+    return snapshot
+
+
+def invalidate_chart(patient_id):
+    """
+    Drop a patient's cached chart
+
+    The entry is deleted now and again once the transaction commits, so a
+    concurrent request cannot re-cache the pre-commit state.
+    """
+    key = chart_cache_key(patient_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
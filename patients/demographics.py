@@ -0,0 +1,113 @@
+from datetime import date
+
+from django.db.models import Case, Count, Q, Value, When
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek, TruncYear
+from django.utils import timezone
+
+from .models import Patient
+
+
+# (label, youngest age, oldest age); None means no upper limit
+AGE_BANDS = [
+    ('0-18', 0, 18),
+    ('19-40', 19, 40),
+    ('41-60', 41, 60),
+    ('61-80', 61, 80),
+    ('81+', 81, None),
+]
+
+PERIODS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+
+
+def years_before(day, years):
+    """The same calendar day ``years`` earlier (Feb 29 falls back to Feb 28)"""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+def age_at_most(age, today):
+    """Q matching patients no older than ``age`` years on ``today``"""
+    # Not yet (age + 1) means born after that many years ago
+    return Q(date_of_birth__gt=years_before(today, age + 1))
+
+
+def age_band_expression(today=None):
+    """
+    CASE expression labelling each patient with their AGE_BANDS entry
+
+    Ages are turned into birth-date cutoffs here, so the database only
+    compares date_of_birth against constants.
+    """
+    today = today or timezone.localdate()
+    whens = [
+        When(age_at_most(oldest, today), then=Value(label))
+        for label, _, oldest in AGE_BANDS if oldest is not None
+    ]
+    return Case(*whens, default=Value(AGE_BANDS[-1][0]))
+
+
+def age_distribution(queryset=None, today=None):
+    """Patient count per age band as {label: count}, in one conditional-aggregate query"""
+    queryset = Patient.objects.all() if queryset is None else queryset
+    today = today or timezone.localdate()
+
+    counts = {}
+    for label, youngest, oldest in AGE_BANDS:
+        condition = Q(date_of_birth__lte=years_before(today, youngest))
+        if oldest is not None:
+            condition &= age_at_most(oldest, today)
+        counts[label] = Count('pk', filter=condition)
+    return queryset.aggregate(**counts)
+
+
+def demographics_rollup(queryset=None, period='month', today=None):
+    """
+    Patient counts by age band, gender and registration period in one query
+
+    Parameters:
+    queryset: Patients to count (all by default)
+    period: 'day', 'week', 'month' or 'year' of registration in the current
+            time zone, or None to count across all time
+    today: Date ages are calculated on (defaults to today)
+
+    Returns a list of {'age_band', 'gender', 'period', 'count'} dicts for
+    the non-empty cells, ordered by period, age band and gender. 'period'
+    is the aware start of the period, or None when not grouping by period.
+    """
+    if period is not None and period not in PERIODS:
+        raise ValueError(f"Unknown period '{period}'")
+    queryset = Patient.objects.all() if queryset is None else queryset
+
+    groups = {'age_band': age_band_expression(today)}
+    if period is not None:
+        groups['period'] = PERIODS[period]('registration_date')
+
+    rows = queryset.order_by().annotate(**groups).values('gender', *groups).annotate(count=Count('pk'))
+
+    band_order = {label: i for i, (label, _, _) in enumerate(AGE_BANDS)}
+    rollup = [
+        {
+            'age_band': row['age_band'],
+            'gender': row['gender'],
+            'period': row.get('period'),
+            'count': row['count'],
+        }
+        for row in rows
+    ]
+    rollup.sort(key=lambda row: (row['period'] or date.min, band_order[row['age_band']], row['gender']))
+    return rollup
+
+
+def totals_by(rollup, key):
+    """Sum rollup counts over one dimension, e.g. totals_by(rows, 'gender')"""
+    totals = {}
+    for row in rollup:
+        totals[row[key]] = totals.get(row[key], 0) + row['count']
+    return totals
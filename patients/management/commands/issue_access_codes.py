@@ -0,0 +1,89 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from patients.access_codes import issue_access_codes
+from patients.chart import invalidate_chart
+from patients.models import Patient
+
+
+class Command(BaseCommand):
+    help = (
+        "Issue access codes to patients without one, or with --expired rotate "
+        "codes whose expiry has passed. Work is done in chunks, each in its own "
+        "short transaction, so the command can be interrupted and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--expired', action='store_true',
+            help="Rotate expired codes instead of issuing missing ones (needs --validity-days)",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help="Patients updated per transaction (default 500)",
+        )
+        parser.add_argument(
+            '--validity-days', type=int, default=None,
+            help="Set new codes to expire after this many days (default: no expiry)",
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help="Seconds to sleep between chunks to let other writers in",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be at least 1")
+        # Rotated codes must expire too, or they would never come up for rotation again
+        if options['expired'] and options['validity_days'] is None:
+            raise CommandError("--expired requires --validity-days")
+
+        now = timezone.now()
+        expiry = None
+        if options['validity_days'] is not None:
+            expiry = now + timedelta(days=options['validity_days'])
+
+        # Selection is by state, so a re-run picks up wherever an earlier one stopped
+        if options['expired']:
+            pending = Patient.objects.filter(access_code__isnull=False, access_code_expiry__lt=now)
+            label = "Rotated"
+        else:
+            pending = Patient.objects.filter(access_code__isnull=True)
+            label = "Issued"
+
+        total = pending.count()
+        self.stdout.write(f"{total} patients to update")
+
+        done = 0
+        last_id = 0
+        while True:
+            ids = list(
+                pending.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+
+            codes = issue_access_codes(len(ids))
+            with transaction.atomic():
+                # Re-apply the filter so rows changed since they were listed are left alone
+                patients = list(pending.filter(id__in=ids).only('id', 'access_code', 'access_code_expiry'))
+                for patient, code in zip(patients, codes):
+                    patient.access_code = code
+                    patient.access_code_expiry = expiry
+                Patient.objects.bulk_update(patients, ['access_code', 'access_code_expiry'])
+                for patient in patients:
+                    invalidate_chart(patient.id)
+
+            done += len(patients)
+            last_id = ids[-1]
+            self.stdout.write(f"{label} {done}/{total} (up to patient {last_id})")
+
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(f"{label} {done} access codes"))
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 19:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0003_patient_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['-registration_date', '-id'], name='patient_registered_idx'),
+        ),
+    ]
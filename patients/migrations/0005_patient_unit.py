@@ -0,0 +1,31 @@
+# Generated by Django 4.2.10 on 2026-10-18 19:49
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+
+search_index = import_module('patients.migrations.0003_patient_search_index')
+
+
+def reinstall_search_index(apps, schema_editor):
+    # SQLite rebuilds patients_patient to change its columns, which drops
+    # the FTS triggers along with the old table
+    search_index.drop_search_index(apps, schema_editor)
+    search_index.create_search_index(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_list_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='unit',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.RunPython(reinstall_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.10 on 2026-10-18 19:51
+
+import secrets
+
+from django.db import migrations, models
+
+
+def create_sequence(apps, schema_editor):
+    AccessCodeSequence = apps.get_model('patients', 'AccessCodeSequence')
+    AccessCodeSequence.objects.get_or_create(pk=1, defaults={'key': secrets.token_hex(32)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0005_patient_unit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessCodeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('next_value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_sequence, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,5 @@
 from django.db import models
 from accounts.models import User
-from django.utils.crypto import get_random_string
 
 class Patient(models.Model):
     GENDER_CHOICES = [
@@ -24,6 +23,8 @@ class Patient(models.Model):
     registered_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='registered_patients')
     registration_date = models.DateTimeField(auto_now_add=True)
     user_account = models.OneToOneField(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='patient_record')
+    # Care unit, used to pick unit-specific vital sign alert thresholds
+    unit = models.CharField(max_length=20, blank=True)
     
     # New fields for patient portal access
     access_code = models.CharField(max_length=8, unique=True, blank=True, null=True)
@@ -38,11 +39,8 @@ class Patient(models.Model):
     # New methods for managing access codes
     def generate_access_code(self):
         """Generate a unique 8-character access code"""
-        code = get_random_string(8).upper()
-        # Make sure it's unique
-        while Patient.objects.filter(access_code=code).exists():
-            code = get_random_string(8).upper()
-        return code
+        from .access_codes import issue_access_code
+        return issue_access_code()
     
     def reset_access_code(self):
         """Generate a new access code for the patient"""
@@ -51,4 +49,22 @@ class Patient(models.Model):
         return self.access_code
     
     class Meta:
-        ordering = ['-registration_date']
\ No newline at end of file
+        ordering = ['-registration_date']
+        indexes = [
+            # Keyset pagination of the patient list
+            models.Index(fields=['-registration_date', '-id'], name='patient_registered_idx'),
+        ]
+
+class AccessCodeSequence(models.Model):
+    """
+    Single-row counter behind access code allocation (see patients.access_codes)
+
+    Codes are a keyed permutation of this sequence, so every value handed
+    out maps to a distinct code. The key is generated once and kept here so
+    that it never changes with other settings.
+    """
+    key = models.CharField(max_length=64)
+    next_value = models.PositiveBigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"Access code sequence at {self.next_value}"
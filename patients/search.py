@@ -0,0 +1,99 @@
+from django.db import connection
+from django.db.models import Q
+
+from .models import Patient
+
+
+# SQLite FTS5 index over the searchable patient columns, created and kept in
+# sync by triggers in migration 0003_patient_search_index
+FTS_TABLE = 'patients_patient_fts'
+FTS_COLUMNS = ['first_name', 'last_name', 'phone_number', 'medical_history']
+
+# bm25 column weights: name matches rank above phone and history matches
+FTS_WEIGHTS = (10.0, 10.0, 5.0, 1.0)
+
+
+def build_match_query(text):
+    """
+    Turn free text from the search box into an FTS5 MATCH expression
+
+    Every word becomes a quoted prefix phrase, so "jo smi" matches
+    "John Smith" and punctuation in phone numbers cannot break the syntax.
+    """
+    terms = []
+    for word in text.split():
+        # Words without letters or digits produce no tokens and would be
+        # an FTS5 syntax error
+        if not any(char.isalnum() for char in word):
+            continue
+        word = word.replace('"', '""')
+        terms.append(f'"{word}"*')
+    return ' '.join(terms)
+
+
+class PatientSearchResults:
+    """
+    Ranked full-text search results that can be handed to a Paginator
+
+    The total is counted once and cached; slicing fetches only the ids for
+    the requested page from the index and then loads those patients.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.match = build_match_query(query)
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            if not self.match:
+                self._count = 0
+            else:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                        [self.match]
+                    )
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        stop = self.count() if key.stop is None else key.stop
+        if not self.match or stop <= start:
+            return []
+
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}), rowid DESC LIMIT %s OFFSET %s',
+                [self.match, stop - start, start]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+
+        patients = Patient.objects.in_bulk(ids)
+        return [patients[pk] for pk in ids if pk in patients]
+
+
+def search_patients(query):
+    """
+    Search patients by name, phone number and medical history
+
+    Uses the FTS5 index on SQLite. Other database backends fall back to
+    substring matching, newest registrations first.
+    """
+    if connection.vendor == 'sqlite':
+        return PatientSearchResults(query)
+
+    return Patient.objects.filter(
+        Q(first_name__icontains=query) |
+        Q(last_name__icontains=query) |
+        Q(phone_number__icontains=query) |
+        Q(medical_history__icontains=query)
+    ).order_by('-registration_date')
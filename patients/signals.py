@@ -0,0 +1,30 @@
+from django.db.models.signals import post_delete, post_save
+
+from .chart import invalidate_chart
+
+
+# Models whose writes change what a patient's chart shows
+CHART_MODELS = [
+    'assessments.VitalSigns',
+    'assessments.NIHSSAssessment',
+    'assessments.ImagingStudy',
+    'assessments.LabResult',
+]
+
+
+def invalidate_patient_chart(sender, instance, **kwargs):
+    """Drop the cached chart of the patient a chart record belongs to"""
+    invalidate_chart(instance.patient_id)
+
+
+def invalidate_own_chart(sender, instance, **kwargs):
+    """Drop a patient's cached chart when the patient record itself changes"""
+    invalidate_chart(instance.pk)
+
+
+def connect_chart_invalidation():
+    for model in CHART_MODELS:
+        post_save.connect(invalidate_patient_chart, sender=model, dispatch_uid=f'chart_save_{model}')
+        post_delete.connect(invalidate_patient_chart, sender=model, dispatch_uid=f'chart_delete_{model}')
+    post_save.connect(invalidate_own_chart, sender='patients.Patient', dispatch_uid='chart_save_patient')
+    post_delete.connect(invalidate_own_chart, sender='patients.Patient', dispatch_uid='chart_delete_patient')
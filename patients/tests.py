@@ -1,3 +1,289 @@
+from datetime import date, timedelta
+from importlib import import_module
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from assessments.models import VitalSigns
+from stroke_unit.testing import QueryBudgetMixin
+from .access_codes import ALPHABET, CODE_LENGTH, CODE_SPACE, AccessCodeAllocator, permute
+from .chart import chart_cache_key, invalidate_chart
+from .demographics import age_distribution, demographics_rollup, totals_by
+from .models import Patient
+from .search import build_match_query, search_patients
+
+
+def make_patient(first_name, last_name, **fields):
+    fields.setdefault('date_of_birth', date(1960, 5, 17))
+    fields.setdefault('gender', 'F')
+    return Patient.objects.create(first_name=first_name, last_name=last_name, **fields)
+
+
+class PatientSearchTests(TestCase):
+
+    def test_match_query_quotes_terms(self):
+        self.assertEqual(build_match_query('jo smi'), '"jo"* "smi"*')
+        self.assertEqual(build_match_query('say "hi'), '"say"* """hi"*')
+        self.assertEqual(build_match_query('- ( *'), '')
+
+    def test_search_triggers_survive_the_migrations(self):
+        # Migrations that rebuild patients_patient on SQLite drop its triggers;
+        # each must reinstall them (see 0005_patient_unit)
+        fts_table = import_module('patients.migrations.0003_patient_search_index').FTS_TABLE
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'patients_patient'"
+            )
+            triggers = {name for name, in cursor.fetchall()}
+        self.assertLessEqual({f'{fts_table}_ai', f'{fts_table}_ad', f'{fts_table}_au'}, triggers)
+
+    def test_prefix_search_on_names_phone_and_history(self):
+        smith = make_patient('John', 'Smith', phone_number='555-123-4567')
+        jones = make_patient('Mary', 'Jones', medical_history='Type 2 diabetes, hypertension')
+
+        self.assertEqual(list(search_patients('jo smi')[:10]), [smith])
+        self.assertEqual(list(search_patients('diab')[:10]), [jones])
+        self.assertEqual(list(search_patients('555-123')[:10]), [smith])
+        self.assertEqual(search_patients('nobody').count(), 0)
+
+    def test_index_follows_updates_and_deletes(self):
+        patient = make_patient('Anna', 'Lee')
+        self.assertEqual(search_patients('anna').count(), 1)
+
+        Patient.objects.filter(pk=patient.pk).update(first_name='Hannah')
+        self.assertEqual(search_patients('anna').count(), 0)
+        self.assertEqual(search_patients('hannah').count(), 1)
+
+        patient.delete()
+        self.assertEqual(search_patients('hannah').count(), 0)
+
+    def test_name_matches_rank_above_history_matches(self):
+        history = make_patient('Ruth', 'Baker', medical_history='Referred by Dr. Carter')
+        name = make_patient('Paul', 'Carter')
+
+        self.assertEqual(list(search_patients('carter')[:10]), [name, history])
+
+    def test_list_view_paginates_search_results(self):
+        for i in range(30):
+            make_patient(f'Sam{i}', 'Walker')
+        technician = User.objects.create_user('tech', password='pw', role=User.Role.TECHNICIAN)
+        self.client.force_login(technician)
+
+        response = self.client.get(reverse('patients:list'), {'q': 'walker', 'page': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['patients']), 5)
+        self.assertEqual(response.context['page_obj'].paginator.count, 30)
+
+
+class PatientChartSnapshotTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.technician = User.objects.create_user('tech', password='pw', role=User.Role.TECHNICIAN)
+        cls.patient = make_patient('Chart', 'Patient')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.technician)
+
+    def _record_vitals(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            VitalSigns.objects.create(
+                patient=self.patient, recorded_by=self.technician,
+                blood_pressure_systolic=120, blood_pressure_diastolic=80, heart_rate=70,
+                respiratory_rate=16, temperature=37.0, oxygen_saturation=98,
+            )
+
+    def test_repeat_views_are_served_from_cache(self):
+        url = reverse('patients:detail', args=[self.patient.id])
+        for _ in range(3):
+            self._record_vitals()
+
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as warm:
+            response = self.client.get(url)
+
+        self.assertEqual(len(response.context['vital_signs']), 3)
+        tables = ('patients_patient', 'assessments_')
+        chart_queries = lambda ctx: [q for q in ctx.captured_queries if any(t in q['sql'] for t in tables)]
+        self.assertEqual(len(chart_queries(cold)), 5)
+        self.assertEqual(chart_queries(warm), [])
+
+    def test_writes_invalidate_the_snapshot(self):
+        url = reverse('patients:detail', args=[self.patient.id])
+        self.assertEqual(len(self.client.get(url).context['vital_signs']), 0)
+        self._record_vitals()
+        self.assertEqual(len(self.client.get(url).context['vital_signs']), 1)
+
+    def test_unknown_patient_is_404(self):
+        self.assertEqual(self.client.get(reverse('patients:detail', args=[999])).status_code, 404)
+
+    def test_invalidation_in_another_process_reaches_this_one(self):
+        url = reverse('patients:detail', args=[self.patient.id])
+        self.client.get(url)
+        self.assertIsNotNone(cache.get(chart_cache_key(self.patient.id)))
+
+        # A second handle on the cache directory stands in for the job worker,
+        # which invalidates the chart after making imaging derivatives
+        other_process = caches.create_connection('default')
+        with patch('patients.chart.cache', other_process), self.captureOnCommitCallbacks(execute=True):
+            invalidate_chart(self.patient.id)
+        self.assertIsNone(cache.get(chart_cache_key(self.patient.id)))
+
+
+class AccessCodeAllocatorTests(TestCase):
+
+    def test_batch_codes_are_unique_and_well_formed(self):
+        allocator = AccessCodeAllocator()
+        # One reservation for the whole batch, no lookups of existing codes
+        with self.assertNumQueries(4):
+            codes = allocator.issue(5000)
+
+        self.assertEqual(len(set(codes)), 5000)
+        self.assertTrue(all(len(code) == CODE_LENGTH and set(code) <= set(ALPHABET) for code in codes))
+
+    def test_codes_come_from_a_reserved_block(self):
+        allocator = AccessCodeAllocator(block_size=10)
+        first = allocator.issue()
+        with self.assertNumQueries(0):
+            rest = allocator.issue(9)
+        self.assertEqual(len(set(first + rest)), 10)
+
+    def test_allocators_never_share_sequence_values(self):
+        codes = AccessCodeAllocator(block_size=5).issue(3) + AccessCodeAllocator(block_size=5).issue(3)
+        self.assertEqual(len(set(codes)), 6)
+
+    def test_permutation_stays_inside_code_space(self):
+        round_keys = [b'0123456789abcdef'] * 4
+        positions = {permute(value, round_keys) for value in range(CODE_SPACE - 2000, CODE_SPACE)}
+        self.assertEqual(len(positions), 2000)
+        self.assertLess(max(positions), CODE_SPACE)
+
+    def test_reset_access_code(self):
+        patient = make_patient('Code', 'Holder')
+        code = patient.reset_access_code()
+        self.assertEqual(Patient.objects.get(access_code=code), patient)
+        self.assertNotEqual(patient.reset_access_code(), code)
+
+
+class IssueAccessCodesCommandTests(TestCase):
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('issue_access_codes', *args, stdout=out)
+        return out.getvalue()
+
+    def test_issues_missing_codes_in_chunks(self):
+        patients = [make_patient(f'No{i}', 'Code') for i in range(5)]
+        holder = make_patient('Has', 'Code', access_code='KEEPTHIS')
+
+        output = self.run_command('--chunk-size', '2', '--validity-days', '30')
+
+        self.assertIn('Issued 2/5', output)
+        self.assertIn('Issued 5/5', output)
+        codes = set(Patient.objects.filter(pk__in=[p.pk for p in patients]).values_list('access_code', flat=True))
+        self.assertEqual(len(codes), 5)
+        self.assertNotIn(None, codes)
+        self.assertFalse(Patient.objects.filter(access_code_expiry__isnull=True).exclude(pk=holder.pk).exists())
+        holder.refresh_from_db()
+        self.assertEqual(holder.access_code, 'KEEPTHIS')
+
+        # Nothing is left to do on a re-run
+        self.assertIn('Issued 0 access codes', self.run_command())
+
+    def test_rotates_only_expired_codes(self):
+        now = timezone.now()
+        expired = make_patient('Old', 'Code', access_code='EXPIRED1', access_code_expiry=now - timedelta(days=1))
+        current = make_patient('New', 'Code', access_code='CURRENT1', access_code_expiry=now + timedelta(days=1))
+
+        self.run_command('--expired', '--validity-days', '7')
+
+        expired.refresh_from_db()
+        current.refresh_from_db()
+        self.assertNotEqual(expired.access_code, 'EXPIRED1')
+        self.assertGreater(expired.access_code_expiry, now + timedelta(days=6))
+        self.assertEqual(current.access_code, 'CURRENT1')
+
+    def test_rotation_requires_a_validity_period(self):
+        expired = make_patient('Old', 'Code', access_code='EXPIRED1',
+                               access_code_expiry=timezone.now() - timedelta(days=1))
+
+        with self.assertRaisesMessage(CommandError, '--expired requires --validity-days'):
+            self.run_command('--expired')
+
+        expired.refresh_from_db()
+        self.assertEqual(expired.access_code, 'EXPIRED1')
+
+
+class DemographicsTests(TestCase):
+
+    TODAY = date(2024, 6, 15)
+
+    @classmethod
+    def setUpTestData(cls):
+        make_patient('Just', 'Nineteen', date_of_birth=date(2005, 6, 15), gender='M')
+        make_patient('Still', 'Eighteen', date_of_birth=date(2005, 6, 16), gender='F')
+        make_patient('Middle', 'Aged', date_of_birth=date(1974, 1, 1), gender='F')
+        make_patient('Very', 'Old', date_of_birth=date(1930, 1, 1), gender='O')
+        make_patient('Also', 'Old', date_of_birth=date(1943, 6, 15), gender='F')
+
+    def test_age_bands_follow_birthdays(self):
+        self.assertEqual(age_distribution(today=self.TODAY), {
+            '0-18': 1, '19-40': 1, '41-60': 1, '61-80': 0, '81+': 2,
+        })
+
+    def test_rollup_is_one_grouped_query(self):
+        with self.assertNumQueries(1):
+            rows = demographics_rollup(period='month', today=self.TODAY)
+
+        self.assertEqual(sum(row['count'] for row in rows), 5)
+        self.assertEqual({row['period'] for row in rows}, {
+            timezone.localtime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        })
+        self.assertEqual(totals_by(rows, 'gender'), {'F': 3, 'M': 1, 'O': 1})
+        self.assertEqual(totals_by(rows, 'age_band'), {'0-18': 1, '19-40': 1, '41-60': 1, '81+': 2})
+
+    def test_api_requires_staff_and_returns_rows(self):
+        url = reverse('demographics')
+        patient_user = User.objects.create_user('family', password='pw', role=User.Role.PATIENT)
+        self.client.force_login(patient_user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(User.objects.create_user('tech', password='pw', role=User.Role.TECHNICIAN))
+        response = self.client.get(url, {'period': 'all'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(row['count'] for row in response.json()['rows']), 5)
+        self.assertEqual(self.client.get(url, {'period': 'decade'}).status_code, 400)
+
+
+class PatientsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    urlconf = 'patients.urls'
+    budgets = {
+        'list': 3,
+        'register_patient': 2,
+        'detail': 7,
+        'patient_access': 0,
+        'patient_dashboard': 2,
+        'dashboard': 2,
+        'patient_logout': 2,
+        'reset_access': 3,
+    }
 
-# Create your tests here.
+    def login_for(self, name):
+        if name != 'patient_dashboard':
+            return super().login_for(name)
+        # Patients sign in with an access code, which only marks the session
+        session = self.client.session
+        session['patient_access_verified'] = True
+        session['patient_id'] = self.url_kwargs['patient_id']
+        session['patient_access_time'] = timezone.now().isoformat()
+        session.save()
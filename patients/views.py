@@ -1,10 +1,19 @@
+import logging
+import os
+
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q
+from django.core.paginator import Paginator
 from django.utils import timezone
 from .models import Patient
 from .forms import PatientRegistrationForm, ResetAccessCodeForm
+from .search import search_patients
+from .chart import get_chart_snapshot
+from stroke_unit.pagination import paginate_by_cursor
+
+logger = logging.getLogger(__name__)
 
 def patient_access(request):
     """View for patients to access their records using an access code"""
@@ -157,39 +166,20 @@ def register_patient(request):
                 except Exception as e:
                     print(f"Error creating vital signs: {e}")
 
-            # Process CT scan upload
-            if 'ct_scan' in request.FILES:
-                try:
-                    from assessments.models import ImagingStudy
-                    ct_scan = ImagingStudy(
-                        patient=patient,
-                        study_type='CT',
-                        performed_by=request.user,
-                        findings='CT scan uploaded during registration',
-                        # Your model doesn't have an 'image' field, but 'image_url' field
-                        # Since this is a file upload, we'd need to save it somewhere and store the URL
-                        # This is where you'd implement file upload handling
-                    )
-                    ct_scan.save()
-                    # Handle the file upload
-                    # Example: save_file_and_update_url(request.FILES['ct_scan'], ct_scan)
-                except Exception as e:
-                    print(f"Error creating CT scan record: {e}")
-
-            # Process MRI scan upload
-            if 'mri_scan' in request.FILES:
-                try:
-                    from assessments.models import ImagingStudy
-                    mri_scan = ImagingStudy(
-                        patient=patient,
-                        study_type='MRI',
-                        performed_by=request.user,
-                        findings='MRI scan uploaded during registration',
-                        # Handle the file upload similarly to CT scan
-                    )
-                    mri_scan.save()
-                except Exception as e:
-                    print(f"Error creating MRI scan record: {e}")
+            # Process CT and MRI scan uploads; previews and thumbnails are
+            # made in the background (see assessments.imaging)
+            for field, study_type, label in (('ct_scan', 'CT', 'CT scan'), ('mri_scan', 'MRI', 'MRI scan')):
+                if field in request.FILES:
+                    from assessments.imaging import record_imaging_upload
+                    try:
+                        record_imaging_upload(
+                            patient, study_type, request.FILES[field], request.user,
+                            findings=f'{label} uploaded during registration',
+                        )
+                    except (OSError, SuspiciousFileOperation, ValidationError):
+                        from django.contrib import messages
+                        logger.exception("Could not attach %s for patient %s", label, patient.pk)
+                        messages.warning(request, f"{label} could not be attached; please upload it again.")
 
             # Process lab results upload
             if 'lab_results' in request.FILES:
@@ -203,8 +193,9 @@ def register_patient(request):
                         is_abnormal=False,
                         recorded_by=request.user
                     )
+                    upload = request.FILES['lab_results']
+                    lab_result.document.save(os.path.basename(upload.name), upload, save=False)
                     lab_result.save()
-                    # Handle file upload for lab results
                 except Exception as e:
                     print(f"Error creating lab result record: {e}")
             
@@ -239,36 +230,27 @@ def patient_list(request):
     action = request.GET.get('action', '')
     
     # Filter patients based on search query if provided
+    page_obj = None
     if search_query:
-        patients = Patient.objects.filter(
-            Q(first_name__icontains=search_query) | 
-            Q(last_name__icontains=search_query) |
-            Q(phone_number__icontains=search_query) |
-            Q(medical_history__icontains=search_query)
-        )
+        # Ranked full-text search, one page of results at a time
+        paginator = Paginator(search_patients(search_query), 25)
+        page_obj = paginator.get_page(request.GET.get('page'))
+        patients = page_obj.object_list
         
-        # Add a flash message for search results
-        patient_count = patients.count()
+        # Add a flash message for search results (count is shared with the paginator)
+        patient_count = paginator.count
         if patient_count == 0:
             messages.info(request, f"No patients found matching '{search_query}'")
         else:
             messages.info(request, f"Found {patient_count} patient(s) matching '{search_query}'")
     else:
-        # No search query, return all patients
-        patients = Patient.objects.all()
-    
-    # Order by registration date (newest first) or created_at if it exists
-    try:
-        patients = patients.order_by('-created_at')
-    except:
-        try:
-            patients = patients.order_by('-registration_date')
-        except:
-            pass  # No ordering if neither field exists
+        # No search query, page through all patients, newest registrations first
+        patients = paginate_by_cursor(request, Patient.objects.all(), ['registration_date'])
     
     # Render the list.html template (not patient_list.html)
     return render(request, 'patients/patient_list.html', {
         'patients': patients,
+        'page_obj': page_obj,
         'search_query': search_query,
         'action': action
     })
@@ -276,12 +258,6 @@ def patient_list(request):
 @login_required
 def patient_detail(request, patient_id):
     """View detailed patient information"""
-    from django.shortcuts import get_object_or_404
-    from .models import Patient
-    from assessments.models import VitalSigns, NIHSSAssessment, ImagingStudy, LabResult
-    
-    patient = get_object_or_404(Patient, id=patient_id)
-    
     # Check permissions
     has_permission = False
     if hasattr(request.user, 'role') and request.user.role == 'TECHNICIAN':
@@ -298,14 +274,17 @@ def patient_detail(request, patient_id):
         has_permission = True
     
     if not has_permission:
-        from django.contrib import messages
         messages.error(request, "You don't have permission to view this patient's details.")
         return redirect('home')
     
+    # Patient plus vitals, NIHSS, imaging and labs, served from the per-patient
+    # cache when the chart hasn't changed since it was last loaded
+    chart = get_chart_snapshot(patient_id)
+    patient = chart['patient']
+    
     # Calculate patient age
     patient_age = None
     if patient.date_of_birth:
-        from django.utils import timezone
         today = timezone.now().date()
         patient_age = today.year - patient.date_of_birth.year
         if today.month < patient.date_of_birth.month or (
@@ -313,45 +292,13 @@ def patient_detail(request, patient_id):
         ):
             patient_age -= 1
     
-    # Get the related data - note we're using the correct related_name from your models
-    try:
-        vital_signs = patient.vital_signs.all().order_by('-recorded_at')
-    except Exception as e:
-        print(f"Error fetching vital signs: {e}")
-        vital_signs = []
-
-    try:
-        nihss_assessments = patient.nihss_assessments.all().order_by('-assessed_at')
-    except Exception as e:
-        print(f"Error fetching NIHSS assessments: {e}")
-        nihss_assessments = []
-
-    try:
-        imaging_studies = patient.imaging_studies.all().order_by('-performed_at')
-    except Exception as e:
-        print(f"Error fetching imaging studies: {e}")
-        imaging_studies = []
-
-    try:
-        lab_results = patient.lab_results.all().order_by('-recorded_at')
-    except Exception as e:
-        print(f"Error fetching lab results: {e}")
-        lab_results = []
-
-    # Debug information
-    print(f"Patient: {patient.first_name} {patient.last_name}")
-    print(f"Vital Signs: {vital_signs.count()}")
-    print(f"NIHSS Assessments: {nihss_assessments.count()}")
-    print(f"Imaging Studies: {imaging_studies.count()}")
-    print(f"Lab Results: {lab_results.count()}")
-    
     return render(request, 'patients/patient_detail.html', {
         'patient': patient,
         'patient_age': patient_age,
-        'vital_signs': vital_signs,
-        'nihss_assessments': nihss_assessments,
-        'imaging_studies': imaging_studies,
-        'lab_results': lab_results,
+        'vital_signs': chart['vital_signs'],
+        'nihss_assessments': chart['nihss_assessments'],
+        'imaging_studies': chart['imaging_studies'],
+        'lab_results': chart['lab_results'],
     })
 
 # New views for patient portal functionality
@@ -0,0 +1,97 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger('stroke_unit.queries')
+
+# Statements of the same shape run this many times in one request look like N+1
+REPEAT_THRESHOLD = 5
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r'\bIN \((?:(?:%s|\?)(?:, )?)+\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Statement shape with literals and IN-list lengths removed"""
+    sql = _LITERAL.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """
+    Counts and times the queries run while ``record()`` is active
+
+    Works through database execute wrappers, so unlike
+    connection.queries it does not need DEBUG.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @contextmanager
+    def record(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        """Total time spent in the database, in seconds"""
+        return sum(seconds for _, seconds in self.queries)
+
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        """(fingerprint, times run) for statements run at least ``threshold`` times, most frequent first"""
+        counts = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return [(statement, times) for statement, times in counts.most_common() if times >= threshold]
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Logs each request's query count, database time and likely N+1 patterns
+
+    Off unless QUERY_INSTRUMENTATION is set. Adds X-Query-Count and a
+    Server-Timing 'db' entry to responses so they show in browser tools.
+    Queries run while a streaming response is consumed are not counted.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        view = match.view_name if match else request.path
+        milliseconds = recorder.duration * 1000
+        logger.info("%s %s: %d queries in %.1f ms", request.method, view, recorder.count, milliseconds)
+        for statement, times in recorder.repeated():
+            logger.warning("Possible N+1 in %s: %d x %s", view, times, statement)
+
+        response['X-Query-Count'] = str(recorder.count)
+        response['Server-Timing'] = f'db;dur={milliseconds:.1f}'
+        return response
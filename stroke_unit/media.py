@@ -0,0 +1,183 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from .storage import BLOB_PREFIX
+
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+# Compressed files are sent as they are stored, never with Content-Encoding,
+# which would have clients decompress them (as FileResponse does)
+ENCODED_CONTENT_TYPES = {
+    'br': 'application/x-brotli',
+    'bzip2': 'application/x-bzip',
+    'compress': 'application/x-compress',
+    'gzip': 'application/gzip',
+    'xz': 'application/x-xz',
+}
+
+# Blobs never change, so clients may keep them; other files are revalidated
+IMMUTABLE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'private, no-cache'
+
+
+class FileRange:
+    """
+    Read-only view of ``length`` bytes of an open file from its current position
+
+    Exposes fileno(), so a WSGI server's file wrapper can still send it with
+    sendfile(); the Content-Length set on the response bounds that send.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def _blob_digest(path):
+    """The content hash a media-store blob is named by, or None"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if path.startswith(f'{BLOB_PREFIX}/') and _DIGEST.match(stem):
+        return stem
+    return None
+
+
+def file_etag(path, stat):
+    """Strong ETag: the content hash for blobs, else modification time and size"""
+    return quote_etag(_blob_digest(path) or f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single byte range, None to send the whole file
+
+    Raises ValueError when the range cannot be satisfied. Multiple ranges
+    are answered with the whole file, which RFC 9110 allows.
+    """
+    match = _RANGE.match(header.replace(' ', ''))
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # The final ``last`` bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def serve_file(request, path, root=None):
+    """
+    Respond with a file under ``root`` (MEDIA_ROOT by default), 404 if missing
+
+    Handles ETag / Last-Modified conditional requests and a single byte
+    Range (If-Range honoured). The file is sent by FileResponse, so WSGI
+    servers that provide wsgi.file_wrapper use the OS's zero-copy
+    sendfile(). With MEDIA_OFFLOAD set to 'x-accel-redirect' or
+    'x-sendfile' only the headers are produced and the front-end server
+    sends the file, ranges included.
+    """
+    root = root or settings.MEDIA_ROOT
+    try:
+        full_path = safe_join(root, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, ValueError, OSError):
+        raise Http404("File not found.")
+    if not os.path.isfile(full_path):
+        raise Http404("File not found.")
+
+    etag = file_etag(path, stat)
+    last_modified = int(stat.st_mtime)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        not_modified['Cache-Control'] = _cache_control(path)
+        return not_modified
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = ENCODED_CONTENT_TYPES.get(encoding, content_type) or 'application/octet-stream'
+    offload = getattr(settings, 'MEDIA_OFFLOAD', None)
+    if offload:
+        response = HttpResponse(content_type=content_type)
+        if offload == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = quote(settings.MEDIA_OFFLOAD_PREFIX.rstrip('/') + '/' + path)
+        elif offload == 'x-sendfile':
+            response['X-Sendfile'] = full_path
+        else:
+            raise ImproperlyConfigured(f"MEDIA_OFFLOAD must be 'x-accel-redirect' or 'x-sendfile', not '{offload}'")
+        return _finish(response, stat, etag, last_modified, path)
+
+    size = stat.st_size
+    byte_range = None
+    header = request.headers.get('Range')
+    if header and request.method in ('GET', 'HEAD') and _if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return _finish(response, stat, etag, last_modified, path)
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(FileRange(file, end - start + 1), status=206,
+                                content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    return _finish(response, stat, etag, last_modified, path)
+
+
+def _if_range_matches(request, etag, last_modified):
+    """False when If-Range names another version, so the whole file is sent"""
+    validator = request.headers.get('If-Range')
+    if not validator:
+        return True
+    if validator.startswith(('"', 'W/')):
+        return validator == etag
+    since = parse_http_date_safe(validator)
+    return since is not None and since >= last_modified
+
+
+def _cache_control(path):
+    return IMMUTABLE_CACHE_CONTROL if _blob_digest(path) else REVALIDATE_CACHE_CONTROL
+
+
+def _finish(response, stat, etag, last_modified, path):
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = _cache_control(path)
+    return response
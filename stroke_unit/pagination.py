@@ -0,0 +1,131 @@
+import base64
+import json
+
+from django.db.models import Q
+
+
+class CursorPage:
+    """
+    One page of a keyset-paginated list
+
+    Iterates like a list of objects. ``next_query`` and ``previous_query``
+    are ready-made query strings (other GET parameters preserved) for the
+    neighbouring pages, or None at either end.
+    """
+
+    def __init__(self, object_list, next_query=None, previous_query=None):
+        self.object_list = object_list
+        self.next_query = next_query
+        self.previous_query = previous_query
+
+    @property
+    def has_next(self):
+        return self.next_query is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_query is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def encode_cursor(direction, values):
+    # Full-precision ISO timestamps: the cursor must compare equal to the stored value
+    values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+    payload = json.dumps([direction, values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, fields):
+    """Return (direction, values) for a cursor, or None if it is not valid for ``fields``"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, raw_values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if direction not in ('next', 'prev') or len(raw_values) != len(fields):
+            return None
+        values = [field.to_python(value) for field, value in zip(fields, raw_values)]
+    except (ValueError, TypeError, json.JSONDecodeError):
+        return None
+    # to_python passes None through, which cannot be compared against
+    if any(value is None for value in values):
+        return None
+    return direction, values
+
+
+def _seek_filter(names, values, older):
+    """
+    Rows strictly past ``values`` in descending (older) or ascending order
+
+    The leading key is bounded with <= / >= so the database can use a single
+    index range scan; the remaining keys break ties within that range.
+    """
+    lookup, bound = ('lt', 'lte') if older else ('gt', 'gte')
+    condition = Q()
+    for i in range(len(names)):
+        step = Q(**{f'{names[j]}': values[j] for j in range(i)})
+        step &= Q(**{f'{names[i]}__{lookup}': values[i]})
+        condition |= step
+    return Q(**{f'{names[0]}__{bound}': values[0]}) & condition
+
+
+def paginate_by_cursor(request, queryset, keys, per_page=25, param='cursor'):
+    """
+    Keyset-paginate ``queryset`` newest-first on ``keys`` plus the primary key
+
+    Parameters:
+    request: The current request; the cursor is read from request.GET[param]
+    queryset: Filtered queryset to page through
+    keys: Model field names ordered by descending priority, e.g. ['requested_at']
+    per_page: Rows per page
+    param: Query-string parameter that carries the cursor
+
+    Each page is one LIMIT query seeking past the (keys..., id) of the last
+    row shown, so deep pages cost the same as the first one.
+    """
+    model = queryset.model
+    names = list(keys) + [model._meta.pk.name]
+    fields = [model._meta.get_field(name) for name in names]
+
+    direction, values = 'next', None
+    decoded = decode_cursor(request.GET.get(param, ''), fields)
+    if decoded:
+        direction, values = decoded
+
+    older = direction == 'next'
+    ordering = [f'-{name}' if older else name for name in names]
+    queryset = queryset.order_by(*ordering)
+    if values is not None:
+        queryset = queryset.filter(_seek_filter(names, values, older))
+
+    rows = list(queryset[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not older:
+        rows.reverse()
+
+    def query_for(direction, row):
+        params = request.GET.copy()
+        params[param] = encode_cursor(direction, [getattr(row, name) for name in names])
+        return params.urlencode()
+
+    next_query = previous_query = None
+    if rows:
+        # Walking forward there is always a way back (unless this is the first
+        # page); walking backward there is always a way forward
+        if (older and has_more) or not older:
+            next_query = query_for('next', rows[-1])
+        if (not older and has_more) or (older and values is not None):
+            previous_query = query_for('prev', rows[0])
+
+    return CursorPage(rows, next_query, previous_query)
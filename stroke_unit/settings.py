@@ -58,6 +58,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'stroke_unit.instrumentation.QueryInstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -79,6 +80,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'consultations.context_processors.unread_notifications',
             ],
         },
     },
@@ -86,6 +88,12 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'stroke_unit.wsgi.application'
 
+# Pages open a live notification stream (consultations.views.notification_stream)
+# only when this is on. Each open tab holds its connection, which only an ASGI
+# server (serving stroke_unit.asgi.application) can afford; under WSGI the
+# stream answers 204 and browsers stop asking
+NOTIFICATION_STREAM = os.environ.get('NOTIFICATION_STREAM') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -97,6 +105,20 @@ DATABASES = {
     }
 }
 
+# Shared by every process on the host, web servers and `manage.py run_jobs`
+# alike, so invalidating a patient's chart or the threshold table in one
+# reaches them all. Serving from several hosts needs a networked backend
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Runs the tests against a cache directory of their own
+TEST_RUNNER = 'stroke_unit.testing.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -147,6 +169,23 @@ STATIC_ROOT = os.path.join(BASE_DIR,'staticfiles', 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Media is served to signed-in staff by stroke_unit.views.media. Behind nginx
+# set MEDIA_OFFLOAD=x-accel-redirect and map MEDIA_OFFLOAD_PREFIX to an
+# internal location aliasing MEDIA_ROOT; under Apache use x-sendfile
+MEDIA_OFFLOAD = os.environ.get('MEDIA_OFFLOAD') or None
+MEDIA_OFFLOAD_PREFIX = '/protected-media/'
+
+# Most jobs of each queue run at once across all `manage.py run_jobs`
+# workers (consultations/jobs.py). Vital signs are checked one batch at a
+# time so trend windows see readings in order
+JOB_CONCURRENCY = {
+    'vitals': 1,
+    'imaging': 2,
+}
+
+# Local disk holding resumable imaging uploads until they are finalized
+RESUMABLE_UPLOAD_ROOT = os.path.join(BASE_DIR, 'upload_sessions')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -160,3 +199,18 @@ CRISPY_TEMPLATE_PACK = 'bootstrap5'
 LOGIN_REDIRECT_URL = 'home'
 LOGIN_URL = 'login'
 LOGOUT_REDIRECT_URL = 'login'
+
+# Per-request query counts and N+1 warnings (stroke_unit/instrumentation.py)
+QUERY_INSTRUMENTATION = os.environ.get('QUERY_INSTRUMENTATION') == '1'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'stroke_unit.queries': {'handlers': ['console'], 'level': 'INFO'},
+        'consultations.jobs': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
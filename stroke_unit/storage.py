@@ -0,0 +1,83 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+
+BLOB_PREFIX = 'blobs'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage that keeps each distinct file once, named by its SHA-256
+
+    save() hashes the content while copying it chunk by chunk to a temporary
+    file, then renames that to blobs/<aa>/<bb>/<digest><ext>. Content already
+    stored returns the existing name and the copy is dropped, so any number
+    of rows can point at one blob. Only the extension of the requested name
+    is kept. Files saved under other names before this storage was used (on
+    the same location) are still served.
+
+    Blobs are shared, so never delete() one that a row may still reference;
+    assessments.blobs counts references and removes unreferenced blobs.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Names come from the content; an existing name is the same file
+        return name
+
+    def blob_name(self, digest, extension=''):
+        return f'{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        staging = self.path(f'{BLOB_PREFIX}/tmp')
+        os.makedirs(staging, exist_ok=True)
+
+        digest = hashlib.sha256()
+        if hasattr(content, 'temporary_file_path'):
+            # Spooled to disk already: hash it in place and move it, no copy
+            source = content.temporary_file_path()
+            with open(source, 'rb') as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            owned = False
+        else:
+            fd, source = tempfile.mkstemp(dir=staging)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in content.chunks():
+                        digest.update(chunk)
+                        f.write(chunk)
+            except BaseException:
+                os.remove(source)
+                raise
+            owned = True
+
+        name = self.blob_name(digest.hexdigest(), extension)
+        path = self.path(name)
+        if os.path.exists(path):
+            if owned:
+                os.remove(source)
+            return name
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if owned:
+            os.replace(source, path)
+        else:
+            file_move_safe(source, path, allow_overwrite=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+        return name
+
+
+# Follows MEDIA_ROOT and MEDIA_URL, including when tests override them
+media_storage = ContentAddressedStorage()
+
+
+def get_media_storage():
+    """Storage for uploaded clinical files (a callable, so migrations don't freeze it)"""
+    return media_storage
@@ -0,0 +1,189 @@
+import json
+import tempfile
+from datetime import date
+from decimal import Decimal
+from importlib import import_module
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import PositiveSmallIntegerField, QuerySet
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .instrumentation import REPEAT_THRESHOLD, QueryRecorder
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Test runner whose cache is a fresh temporary directory
+
+    The cache is shared between processes on disk, so without this a test
+    run would read the site's cached charts and clear them as it went.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_directory = tempfile.TemporaryDirectory()
+        self._cache_settings = override_settings(CACHES={
+            alias: {**options, 'LOCATION': self._cache_directory.name}
+            for alias, options in settings.CACHES.items()
+        })
+        self._cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_settings.disable()
+        self._cache_directory.cleanup()
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetMixin:
+    """
+    Requests every URL pattern of an app and checks its query count
+
+    Mixed into a TestCase; subclasses set ``urlconf`` to the app's urls
+    module and ``budgets`` to {url name: most queries allowed}. A pattern
+    without a budget fails, so new views have to declare one. Lists hold REPEAT_THRESHOLD rows, so an
+    N+1 shows up as a budget overrun with the repeated statement reported.
+    Views are requested with GET unless their budget names another method.
+
+    Parameters (class attributes):
+    urlconf: Dotted path of the urls module to check
+    budgets: {url name: query budget, or (method, body, query budget)}; a
+             dict body is sent as JSON, a callable one is called with url_kwargs
+    skip: URL names not to request, e.g. streaming views or writes that
+          need earlier requests, with their budgets checked in their own tests
+    roles: {url name: role of the user to log in as} where not default_role
+    """
+
+    urlconf = None
+    budgets = {}
+    skip = set()
+    roles = {}
+    default_role = 'TECHNICIAN'
+
+    @classmethod
+    def setUpTestData(cls):
+        from accounts.models import User
+        from assessments.models import NIHSSAssessment, VitalSigns
+        from consultations.models import Consultation, Notification, TPARequest
+        from patients.models import Patient
+
+        cls.users = {
+            role: User.objects.create_user(f'budget_{role.lower()}', password='pw', role=role)
+            for role in User.Role.values
+        }
+        technician = cls.users['TECHNICIAN']
+        neurologist = cls.users['NEUROLOGIST']
+        items = {
+            field.name: 1 for field in NIHSSAssessment._meta.fields
+            if isinstance(field, PositiveSmallIntegerField) and field.choices
+        }
+
+        for i in range(REPEAT_THRESHOLD):
+            patient = Patient.objects.create(
+                first_name=f'Budget{i}', last_name='Patient', date_of_birth=date(1950 + i, 1, 1),
+                gender='F', registered_by=technician,
+            )
+            VitalSigns.objects.create(
+                patient=patient, recorded_by=technician, blood_pressure_systolic=130,
+                blood_pressure_diastolic=80, heart_rate=75, respiratory_rate=16,
+                temperature=Decimal('37.0'), oxygen_saturation=98,
+            )
+            assessment = NIHSSAssessment.objects.create(patient=patient, assessed_by=technician, **items)
+            consultation = Consultation.objects.create(
+                patient=patient, requested_by=technician, neurologist=neurologist,
+                status='IN_PROGRESS', chief_complaint='Left-sided weakness',
+            )
+            tpa_request = TPARequest.objects.create(
+                consultation=consultation, requested_by=technician, justification='Within window',
+            )
+            for user in (technician, neurologist):
+                notification = Notification.objects.create(
+                    user=user, notification_type='CONSULTATION', title='Update',
+                    message='Consultation updated', related_consultation=consultation,
+                )
+
+        # The last of each, for URLs that take an id
+        cls.url_kwargs = {
+            'patient_id': patient.id,
+            'assessment_id': assessment.id,
+            'consultation_id': consultation.id,
+            'tpa_request_id': tpa_request.id,
+            'notification_id': notification.id,
+        }
+
+    def setUp(self):
+        # Measure with cold caches, the worst case
+        cache.clear()
+
+    def login_for(self, name):
+        self.client.force_login(self.users[self.roles.get(name, self.default_role)])
+
+    def test_query_budgets(self):
+        urls = import_module(self.urlconf)
+        checked = set()
+        for pattern in urls.urlpatterns:
+            name = pattern.name
+            if name in self.skip or name in checked:
+                continue
+            checked.add(name)
+
+            with self.subTest(url=name):
+                self.assertIn(name, self.budgets, f"No query budget for '{urls.app_name}:{name}'")
+                kwargs = {key: self.url_kwargs[key] for key in pattern.pattern.converters}
+                url = reverse(f'{urls.app_name}:{name}', kwargs=kwargs)
+
+                method, body, budget = 'GET', None, self.budgets[name]
+                if isinstance(budget, tuple):
+                    method, body, budget = budget
+                if callable(body):
+                    body = body(self.url_kwargs)
+                content_type = 'application/octet-stream'
+                if isinstance(body, dict):
+                    body, content_type = json.dumps(body), 'application/json'
+
+                # A fresh client, so no session state carries over between URLs
+                self.client = self.client_class()
+                self.login_for(name)
+                recorder = QueryRecorder()
+                with recorder.record():
+                    response = self.client.generic(method, url, body or '', content_type=content_type)
+
+                # A 405 would mean the budget only covers the method check
+                self.assertNotEqual(response.status_code, 405, f"{url} does not accept {method}")
+                self.assertLess(response.status_code, 500)
+                self.assertLessEqual(
+                    recorder.count, budget,
+                    f"{url} ran {recorder.count} queries; repeated: {recorder.repeated(threshold=2)}",
+                )
+
+
+def query_plan(sql, params=None):
+    """The detail column of SQLite's EXPLAIN QUERY PLAN for a statement"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class QueryPlanMixin:
+    """
+    assertUsesIndexes() fails when a query reads a whole table or index
+    (a SCAN step) or sorts its rows in a temporary B-tree.
+    """
+
+    def assertUsesIndexes(self, run):
+        """Check every query made by ``run()``, or by evaluating a queryset"""
+        if connection.vendor != 'sqlite':
+            self.skipTest("Query plans are checked on SQLite only")
+        if isinstance(run, QuerySet):
+            queryset, run = run, lambda: list(queryset)
+
+        with CaptureQueriesContext(connection) as context:
+            run()
+        self.assertTrue(context.captured_queries, "No queries were run")
+        for query in context.captured_queries:
+            plan = query_plan(query['sql'])
+            slow = [step for step in plan if step.startswith('SCAN') or 'TEMP B-TREE' in step]
+            self.assertFalse(slow, f"{query['sql']}\n{plan}")
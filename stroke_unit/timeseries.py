@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+
+from django.db.models import Avg, Count
+from django.db.models.functions import TruncDay, TruncHour, TruncWeek
+from django.utils import timezone
+
+
+# Timestamp column used for bucketing each covered model
+TIMESTAMP_FIELDS = {
+    'VitalSigns': 'recorded_at',
+    'NIHSSAssessment': 'assessed_at',
+    'Consultation': 'requested_at',
+    'TPARequest': 'requested_at',
+    'Patient': 'registration_date',
+}
+
+INTERVALS = {
+    'hour': (TruncHour, timedelta(hours=1)),
+    'day': (TruncDay, timedelta(days=1)),
+    'week': (TruncWeek, timedelta(weeks=1)),
+}
+
+
+def bucket_start(moment, interval):
+    """Return the naive local start of the bucket containing ``moment``"""
+    local = timezone.localtime(moment).replace(tzinfo=None) if timezone.is_aware(moment) else moment
+    if interval == 'hour':
+        return local.replace(minute=0, second=0, microsecond=0)
+    day = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == 'week':
+        # Weeks start on Monday, matching TruncWeek
+        day -= timedelta(days=day.weekday())
+    return day
+
+
+def time_series(source, start, end=None, interval='day', aggregate='count', value_field=None, fill=0):
+    """
+    Count or average rows per hour, day or week in one truncate-and-group query
+
+    Parameters:
+    source: A covered model class, or a queryset over one (to pre-filter rows)
+    start, end: Datetimes (or dates) bounding the series; end defaults to now
+    interval: 'hour', 'day' or 'week', in the current time zone
+    aggregate: 'count' or 'avg'
+    value_field: Field to average when aggregate is 'avg'
+    fill: Value used for buckets with no rows
+
+    Returns a list of {'bucket': <aware datetime>, 'value': <number>} dicts,
+    one per bucket from start to end inclusive, in chronological order.
+    """
+    if interval not in INTERVALS:
+        raise ValueError(f"Unknown interval '{interval}'")
+    if aggregate == 'count':
+        metric = Count('pk')
+    elif aggregate == 'avg':
+        if not value_field:
+            raise ValueError("value_field is required for averages")
+        metric = Avg(value_field)
+    else:
+        raise ValueError(f"Unknown aggregate '{aggregate}'")
+
+    queryset = source.objects.all() if isinstance(source, type) else source
+    field = TIMESTAMP_FIELDS[queryset.model.__name__]
+
+    tz = timezone.get_current_timezone()
+    if end is None:
+        end = timezone.now()
+    first = bucket_start(_as_datetime(start), interval)
+    last = bucket_start(_as_datetime(end), interval)
+    trunc, step = INTERVALS[interval]
+
+    rows = queryset.filter(**{
+        f'{field}__gte': timezone.make_aware(first, tz),
+        f'{field}__lt': timezone.make_aware(last + step, tz),
+    }).annotate(
+        bucket=trunc(field, tzinfo=tz)
+    ).order_by().values('bucket').annotate(value=metric).values_list('bucket', 'value')
+
+    values = {
+        timezone.localtime(bucket, tz).replace(tzinfo=None): value
+        for bucket, value in rows
+    }
+
+    series = []
+    current = first
+    while current <= last:
+        value = values.get(current)
+        series.append({
+            'bucket': timezone.make_aware(current, tz),
+            'value': fill if value is None else value,
+        })
+        current += step
+    return series
+
+
+def _as_datetime(value):
+    """Promote a date to local midnight so it can bound a series"""
+    if isinstance(value, datetime):
+        return value
+    return datetime(value.year, value.month, value.day)
+
+
+def lttb(points, threshold):
+    """
+    Downsample (x, y) points to at most ``threshold`` with Largest-Triangle-Three-Buckets
+
+    Points must be in x order. The first and last points are always kept;
+    each bucket in between keeps the point forming the largest triangle with
+    the previous kept point and the average of the next bucket, so peaks
+    and troughs survive where plain averaging would flatten them.
+    """
+    if threshold >= len(points):
+        return list(points)
+    if threshold < 3:
+        raise ValueError("threshold must be at least 3")
+
+    sampled = [points[0]]
+    every = (len(points) - 2) / (threshold - 2)
+    previous = points[0]
+    for i in range(threshold - 2):
+        # Average of the next bucket (the last point for the final bucket)
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, len(points))
+        following = points[next_start:next_end] or points[-1:]
+        avg_x = sum(x for x, _ in following) / len(following)
+        avg_y = sum(y for _, y in following) / len(following)
+
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        best, best_area = None, -1
+        for point in points[start:end]:
+            x, y = point
+            area = abs((previous[0] - avg_x) * (y - previous[1]) - (previous[0] - x) * (avg_y - previous[1]))
+            if area > best_area:
+                best, best_area = point, area
+        sampled.append(best)
+        previous = best
+    sampled.append(points[-1])
+    return sampled
@@ -1,7 +1,6 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 from . import views
 from accounts.views import direct_login
@@ -11,6 +10,7 @@ urlpatterns = [
     
     # Home and role-based redirects
     path('', views.home, name='home'),
+    path('statistics/demographics/', views.demographics, name='demographics'),
     
     # App URLs
     path('accounts/', include('accounts.urls')),
@@ -23,6 +23,7 @@ urlpatterns = [
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
 ]
 
-# Serve media files in development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# Uploaded media, for signed-in staff (also in production; see MEDIA_OFFLOAD)
+urlpatterns += [
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", views.media, name='media'),
+]
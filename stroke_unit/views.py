@@ -1,6 +1,7 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.views.decorators.http import require_http_methods
 
 def home(request):
     """Home view with role-based redirects for authenticated users"""
@@ -25,96 +26,38 @@ def home(request):
 @login_required
 def dashboard(request):
     """Dashboard with patient statistics"""
-    from django.db.models import Count, Avg
-    from .models import Patient
-    from assessments.models import NIHSSAssessment
+    from patients.models import Patient
+    from patients.demographics import AGE_BANDS, demographics_rollup, totals_by
+    from consultations.stats import get_unit_statistics
     
-    # Get counts
-    total_patients = Patient.objects.count()
+    # Running totals, maintained incrementally in one row
+    stats = get_unit_statistics()
+    total_patients = stats.total_patients
+    patients_today = stats.patients_today
     
-    # Get patients registered today
-    from django.utils import timezone
-    from datetime import timedelta
-    today = timezone.now().date()
-    patients_today = Patient.objects.filter(registration_date__date=today).count()
+    # Age band x gender counts in one grouped query (ages change daily, so not stored)
+    demographics = demographics_rollup(period=None)
     
     # Get gender distribution
-    gender_distribution = Patient.objects.values('gender').annotate(count=Count('gender'))
+    gender_names = dict(Patient.GENDER_CHOICES)
     gender_labels = []
     gender_data = []
     
-    for item in gender_distribution:
-        if item['gender'] == 'M':
-            gender_labels.append('Male')
-        elif item['gender'] == 'F':
-            gender_labels.append('Female')
-        else:
-            gender_labels.append('Other')
-        gender_data.append(item['count'])
+    for gender, count in totals_by(demographics, 'gender').items():
+        gender_labels.append(gender_names.get(gender, 'Other'))
+        gender_data.append(count)
     
     # Get age distribution
-    age_ranges = {
-        '0-18': 0,
-        '19-40': 0,
-        '41-60': 0,
-        '61-80': 0,
-        '81+': 0
-    }
-    
-    for patient in Patient.objects.all():
-        if patient.date_of_birth:
-            today = timezone.now().date()
-            age = today.year - patient.date_of_birth.year
-            if today.month < patient.date_of_birth.month or (today.month == patient.date_of_birth.month and today.day < patient.date_of_birth.day):
-                age -= 1
-                
-            if age <= 18:
-                age_ranges['0-18'] += 1
-            elif age <= 40:
-                age_ranges['19-40'] += 1
-            elif age <= 60:
-                age_ranges['41-60'] += 1
-            elif age <= 80:
-                age_ranges['61-80'] += 1
-            else:
-                age_ranges['81+'] += 1
+    age_counts = totals_by(demographics, 'age_band')
+    age_ranges = {label: age_counts.get(label, 0) for label, _, _ in AGE_BANDS}
     
-    # Get NIHSS score distribution
-    try:
-        from assessments.models import NIHSSAssessment
-        
-        # Average NIHSS score
-        avg_nihss = NIHSSAssessment.objects.all()
-        if avg_nihss.exists():
-            # Calculate average score manually
-            total_score = 0
-            count = 0
-            for assessment in avg_nihss:
-                total_score += assessment.get_total_score()
-                count += 1
-            
-            avg_nihss_score = round(total_score / count, 1) if count > 0 else 0
-        else:
-            avg_nihss_score = 0
-            
-        # NIHSS severity distribution
-        severity_distribution = {
-            'Minor': 0,
-            'Moderate': 0,
-            'Severe': 0
-        }
-        
-        for assessment in NIHSSAssessment.objects.all():
-            score = assessment.get_total_score()
-            if score <= 4:
-                severity_distribution['Minor'] += 1
-            elif score <= 15:
-                severity_distribution['Moderate'] += 1
-            else:
-                severity_distribution['Severe'] += 1
-    except:
-        avg_nihss_score = 0
-        severity_distribution = {'Minor': 0, 'Moderate': 0, 'Severe': 0}
+    # NIHSS average and severity distribution from the statistics row
+    avg_nihss_score = stats.average_nihss_score
+    severity_distribution = {
+        'Minor': stats.nihss_minor,
+        'Moderate': stats.nihss_moderate,
+        'Severe': stats.nihss_severe,
+    }
     
     return render(request, 'patients/dashboard.html', {
         'total_patients': total_patients,
@@ -124,4 +67,61 @@ def dashboard(request):
         'age_ranges': age_ranges,
         'avg_nihss_score': avg_nihss_score,
         'severity_distribution': severity_distribution
-    })
\ No newline at end of file
+    })
+
+@login_required
+def demographics(request):
+    """
+    Patient counts by age band, gender and registration period as JSON
+
+    Accepts ?period=day|week|month|year|all (default month) and optional
+    ?from=/?to= registration dates (YYYY-MM-DD, inclusive).
+    """
+    from datetime import timedelta
+    from django.http import JsonResponse
+    from django.utils.dateparse import parse_date
+    from patients.demographics import AGE_BANDS, PERIODS, demographics_rollup
+    from patients.models import Patient
+    
+    if getattr(request.user, 'role', None) not in ('TECHNICIAN', 'NEUROLOGIST'):
+        return JsonResponse({'error': "Only clinical staff can view statistics."}, status=403)
+    
+    period = request.GET.get('period', 'month')
+    if period == 'all':
+        period = None
+    elif period not in PERIODS:
+        return JsonResponse({'error': f"Unknown period '{period}'."}, status=400)
+    
+    patients = Patient.objects.all()
+    try:
+        start = parse_date(request.GET.get('from', '')) if request.GET.get('from') else None
+        end = parse_date(request.GET.get('to', '')) if request.GET.get('to') else None
+    except ValueError:
+        start = end = None
+    if start:
+        patients = patients.filter(registration_date__date__gte=start)
+    if end:
+        patients = patients.filter(registration_date__date__lt=end + timedelta(days=1))
+    
+    rows = demographics_rollup(patients, period=period)
+    for row in rows:
+        if row['period'] is not None:
+            row['period'] = row['period'].isoformat()
+    
+    return JsonResponse({
+        'age_bands': [label for label, _, _ in AGE_BANDS],
+        'genders': dict(Patient.GENDER_CHOICES),
+        'rows': rows,
+    })
+
+
+@login_required
+@require_http_methods(['GET', 'HEAD'])
+def media(request, path):
+    """Serve an uploaded file (imaging, previews, lab documents) to clinical staff"""
+    from django.http import HttpResponseForbidden
+    from .media import serve_file
+
+    if getattr(request.user, 'role', None) not in ('TECHNICIAN', 'NEUROLOGIST'):
+        return HttpResponseForbidden("Only clinical staff can view patient files.")
+    return serve_file(request, path)